@@ -1,7 +1,11 @@
+from typing import Any
+
 from fastapi import APIRouter
 
 from app.auth.google_auth import google_auth_router
 from app.auth.views import auth_router, users_router
+from app.config import settings
+from app.database.core import pool_stats
 from app.referral.views import router as referrals_router
 
 api_router = APIRouter()
@@ -15,3 +19,11 @@ api_router.include_router(google_auth_router, prefix="/google", tags=["google au
 @api_router.get("/healthcheck", include_in_schema=False)
 def healthcheck() -> dict[str, str]:
     return {"status": "ok"}
+
+
+# Pool internals are exposed with the metrics, off the public network.
+if settings.METRICS_ENABLED:
+
+    @api_router.get("/healthcheck/pool", include_in_schema=False)
+    def pool_healthcheck() -> dict[str, Any]:
+        return pool_stats()
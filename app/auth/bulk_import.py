@@ -0,0 +1,291 @@
+import csv
+import json
+from collections.abc import AsyncIterator, Iterator
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import ImportConflict, ImportReport
+
+STAGING_TABLE = "users_import"
+
+# Fields read from every input row, in staging table column order.
+FIELDS = (
+    "legacy_id",
+    "email",
+    "password",
+    "referral_code",
+    "referral_code_exp",
+    "referer_legacy_id",
+)
+
+
+class ImportFormatError(ValueError):
+    """Raised when an input row can't be parsed."""
+
+
+def _read_rows(path: Path, file_format: str) -> Iterator[dict[str, Any]]:
+    with path.open(newline="", encoding="utf-8") as file:
+        if file_format == "csv":
+            yield from csv.DictReader(file)
+        else:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _parse_datetime(value: str | None, line: int) -> datetime | None:
+    if not value:
+        return None
+
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ImportFormatError(f"Line {line}: invalid referral_code_exp {value!r}.")
+
+
+def _blank_to_none(value: Any) -> Any:
+    return None if value == "" else value
+
+
+async def _records(path: Path, file_format: str) -> AsyncIterator[tuple[Any, ...]]:
+    for line, row in enumerate(_read_rows(path, file_format), start=1):
+        # Empty CSV cells mean no value, but a legacy id of 0 is an id.
+        values = {field: _blank_to_none(row.get(field)) for field in FIELDS}
+        values["referral_code_exp"] = _parse_datetime(values["referral_code_exp"], line)
+        for field in ("legacy_id", "referer_legacy_id"):
+            if values[field] is not None:
+                values[field] = str(values[field])
+
+        yield (line, *values.values())
+
+
+# Each statement below works on the whole staging table at once.
+MARK_CONFLICTS = [
+    """
+    UPDATE users_import SET conflict = 'missing email'
+    WHERE email IS NULL
+    """,
+    """
+    UPDATE users_import SET conflict = 'missing legacy_id'
+    WHERE conflict IS NULL AND legacy_id IS NULL
+    """,
+    r"""
+    UPDATE users_import SET conflict = 'invalid password hash'
+    WHERE conflict IS NULL AND password IS NOT NULL
+        AND password !~ '^\$2[aby]?\$\d\d\$.{53}$'
+    """,
+    """
+    UPDATE users_import s SET conflict = 'duplicate legacy_id in file'
+    FROM users_import first
+    WHERE s.conflict IS NULL AND first.legacy_id = s.legacy_id
+        AND first.line < s.line
+    """,
+    """
+    UPDATE users_import s SET conflict = 'duplicate email in file'
+    FROM users_import first
+    WHERE s.conflict IS NULL AND first.email = s.email AND first.line < s.line
+    """,
+    """
+    UPDATE users_import s SET conflict = 'email already exists'
+    FROM users
+    WHERE s.conflict IS NULL AND users.email = s.email
+    """,
+    """
+    UPDATE users_import s
+    SET referral_code = NULL, referral_code_exp = NULL,
+        note = 'referral code dropped: invalid or already in use'
+    WHERE s.conflict IS NULL AND s.referral_code IS NOT NULL AND (
+        length(s.referral_code) > 32
+        OR EXISTS (SELECT 1 FROM users WHERE users.referral_code = s.referral_code)
+        OR EXISTS (
+            SELECT 1 FROM users_import first
+            WHERE first.referral_code = s.referral_code
+                AND first.conflict IS NULL AND first.line < s.line
+        )
+    )
+    """,
+]
+
+INSERT_USERS = """
+WITH inserted AS (
+    INSERT INTO users (email, password, referral_code, referral_code_exp)
+    SELECT email, password, referral_code, referral_code_exp
+    FROM users_import WHERE conflict IS NULL
+    ORDER BY line
+    ON CONFLICT DO NOTHING
+    RETURNING id, email
+)
+UPDATE users_import s SET user_id = inserted.id
+FROM inserted
+WHERE inserted.email = s.email AND s.conflict IS NULL
+"""
+
+# Rows that lost a race with a concurrent signup.
+MARK_RACED = """
+UPDATE users_import SET conflict = 'conflicts with an existing user'
+WHERE conflict IS NULL AND user_id IS NULL
+"""
+
+LINK_REFERERS = """
+UPDATE users SET referer_id = referer.user_id
+FROM users_import s
+JOIN users_import referer ON referer.legacy_id = s.referer_legacy_id
+WHERE users.id = s.user_id AND referer.user_id IS NOT NULL
+"""
+
+MARK_UNKNOWN_REFERERS = """
+UPDATE users_import s SET note = 'unknown referer'
+WHERE s.user_id IS NOT NULL AND s.referer_legacy_id IS NOT NULL
+    AND NOT EXISTS (
+        SELECT 1 FROM users_import referer
+        WHERE referer.legacy_id = s.referer_legacy_id
+            AND referer.user_id IS NOT NULL
+    )
+"""
+
+# Referers are resolved within the file only, so every chain of imported
+# users starts at an imported root. Users that can't be reached from one
+# are part of (or below) a referer cycle.
+FIND_CYCLE = """
+WITH RECURSIVE reachable (id) AS (
+    SELECT users.id
+    FROM users JOIN users_import s ON s.user_id = users.id
+    WHERE users.referer_id IS NULL
+    UNION ALL
+    SELECT users.id FROM users JOIN reachable ON users.referer_id = reachable.id
+)
+SELECT s.legacy_id FROM users_import s
+WHERE s.user_id IS NOT NULL
+    AND NOT EXISTS (SELECT 1 FROM reachable WHERE reachable.id = s.user_id)
+LIMIT 1
+"""
+
+INSERT_CLOSURE = """
+WITH RECURSIVE tree (ancestor_id, descendant_id, depth) AS (
+    SELECT users.referer_id, users.id, 1
+    FROM users JOIN users_import s ON s.user_id = users.id
+    WHERE users.referer_id IS NOT NULL
+    UNION ALL
+    SELECT users.referer_id, tree.descendant_id, tree.depth + 1
+    FROM tree JOIN users ON users.id = tree.ancestor_id
+    WHERE users.referer_id IS NOT NULL
+)
+INSERT INTO referral_closure (ancestor_id, descendant_id, depth)
+SELECT ancestor_id, descendant_id, depth FROM tree
+"""
+
+SUMMARY = """
+SELECT
+    count(*),
+    count(user_id),
+    count(conflict),
+    count(*) FILTER (WHERE note LIKE 'referral code dropped%'),
+    (SELECT count(*) FROM users JOIN users_import s ON s.user_id = users.id
+        WHERE users.referer_id IS NOT NULL)
+FROM users_import
+"""
+
+CONFLICTS = """
+SELECT line, legacy_id, email, coalesce(conflict, note) AS reason
+FROM users_import
+WHERE conflict IS NOT NULL OR note IS NOT NULL
+ORDER BY line
+"""
+
+
+async def import_users(
+    *,
+    db_session: AsyncSession,
+    path: Path,
+    file_format: str,
+    max_conflicts: int = 100,
+    conflicts_out: Path | None = None,
+) -> ImportReport:
+    """
+    Imports users with existing bcrypt hashes from a CSV or NDJSON file.
+
+    Rows are streamed into a temporary staging table with a binary COPY, so
+    memory use doesn't depend on the file size. Validation, conflict
+    detection, the insert and referer resolution are then done with one
+    set-based statement each. Referers are given by `referer_legacy_id`,
+    which must match the `legacy_id` of another row in the file.
+
+    Rows that can't be imported are skipped and reported, the first
+    `max_conflicts` in the returned report and all of them in
+    `conflicts_out` as CSV. Everything runs in one transaction.
+    """
+    connection = await db_session.connection()
+    raw_connection = await connection.get_raw_connection()
+    driver_connection = raw_connection.driver_connection
+
+    await db_session.execute(
+        text(
+            f"""
+            CREATE TEMPORARY TABLE {STAGING_TABLE} (
+                line integer PRIMARY KEY,
+                legacy_id text,
+                email text,
+                password text,
+                referral_code text,
+                referral_code_exp timestamptz,
+                referer_legacy_id text,
+                user_id integer,
+                conflict text,
+                note text
+            ) ON COMMIT DROP
+            """
+        )
+    )
+    await driver_connection.copy_records_to_table(  # type: ignore[union-attr]
+        STAGING_TABLE,
+        records=_records(path, file_format),
+        columns=["line", *FIELDS],
+    )
+    await db_session.execute(
+        text(f"CREATE INDEX ON {STAGING_TABLE} (legacy_id) INCLUDE (user_id)")
+    )
+    await db_session.execute(text(f"CREATE INDEX ON {STAGING_TABLE} (email)"))
+    await db_session.execute(text(f"ANALYZE {STAGING_TABLE}"))
+
+    for statement in MARK_CONFLICTS:
+        await db_session.execute(text(statement))
+
+    await db_session.execute(text(INSERT_USERS))
+    await db_session.execute(text(MARK_RACED))
+    await db_session.execute(text(LINK_REFERERS))
+    await db_session.execute(text(MARK_UNKNOWN_REFERERS))
+
+    result = await db_session.execute(text(FIND_CYCLE))
+    legacy_id = result.scalar()
+    if legacy_id is not None:
+        raise ImportFormatError(f"Referer cycle involving legacy_id {legacy_id!r}.")
+
+    await db_session.execute(text(INSERT_CLOSURE))
+
+    result = await db_session.execute(text(SUMMARY))
+    rows, inserted, skipped, codes_dropped, referers_linked = result.one()
+
+    result = await db_session.execute(
+        text(f"{CONFLICTS} LIMIT :limit"), {"limit": max_conflicts}
+    )
+    conflicts = [ImportConflict(**row) for row in result.mappings()]
+
+    if conflicts_out is not None:
+        await driver_connection.copy_from_query(  # type: ignore[union-attr]
+            CONFLICTS, output=str(conflicts_out), format="csv", header=True
+        )
+
+    await db_session.commit()
+
+    return ImportReport(
+        rows=rows,
+        inserted=inserted,
+        skipped=skipped,
+        referers_linked=referers_linked,
+        referral_codes_dropped=codes_dropped,
+        conflicts=conflicts,
+    )
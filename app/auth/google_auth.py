@@ -1,12 +1,13 @@
-import httpx
 from fastapi import APIRouter, status
 from starlette.responses import RedirectResponse
 
 from app.config import settings
 from app.database.core import SessionDep
+from app.http_clients import GOOGLE, get_http_client
 from app.jwt.models import TokenResponse
 from app.security import create_access_token
 
+from .google_tokens import verify_id_token
 from .models import UserCreateGoogle
 from .service import create_user_through_google, get_by_email
 
@@ -19,7 +20,7 @@ google_auth_router = APIRouter()
 async def login_google() -> RedirectResponse:
     """Redirects the user to the Google OAuth2 login page."""
     google_auth_url = (
-        "https://accounts.google.com/o/oauth2/auth?"
+        f"{settings.GOOGLE_AUTH_URL}?"
         f"response_type=code&client_id={settings.GOOGLE_CLIENT_ID}"
         f"&redirect_uri={settings.GOOGLE_REDIRECT_URI}"
         "&scope=openid%20profile%20email&access_type=offline"
@@ -32,8 +33,11 @@ async def login_google() -> RedirectResponse:
     "/auth/callback", response_model=TokenResponse, status_code=status.HTTP_200_OK
 )
 async def auth_google(db_session: SessionDep, code: str) -> TokenResponse:
-    """Handles the Google OAuth2 callback and retrieves the access token."""
-    token_url = "https://accounts.google.com/o/oauth2/token"
+    """
+    Handles the Google OAuth2 callback, taking the user from the ID token
+    of the code exchange.
+    """
+    token_url = settings.GOOGLE_TOKEN_URL
     data = {
         "code": code,
         "client_id": settings.GOOGLE_CLIENT_ID,
@@ -42,29 +46,22 @@ async def auth_google(db_session: SessionDep, code: str) -> TokenResponse:
         "grant_type": "authorization_code",
     }
 
-    async with httpx.AsyncClient() as client:
-        response = await client.post(token_url, data=data)
-        response_data = response.json()
-        access_token = response_data.get("access_token")
+    client = get_http_client(GOOGLE)
 
-        user_info_response = await client.get(
-            "https://www.googleapis.com/oauth2/v1/userinfo",
-            headers={"Authorization": f"Bearer {access_token}"},
-        )
+    response = await client.post(token_url, data=data)
+    response_data = response.json()
 
-        user_info = user_info_response.json()
+    claims = await verify_id_token(
+        response_data.get("id_token"), access_token=response_data.get("access_token")
+    )
 
-        user = await get_by_email(db_session=db_session, email=user_info["email"])
-        if not user:
-            user_in = UserCreateGoogle(
-                email=user_info["email"], google_id=user_info["id"]
-            )
+    user = await get_by_email(db_session=db_session, email=claims["email"])
+    if not user:
+        user_in = UserCreateGoogle(email=claims["email"], google_id=claims["sub"])
 
-            user = await create_user_through_google(
-                db_session=db_session, user_in=user_in
-            )
+        user = await create_user_through_google(db_session=db_session, user_in=user_in)
 
-        data = {"user_id": user.id}  # type: ignore
-        access_token = create_access_token(data=data)
+    data = {"user_id": user.id}  # type: ignore
+    access_token = create_access_token(data=data)
 
-        return TokenResponse(access_token=access_token, token_type="bearer")
+    return TokenResponse(access_token=access_token, token_type="bearer")
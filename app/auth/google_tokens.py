@@ -0,0 +1,209 @@
+import json
+import logging
+import re
+import time
+from typing import Any
+
+import httpx
+from jose import JOSEError, JWTError, jwk, jwt
+from jose.backends.base import Key
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+
+from app.caching import SingleFlight
+from app.config import settings
+from app.exceptions import GoogleTokenException
+from app.http_clients import GOOGLE, get_http_client
+from app.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_JWKS_CACHE_KEY = "google:jwks"
+
+ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+ALGORITHM = "RS256"
+
+# Tolerated clock difference to Google when checking `exp` and `iat`.
+LEEWAY_SECONDS = 60
+
+# A token signed with a key that isn't in the cached set makes the keys
+# be reloaded, but not more often than this, so made up `kid`s can't be
+# used to hammer Google.
+MIN_RELOAD_INTERVAL = 60
+
+_MAX_AGE = re.compile(r"max-age=(\d+)")
+
+
+class _KeySet:
+    def __init__(self, keys: dict[str, Key], ttl: int) -> None:
+        self.keys = keys
+        self.loaded_at = time.monotonic()
+        self.expires_at = self.loaded_at + ttl
+
+    @property
+    def is_fresh(self) -> bool:
+        return time.monotonic() < self.expires_at
+
+
+_key_set: _KeySet | None = None
+_key_set_flight: SingleFlight[str, _KeySet] = SingleFlight()
+
+
+def clear_signing_keys() -> None:
+    """Forgets the signing keys kept in process memory."""
+    global _key_set
+    _key_set = None
+
+
+async def verify_id_token(
+    id_token: str | None, *, access_token: str | None = None
+) -> dict[str, Any]:
+    """
+    Verifies an ID token from Google's token endpoint and returns its
+    claims, raising `GoogleTokenException` when it isn't valid for this
+    client or its email isn't verified.
+
+    The signature is checked against Google's signing keys, which are kept
+    in process memory and Redis for as long as Google's cache headers allow.
+    """
+    if not id_token:
+        raise GoogleTokenException()
+
+    try:
+        kid = jwt.get_unverified_header(id_token).get("kid")
+    except JWTError:
+        raise GoogleTokenException()
+
+    key = await get_signing_key(kid)
+    if key is None:
+        raise GoogleTokenException()
+
+    try:
+        claims = jwt.decode(
+            id_token,
+            key,
+            algorithms=[ALGORITHM],
+            audience=settings.GOOGLE_CLIENT_ID,
+            issuer=ISSUERS,
+            access_token=access_token,
+            options={"leeway": LEEWAY_SECONDS},
+        )
+    except JWTError:
+        raise GoogleTokenException()
+
+    if not claims.get("sub") or not claims.get("email"):
+        raise GoogleTokenException()
+    if claims.get("email_verified") is not True:
+        raise GoogleTokenException()
+
+    return claims
+
+
+async def get_signing_key(kid: str | None) -> Key | None:
+    """
+    Returns Google's signing key with the given id, or None if Google
+    doesn't have such a key.
+    """
+    key_set = _key_set
+    if key_set is not None and key_set.is_fresh and kid in key_set.keys:
+        return key_set.keys[kid]
+
+    if (
+        key_set is None
+        or not key_set.is_fresh
+        or time.monotonic() - key_set.loaded_at >= MIN_RELOAD_INTERVAL
+    ):
+        key_set = await _key_set_flight.do("jwks", lambda: _load_key_set(kid))
+
+    return key_set.keys.get(kid) if kid else None
+
+
+async def _load_key_set(kid: str | None) -> _KeySet:
+    global _key_set
+    redis = get_redis()
+
+    key_set = None
+    if redis is not None:
+        key_set = await _read_cached_key_set(redis)
+
+    # Redis may still hold the set from before a key rotation.
+    if key_set is None or kid not in key_set.keys:
+        try:
+            body, ttl = await request_signing_keys()
+            key_set = _KeySet(_parse_keys(body), ttl)
+        except (httpx.HTTPError, ValueError, KeyError, TypeError, JOSEError):
+            if _key_set is None:
+                raise
+            # Better the keys we have than failing every Google login.
+            logger.warning("Failed to load Google's signing keys", exc_info=True)
+            return _key_set
+
+        if redis is not None and ttl > 0:
+            try:
+                await redis.set(GOOGLE_JWKS_CACHE_KEY, body, ex=ttl)
+            except RedisError:
+                logger.warning(
+                    "Failed to write Google's signing keys to Redis", exc_info=True
+                )
+
+    _key_set = key_set
+    return key_set
+
+
+async def _read_cached_key_set(redis: aioredis.Redis) -> _KeySet | None:
+    try:
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.get(GOOGLE_JWKS_CACHE_KEY)
+            pipe.ttl(GOOGLE_JWKS_CACHE_KEY)
+            body, ttl = await pipe.execute()
+    except RedisError:
+        logger.warning("Failed to read Google's signing keys from Redis", exc_info=True)
+        return None
+
+    if body is None or ttl <= 0:
+        return None
+
+    try:
+        return _KeySet(_parse_keys(body), ttl)
+    except (ValueError, KeyError, TypeError, JOSEError):
+        # Fetched again and written over by the caller.
+        logger.warning(
+            "Failed to parse Google's signing keys from Redis", exc_info=True
+        )
+        return None
+
+
+def _parse_keys(body: bytes) -> dict[str, Key]:
+    """Builds the keys of a JWK Set, skipping the ones not used for ID tokens."""
+    keys = {}
+    for key in json.loads(body)["keys"]:
+        if key.get("kid") and key.get("alg", ALGORITHM) == ALGORITHM:
+            keys[key["kid"]] = jwk.construct(key, ALGORITHM)
+
+    return keys
+
+
+def cache_ttl(headers: httpx.Headers) -> int:
+    """
+    How long a response can be cached for, per its `Cache-Control` and
+    `Age` headers, `GOOGLE_JWKS_DEFAULT_TTL` when they don't say, and 0
+    when they forbid storing it.
+    """
+    cache_control = headers.get("cache-control", "")
+    if "no-store" in cache_control:
+        return 0
+
+    max_age = _MAX_AGE.search(cache_control)
+    if max_age is None:
+        return settings.GOOGLE_JWKS_DEFAULT_TTL
+
+    age = headers.get("age", "0")
+    return max(int(max_age.group(1)) - (int(age) if age.isdigit() else 0), 0)
+
+
+async def request_signing_keys() -> tuple[bytes, int]:
+    """Fetches Google's JWK Set, with the number of seconds it can be cached."""
+    response = await get_http_client(GOOGLE).get(settings.GOOGLE_JWKS_URL)
+    response.raise_for_status()
+
+    return response.content, cache_ttl(response.headers)
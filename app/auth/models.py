@@ -1,22 +1,27 @@
 from datetime import datetime, timedelta, timezone
 
 from pydantic import EmailStr
-from sqlalchemy import DateTime, ForeignKey, String
+from sqlalchemy import DateTime, ForeignKey, Index, String
 from sqlalchemy.orm import Mapped, mapped_column
 
+from app.config import settings
 from app.database.core import Base
 from app.models import PydanticBase
-from app.referral.utils import generate_random_referral_code
+from app.referral.utils import (
+    generate_random_referral_code,
+    generate_signed_referral_code,
+)
 
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (Index("ix_users_referer_id", "referer_id", "id"),)
 
     id: Mapped[int] = mapped_column(primary_key=True)
     email: Mapped[str] = mapped_column(unique=True, nullable=False)
     password: Mapped[str] = mapped_column(unique=False, nullable=True)
     referral_code: Mapped[str | None] = mapped_column(
-        String(8), unique=True, nullable=True
+        String(32), unique=True, nullable=True
     )
     referral_code_exp: Mapped[datetime | None] = mapped_column(
         DateTime(timezone=True), nullable=True
@@ -26,8 +31,16 @@ class User(Base):
 
     def create_referral_code(self, days: int = 30) -> None:
         """Creates a referral code and determines its expiration date."""
-        self.referral_code = generate_random_referral_code(8)
-        self.referral_code_exp = datetime.now(timezone.utc) + timedelta(days=days)
+        expires_at = datetime.now(timezone.utc) + timedelta(days=days)
+
+        if settings.REFERRAL_CODE_FORMAT == "signed":
+            # Signed codes only keep whole seconds of the expiry.
+            expires_at = expires_at.replace(microsecond=0)
+            self.referral_code = generate_signed_referral_code(self.id, expires_at)
+        else:
+            self.referral_code = generate_random_referral_code(8)
+
+        self.referral_code_exp = expires_at
 
     def delete_referral_code(self) -> None:
         """Deletes referral code."""
@@ -75,3 +88,19 @@ class UserConfirmPassword(PydanticBase):
 class UserRead(UserBase):
     id: int
     email: str
+
+
+class ImportConflict(PydanticBase):
+    line: int
+    legacy_id: str | None
+    email: str | None
+    reason: str
+
+
+class ImportReport(PydanticBase):
+    rows: int
+    inserted: int
+    skipped: int
+    referers_linked: int
+    referral_codes_dropped: int
+    conflicts: list[ImportConflict]
@@ -1,21 +1,47 @@
+import logging
 from datetime import datetime, timezone
-from typing import Annotated
+from typing import Annotated, Any
 
 from fastapi import Depends
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from pydantic import EmailStr
+from redis.exceptions import RedisError
+from sqlalchemy import ColumnElement, exists
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from sqlalchemy.orm import make_transient_to_detached
 
+from app.caching import CacheStats, LRUCache, SingleFlight
 from app.config import settings
 from app.database.core import SessionDep
 from app.exceptions import CredentialsException, PasswordResetTokenException
 from app.jwt.models import TokenData
-from app.security import get_password_hash
+from app.redis_client import get_redis
+from app.referral.cache import invalidate_referrals
+from app.referral.graph import publish_graph_change
+from app.referral.leaderboard import record_referral
+from app.referral.tree import attach_to_referer
+from app.referral.utils import decode_signed_referral_code, is_signed_referral_code
+from app.security import password_hasher
 
 from .models import User, UserCreate, UserCreateByLink, UserCreateGoogle
 
+logger = logging.getLogger(__name__)
+
+# Column snapshots of recently authenticated users, keyed by user id, with
+# the version of the user's principal they were loaded at.
+principal_cache: LRUCache[int, tuple[int, dict[str, Any]]] = LRUCache(
+    maxsize=settings.PRINCIPAL_CACHE_SIZE
+)
+principal_flight: SingleFlight[tuple[int, int | None], dict[str, Any] | None] = (
+    SingleFlight()
+)
+principal_cache_stats = CacheStats()
+# Bumped on every invalidation so that loads racing with it aren't cached.
+_principal_epoch = 0
+
 
 async def get(*, db_session: AsyncSession, user_id: int) -> User | None:
     """Returns a user based on the given id."""
@@ -33,6 +59,27 @@ async def get_by_email(*, db_session: AsyncSession, email: EmailStr) -> User | N
     return result.scalars().first()
 
 
+def _referral_code_criteria(referral_code: str) -> list[ColumnElement[bool]] | None:
+    """
+    Returns the filters that select the owner of a valid referral code, or
+    `None` if the code can be rejected without a query.
+
+    Signed codes are checked up front and resolved by primary key. They must
+    still match the user's current code, so deleted or replaced codes stop
+    working.
+    """
+    now = datetime.now(timezone.utc)
+
+    if is_signed_referral_code(referral_code):
+        decoded = decode_signed_referral_code(referral_code)
+        if decoded is None or decoded[1] < now:
+            return None
+
+        return [User.id == decoded[0], User.referral_code == referral_code]
+
+    return [User.referral_code == referral_code, User.referral_code_exp >= now]
+
+
 async def get_by_referral_code(
     *, db_session: AsyncSession, referral_code: str
 ) -> User | None:
@@ -40,37 +87,77 @@ async def get_by_referral_code(
     Returns the user by his referral code if it
     exists and its expiration date has not expired.
     """
-    query = select(User).where(User.referral_code == referral_code)
-    result = await db_session.execute(query)
+    criteria = _referral_code_criteria(referral_code)
+    if criteria is None:
+        return None
 
-    user = result.scalars().first()
+    result = await db_session.execute(select(User).where(*criteria))
 
-    if user:
-        if user.referral_code_exp is None or user.referral_code_exp < datetime.now(
-            timezone.utc
-        ):
-            return None
+    return result.scalars().first()
 
-    return user
+
+async def check_signup(
+    *, db_session: AsyncSession, email: EmailStr, referral_code: str | None
+) -> tuple[bool, int | None]:
+    """
+    Checks whether an email is taken and resolves the referer's id from a
+    referral code, in a single query.
+
+    The referer's id is `None` if there's no code or it isn't valid.
+    """
+    columns: list[Any] = [exists().where(User.email == email).label("email_taken")]
+
+    criteria = _referral_code_criteria(referral_code) if referral_code else None
+    if criteria is not None:
+        referer = select(User.id).where(*criteria).scalar_subquery()
+        columns.append(referer.label("referer_id"))
+
+    result = await db_session.execute(select(*columns))
+    row = result.one()
+
+    return row.email_taken, row.referer_id if criteria is not None else None
 
 
 async def create(
     *,
     db_session: AsyncSession,
     user_in: UserCreate | UserCreateByLink,
-    referer_id: int | None
-) -> User:
-    """Creates a new user."""
-    hashed_password = get_password_hash(user_in.password)
-    user_in.password = hashed_password
+    hashed_password: str,
+    referer_id: int | None,
+) -> User | None:
+    """
+    Creates a new user with an already hashed password.
 
-    user = User(
-        **user_in.model_dump(exclude={"referer_referral_code"}), referer_id=referer_id
+    Returns `None` if the email has been taken in the meantime.
+    """
+    query = (
+        insert(User)
+        .values(
+            **user_in.model_dump(exclude={"password", "referer_referral_code"}),
+            password=hashed_password,
+            referer_id=referer_id,
+        )
+        .on_conflict_do_nothing(index_elements=[User.email])
+        .returning(User)
     )
+    result = await db_session.execute(query)
+    user = result.scalars().first()
+
+    if user is None:
+        await db_session.rollback()
+        return None
+
+    if referer_id is not None:
+        await attach_to_referer(
+            db_session=db_session, user_id=user.id, referer_id=referer_id
+        )
 
-    db_session.add(user)
     await db_session.commit()
-    await db_session.refresh(user)
+
+    if referer_id is not None:
+        await invalidate_referrals(referer_id)
+        await record_referral(referer_id)
+    await publish_graph_change(user.id, referer_id)
 
     return user
 
@@ -88,6 +175,8 @@ async def create_user_through_google(
     await db_session.commit()
     await db_session.refresh(user)
 
+    await publish_graph_change(user.id, None)
+
     return user
 
 
@@ -95,11 +184,13 @@ async def update_password(
     db_session: AsyncSession, user: User, new_password: str
 ) -> dict[str, str]:
     """Updates the user's password."""
-    user.password = get_password_hash(new_password)
+    user.password = await password_hasher.hash(new_password)
 
     await db_session.commit()
     await db_session.refresh(user)
 
+    await invalidate_principal(user.id)
+
     return {"msg": "The password has been successfully changed."}
 
 
@@ -130,8 +221,7 @@ async def get_current_user(
     """Retrieves the current user based on the provided JWT access token."""
     token_data = await verify_access_token(token, CredentialsException())
 
-    result = await db.execute(select(User).where(User.id == token_data.id))
-    user = result.scalars().first()
+    user = await get_principal(db_session=db, user_id=token_data.id)  # type: ignore
 
     if user is None:
         raise CredentialsException()
@@ -139,6 +229,95 @@ async def get_current_user(
     return user
 
 
+async def get_principal(*, db_session: AsyncSession, user_id: int) -> User | None:
+    """
+    Returns a user for an authenticated request from the principal cache,
+    loading it from the database on a miss.
+
+    Every worker has its own cache, so snapshots are only used while they
+    match the user's principal version in Redis, which
+    `invalidate_principal` bumps. When Redis can't be read the user is
+    loaded without caching.
+
+    Misses are loaded from the primary, never from a read replica: a
+    lagging replica would put values that were just changed and
+    invalidated, such as the password hash, back in the cache. The
+    returned user is attached to `db_session` without a query, so it can
+    be modified and committed like any other loaded instance.
+    """
+    version = await _principal_version(user_id)
+    cached = principal_cache.get(user_id) if version is not None else None
+    if cached is not None and cached[0] == version:
+        principal_cache_stats.hits += 1
+        snapshot: dict[str, Any] | None = cached[1]
+    else:
+        principal_cache_stats.misses += 1
+        snapshot = await principal_flight.do(
+            (user_id, version), lambda: _load_principal(db_session, user_id, version)
+        )
+
+    if snapshot is None:
+        return None
+
+    user = User(**snapshot)
+    make_transient_to_detached(user)
+
+    return await db_session.merge(user, load=False)
+
+
+async def invalidate_principal(user_id: int) -> None:
+    """
+    Drops a user from the principal cache of every worker after its row
+    has changed.
+    """
+    global _principal_epoch
+    _principal_epoch += 1
+    principal_cache.delete(user_id)
+
+    redis = get_redis()
+    if redis is None:
+        return
+
+    try:
+        await redis.incr(_principal_version_key(user_id))
+    except RedisError:
+        logger.warning("Failed to bump a principal version", exc_info=True)
+
+
+def _principal_version_key(user_id: int) -> str:
+    return f"principal-version:{user_id}"
+
+
+async def _principal_version(user_id: int) -> int | None:
+    redis = get_redis()
+    if redis is None:
+        return 0
+
+    try:
+        return int(await redis.get(_principal_version_key(user_id)) or 0)
+    except RedisError:
+        logger.warning("Failed to read a principal version", exc_info=True)
+        return None
+
+
+async def _load_principal(
+    db_session: AsyncSession, user_id: int, version: int | None
+) -> dict[str, Any] | None:
+    epoch = _principal_epoch
+
+    user = await get(db_session=db_session, user_id=user_id)
+    if user is None:
+        return None
+
+    # The version was read before the row, so a snapshot that another
+    # worker's change has made stale is cached under an outdated version.
+    snapshot = user.dict()
+    if version is not None and epoch == _principal_epoch:
+        principal_cache.set(user_id, (version, snapshot), settings.PRINCIPAL_CACHE_TTL)
+
+    return snapshot
+
+
 CurrentUser = Annotated[User, Depends(get_current_user)]
 
 
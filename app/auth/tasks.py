@@ -1,22 +1,190 @@
 import smtplib
+import threading
 from email.message import EmailMessage
+from typing import Any
+
+import redis
+from celery.signals import worker_process_shutdown
+from celery.utils.log import get_task_logger
+from redis.exceptions import RedisError
 
 from app.celery_app import celery_app
 from app.config import settings
 
+logger = get_task_logger(__name__)
 
-@celery_app.task
-def send_email(to_email: str, subject: str, body: str) -> None:
+
+class SMTPConnection:
+    """
+    A reusable, authenticated SMTP session.
+
+    The session is opened on first use, reopened when the server drops it,
+    and recycled after `SMTP_MAX_MESSAGES_PER_CONNECTION` messages.
+    """
+
+    def __init__(self) -> None:
+        self._smtp: smtplib.SMTP | None = None
+        self._sent = 0
+
+    def _connect(self) -> smtplib.SMTP:
+        smtp: smtplib.SMTP
+        if settings.SMTP_SSL:
+            smtp = smtplib.SMTP_SSL(
+                settings.SMTP_HOST, settings.SMTP_PORT, timeout=settings.SMTP_TIMEOUT
+            )
+        else:
+            smtp = smtplib.SMTP(
+                settings.SMTP_HOST, settings.SMTP_PORT, timeout=settings.SMTP_TIMEOUT
+            )
+            if settings.SMTP_TLS:
+                smtp.starttls()
+
+        if settings.SMTP_PASSWORD:
+            smtp.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
+
+        return smtp
+
+    def send(self, message: EmailMessage) -> None:
+        """Sends a message, reconnecting once if the session has gone away."""
+        if self._sent >= settings.SMTP_MAX_MESSAGES_PER_CONNECTION:
+            self.close()
+
+        if self._smtp is None:
+            self._smtp = self._connect()
+
+        try:
+            self._smtp.send_message(message)
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            self.close()
+            self._smtp = self._connect()
+            self._smtp.send_message(message)
+
+        self._sent += 1
+
+    def close(self) -> None:
+        """Ends the session."""
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                self._smtp.close()
+
+        self._smtp = None
+        self._sent = 0
+
+
+# One session per worker thread, smtplib connections aren't thread-safe.
+_local = threading.local()
+_connections: list[SMTPConnection] = []
+_connections_lock = threading.Lock()
+
+
+def get_smtp_connection() -> SMTPConnection:
+    """Returns the SMTP session of the current worker thread."""
+    connection = getattr(_local, "connection", None)
+    if connection is None:
+        connection = _local.connection = SMTPConnection()
+        with _connections_lock:
+            _connections.append(connection)
+
+    return connection
+
+
+@worker_process_shutdown.connect
+def close_smtp_connections(**kwargs: object) -> None:
+    with _connections_lock:
+        for connection in _connections:
+            connection.close()
+
+
+def build_message(to_email: str, subject: str, body: str) -> EmailMessage:
     message = EmailMessage()
     message["From"] = settings.EMAILS_FROM_EMAIL
     message["To"] = to_email
     message["Subject"] = subject
     message.set_content(body)
 
+    return message
+
+
+@celery_app.task
+def send_email(to_email: str, subject: str, body: str) -> None:
+    message = build_message(to_email, subject, body)
+
     try:
-        with smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT) as smtp:
-            smtp.starttls()
-            smtp.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
-            smtp.send_message(message)
-    except smtplib.SMTPException as e:
-        print(f"Error: {e}")
+        get_smtp_connection().send(message)
+    except (smtplib.SMTPException, OSError) as e:
+        logger.error(f"Error: {e}")
+
+
+OUTBOX_DELIVERED_KEY = "email-outbox:delivered:{id}"
+
+_dedup_redis: redis.Redis | None = None
+
+
+def get_dedup_redis() -> redis.Redis:
+    """Returns the Redis connection delivered outbox emails are noted in."""
+    global _dedup_redis
+    if _dedup_redis is None:
+        _dedup_redis = redis.Redis.from_url(str(settings.REDIS_URL))
+
+    return _dedup_redis
+
+
+def is_outbox_email_delivered(outbox_id: int) -> bool:
+    """
+    Returns whether an outbox email was already delivered.
+
+    Reports it as not delivered when Redis is unavailable, duplicates beat
+    lost emails.
+    """
+    try:
+        return bool(get_dedup_redis().exists(OUTBOX_DELIVERED_KEY.format(id=outbox_id)))
+    except RedisError as e:
+        logger.warning(f"Failed to check outbox email {outbox_id}: {e}")
+        return False
+
+
+def mark_outbox_email_delivered(outbox_id: int) -> None:
+    """Notes an outbox email as delivered, once it has been sent."""
+    key = OUTBOX_DELIVERED_KEY.format(id=outbox_id)
+    try:
+        get_dedup_redis().set(key, 1, ex=settings.OUTBOX_DEDUP_TTL)
+    except RedisError as e:
+        logger.warning(f"Failed to mark outbox email {outbox_id} as delivered: {e}")
+
+
+@celery_app.task
+def send_emails_bulk(messages: list[dict[str, Any]]) -> dict[str, int]:
+    """
+    Sends many messages over one SMTP session.
+
+    Each message is a dict with `to_email`, `subject` and `body` keys.
+    A failed message is logged and skipped, the rest are still sent.
+    Messages relayed from the outbox also carry its row `id`, and are
+    skipped when already delivered. They're only noted as delivered after
+    being sent, so a worker dying mid-send can cause a duplicate, never a
+    lost email.
+    """
+    connection = get_smtp_connection()
+
+    sent = failed = 0
+    for item in messages:
+        outbox_id = item.get("id")
+        if outbox_id is not None and is_outbox_email_delivered(outbox_id):
+            logger.info(f"Skipping outbox email {outbox_id}, already delivered")
+            continue
+
+        message = build_message(item["to_email"], item["subject"], item["body"])
+        try:
+            connection.send(message)
+        except (smtplib.SMTPException, OSError) as e:
+            logger.error(f"Error sending email to {item['to_email']}: {e}")
+            failed += 1
+            continue
+
+        sent += 1
+        if outbox_id is not None:
+            mark_outbox_email_delivered(outbox_id)
+
+    return {"sent": sent, "failed": failed}
@@ -1,40 +1,130 @@
-import httpx
+import logging
+from typing import Any
+
 from fastapi import HTTPException, status
 from pydantic import EmailStr
+from redis.exceptions import RedisError
 
+from app.caching import CacheStats, LRUCache, SingleFlight
 from app.config import settings
+from app.http_clients import HUNTER, get_http_client
+from app.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+HUNTER_CACHE_KEY = "hunter:email:{email}"
+
+email_verification_cache: LRUCache[str, bool] = LRUCache(
+    maxsize=settings.HUNTER_CACHE_SIZE
+)
+email_verification_flight: SingleFlight[str, bool] = SingleFlight()
+local_cache_stats = CacheStats()
+redis_cache_stats = CacheStats()
 
 
 async def verify_email_with_hunter(email: EmailStr) -> bool:
-    async with httpx.AsyncClient() as client:
-        """
-        Sending a request to the hunter.io service to verify the email
-        entered by the user. All results except 'undeliverable' will return True,
-        which will indicate that the email is available for registration.
-
-        The verification result indicates the status of the email address:
-        - 'deliverable': email address is valid.
-        - 'undeliverable': the email address is not valid.
-        - 'risky': the verification can't be validated.
-
-        For more details, refer to the Hunter.io documentation:
-        https://hunter.io/api-documentation#email-verifier
-        """
-        params = {"email": email, "api_key": settings.HUNTER_IO_API_KEY}
-        response = await client.get(
-            "https://api.hunter.io/v2/email-verifier", params=params
-        )
+    """
+    Verifies an email with hunter.io, remembering the result.
+
+    Results are looked up in an in-process LRU first and in Redis second.
+    Concurrent checks of the same address share one upstream request.
+    """
+    key = email.lower()
+
+    result = email_verification_cache.get(key)
+    if result is not None:
+        local_cache_stats.hits += 1
+        return result
+
+    local_cache_stats.misses += 1
+
+    return await email_verification_flight.do(
+        key, lambda: _load_email_verification(key)
+    )
+
+
+def get_email_verification_stats() -> dict[str, Any]:
+    """Returns hit counters for the email verification cache."""
+    return {
+        "local_hits": local_cache_stats.hits,
+        "local_misses": local_cache_stats.misses,
+        "local_hit_rate": local_cache_stats.hit_rate,
+        "redis_hits": redis_cache_stats.hits,
+        "redis_misses": redis_cache_stats.misses,
+        "redis_hit_rate": redis_cache_stats.hit_rate,
+        "shared_requests": email_verification_flight.shared,
+    }
+
+
+async def _load_email_verification(email: str) -> bool:
+    redis = get_redis()
+    cache_key = HUNTER_CACHE_KEY.format(email=email)
+
+    if redis is not None:
+        try:
+            cached = await redis.get(cache_key)
+        except RedisError:
+            logger.warning("Failed to read %s from Redis", cache_key, exc_info=True)
+            cached = None
 
-        if response.status_code != 200:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to verify email with Hunter.io",
-            )
+        if cached is not None:
+            redis_cache_stats.hits += 1
+            result = cached == b"1"
+            email_verification_cache.set(email, result, _ttl(result))
+            return result
+
+        redis_cache_stats.misses += 1
+
+    result = await request_email_verification(email)
+    email_verification_cache.set(email, result, _ttl(result))
+
+    if redis is not None:
+        try:
+            await redis.set(cache_key, "1" if result else "0", ex=_ttl(result))
+        except RedisError:
+            logger.warning("Failed to write %s to Redis", cache_key, exc_info=True)
+
+    return result
+
+
+def _ttl(result: bool) -> int:
+    if result:
+        return settings.HUNTER_CACHE_POSITIVE_TTL
+
+    return settings.HUNTER_CACHE_NEGATIVE_TTL
+
+
+async def request_email_verification(email: str) -> bool:
+    """
+    Sending a request to the hunter.io service to verify the email
+    entered by the user. All results except 'undeliverable' will return True,
+    which will indicate that the email is available for registration.
+
+    The verification result indicates the status of the email address:
+    - 'deliverable': email address is valid.
+    - 'undeliverable': the email address is not valid.
+    - 'risky': the verification can't be validated.
+
+    For more details, refer to the Hunter.io documentation:
+    https://hunter.io/api-documentation#email-verifier
+    """
+    client = get_http_client(HUNTER)
+
+    params = {"email": email, "api_key": settings.HUNTER_IO_API_KEY}
+    response = await client.get(
+        f"{settings.HUNTER_API_URL}/email-verifier", params=params
+    )
+
+    if response.status_code != 200:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to verify email with Hunter.io",
+        )
 
-        data = response.json()
-        result = data.get("data", {}).get("result")
+    data = response.json()
+    result = data.get("data", {}).get("result")
 
-        if result == "undeliverable":
-            return False
+    if result == "undeliverable":
+        return False
 
-        return True
+    return True
@@ -1,19 +1,24 @@
+import asyncio
 from typing import Any
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security.oauth2 import OAuth2PasswordRequestForm
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
-from app.database.core import SessionDep
-from app.exceptions import PasswordResetTokenException
+from app.database.core import SessionDep, release_connection
+from app.exceptions import EmailTakenException, PasswordResetTokenException
 from app.jwt.models import TokenResponse
+from app.outbox.service import enqueue_email
+from app.rate_limit import check_account_rate_limit, limit_by_ip
 from app.security import (
     create_access_token,
     create_password_reset_token,
-    verify_password,
+    password_hasher,
 )
 
 from .models import (
+    User,
     UserConfirmPassword,
     UserCreate,
     UserCreateByLink,
@@ -23,101 +28,117 @@ from .models import (
 )
 from .service import (
     CurrentUser,
+    check_signup,
     create,
     get_by_email,
-    get_by_referral_code,
     update_password,
     verify_password_reset_token,
 )
-from .tasks import send_email
 from .utils import verify_email_with_hunter
 
 auth_router = APIRouter()
 users_router = APIRouter()
 
 
-@auth_router.post(
-    "/signup", response_model=UserRead, status_code=status.HTTP_201_CREATED
-)
-async def signup(db_session: SessionDep, user_in: UserCreate) -> Any:
-    """Creates a new user account."""
-    user = await get_by_email(db_session=db_session, email=user_in.email)
-    if user:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"User with email `{user_in.email}` already exists.",
-        )
+async def _signup(
+    db_session: AsyncSession,
+    user_in: UserCreate | UserCreateByLink,
+    referral_code: str | None,
+) -> User:
+    """
+    Runs the signup checks and creates the user.
 
-    if not await verify_email_with_hunter(email=user_in.email):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="The email address provided is not valid.",
-        )
+    The hunter.io verification runs while the database checks the email
+    and referral code. The password is only hashed once all checks have
+    passed, so rejected signups don't take a hasher slot. Nothing is
+    started when the password hasher is saturated.
+    """
+    await check_account_rate_limit("signup", user_in.email)
+    password_hasher.check_capacity()
+
+    verification = asyncio.create_task(verify_email_with_hunter(email=user_in.email))
 
-    referer_id = None
-    if user_in.referer_referral_code is not None:
-        referer = await get_by_referral_code(
-            db_session=db_session, referral_code=user_in.referer_referral_code
+    try:
+        email_taken, referer_id = await check_signup(
+            db_session=db_session, email=user_in.email, referral_code=referral_code
         )
-        if not referer:
+        if email_taken:
+            raise EmailTakenException(user_in.email)
+
+        # Don't hold a connection while waiting for hunter.io and the hash.
+        await release_connection(db_session)
+
+        if not await verification:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="The email address provided is not valid.",
+            )
+
+        if referral_code is not None and referer_id is None:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Incorrect referral code.",
             )
-        referer_id = referer.id
+    finally:
+        verification.cancel()
+        # Retrieves the exception of a verification that failed meanwhile.
+        verification.add_done_callback(
+            lambda task: task.cancelled() or task.exception()
+        )
 
-    user = await create(db_session=db_session, user_in=user_in, referer_id=referer_id)
+    hashed_password = await password_hasher.hash(user_in.password)
+
+    user = await create(
+        db_session=db_session,
+        user_in=user_in,
+        hashed_password=hashed_password,
+        referer_id=referer_id,
+    )
+    if user is None:
+        raise EmailTakenException(user_in.email)
 
     return user
 
 
+@auth_router.post(
+    "/signup",
+    response_model=UserRead,
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(limit_by_ip("signup"))],
+)
+async def signup(db_session: SessionDep, user_in: UserCreate) -> Any:
+    """Creates a new user account."""
+    return await _signup(db_session, user_in, user_in.referer_referral_code)
+
+
 @auth_router.post(
     "/signup/referral/{referral_code}",
     response_model=UserRead,
     status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(limit_by_ip("signup"))],
 )
 async def signup_by_referral_link(
     db_session: SessionDep, user_in: UserCreateByLink, referral_code: str
 ) -> Any:
     """Register a new user using a referral link."""
-    user = await get_by_email(db_session=db_session, email=user_in.email)
-    if user:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"User with email {user_in.email} already exists.",
-        )
-
-    if not await verify_email_with_hunter(email=user_in.email):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="The email address provided is not valid.",
-        )
-
-    referer = await get_by_referral_code(
-        db_session=db_session, referral_code=referral_code
-    )
-    if not referer:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Incorrect referral code.",
-        )
-    referer_id = referer.id
-
-    user = await create(db_session=db_session, user_in=user_in, referer_id=referer_id)
-
-    return user
+    return await _signup(db_session, user_in, referral_code)
 
 
 @auth_router.post(
-    "/signin", response_model=TokenResponse, status_code=status.HTTP_200_OK
+    "/signin",
+    response_model=TokenResponse,
+    status_code=status.HTTP_200_OK,
+    dependencies=[Depends(limit_by_ip("signin"))],
 )
 async def signin(
     db_session: SessionDep, user_credentials: OAuth2PasswordRequestForm = Depends()
 ) -> TokenResponse:
     """Authenticates a user and provides an access token."""
+    await check_account_rate_limit("signin", user_credentials.username)
     user = await get_by_email(db_session=db_session, email=user_credentials.username)
+    await release_connection(db_session)
 
-    if user and verify_password(user_credentials.password, user.password):
+    if user and await password_hasher.verify(user_credentials.password, user.password):
         data = {"user_id": user.id}
         access_token = create_access_token(data=data)
 
@@ -130,12 +151,20 @@ async def signin(
     )
 
 
-@auth_router.put("/password", status_code=status.HTTP_200_OK)
+@auth_router.put(
+    "/password",
+    status_code=status.HTTP_200_OK,
+    dependencies=[Depends(limit_by_ip("password"))],
+)
 async def change_password(
     db_session: SessionDep, current_user: CurrentUser, password_in: UserUpdatePassword
 ) -> Any:
     """Changes the current user's password."""
-    if not verify_password(password_in.old_password, current_user.password):
+    await check_account_rate_limit("password", current_user.id)
+    await release_connection(db_session)
+    if not await password_hasher.verify(
+        password_in.old_password, current_user.password
+    ):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Old password isn't valid."
         )
@@ -151,11 +180,12 @@ async def change_password(
     )
 
 
-@auth_router.post("/password/reset")
+@auth_router.post("/password/reset", dependencies=[Depends(limit_by_ip("reset"))])
 async def request_reset_password(
     db_session: SessionDep, reset_data: UserResetPassword
 ) -> dict[str, str]:
     """Requests a password reset link for the user."""
+    await check_account_rate_limit("reset", reset_data.email)
     user = await get_by_email(db_session=db_session, email=reset_data.email)
     if not user:
         raise HTTPException(
@@ -169,12 +199,17 @@ async def request_reset_password(
     subject = "Please reset your password"
     body = f"Click the link to reset your password: {reset_link}"
 
-    send_email.delay(reset_data.email, subject, body)
+    enqueue_email(
+        db_session=db_session, to_email=reset_data.email, subject=subject, body=body
+    )
+    await db_session.commit()
 
     return {"msg": "Password reset link has been sent to your email."}
 
 
-@auth_router.put("/password/reset/{token}")
+@auth_router.put(
+    "/password/reset/{token}", dependencies=[Depends(limit_by_ip("reset"))]
+)
 async def reset_password(
     db_session: SessionDep,
     token: str,
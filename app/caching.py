@@ -0,0 +1,442 @@
+import asyncio
+import logging
+import math
+import random
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Hashable
+from dataclasses import dataclass
+from typing import Any, Generic, TypeVar
+
+from fastapi_cache.backends.redis import RedisBackend
+from fastapi_cache.coder import Coder, JsonCoder, PickleCoder
+from fastapi_cache.types import Backend
+from redis.exceptions import RedisError
+
+from app.metrics import cache_requests
+
+logger = logging.getLogger(__name__)
+
+K = TypeVar("K", bound=Hashable)
+T = TypeVar("T")
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class LRUCache(Generic[K, T]):
+    """
+    Size-bounded in-process cache with a TTL per entry.
+
+    Least recently used entries are evicted once `maxsize` is reached.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._data: OrderedDict[K, tuple[float, T]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: K, default: Any = None) -> Any:
+        """Returns the value stored under key, or default if missing or expired."""
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return default
+
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: K, value: T, ttl: float) -> None:
+        """Stores a value for ttl seconds."""
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: K) -> None:
+        """Removes a key if present."""
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """Removes all keys."""
+        self._data.clear()
+
+
+class SingleFlight(Generic[K, T]):
+    """
+    Collapses concurrent calls for the same key into a single execution.
+
+    Callers that arrive while a call for their key is running wait for
+    and share its result (or exception) instead of starting their own.
+    """
+
+    def __init__(self) -> None:
+        self._calls: dict[K, asyncio.Task[T]] = {}
+        self.shared = 0
+
+    async def do(self, key: K, func: Callable[[], Awaitable[T]]) -> T:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            self.shared += 1
+
+        # Shielded so that one cancelled caller doesn't cancel the others.
+        return await asyncio.shield(task)
+
+
+class InstrumentedBackend(Backend):
+    """Counts the hits and misses of another response cache backend."""
+
+    def __init__(self, backend: Backend) -> None:
+        self.backend = backend
+
+    @staticmethod
+    def _namespace(key: str) -> str:
+        # Keys are built as `<prefix>:<namespace>:...`.
+        parts = key.split(":", 2)
+        return parts[1] if len(parts) > 2 else ""
+
+    def _count(self, key: str, value: bytes | None) -> None:
+        result = "miss" if value is None else "hit"
+        cache_requests.inc(self._namespace(key), result)
+
+    async def get_with_ttl(self, key: str) -> tuple[int, bytes | None]:
+        ttl, value = await self.backend.get_with_ttl(key)
+        self._count(key, value)
+        return ttl, value
+
+    async def get(self, key: str) -> bytes | None:
+        value = await self.backend.get(key)
+        self._count(key, value)
+        return value
+
+    async def set(self, key: str, value: bytes, expire: int | None = None) -> None:
+        await self.backend.set(key, value, expire)
+
+    async def clear(self, namespace: str | None = None, key: str | None = None) -> int:
+        return await self.backend.clear(namespace, key)
+
+
+class TieredBackend(Backend):
+    """
+    Keeps recently used entries of another response cache backend in
+    process memory, so hot keys are served without a round trip.
+
+    Entries are kept locally for at most `local_ttl` seconds, which bounds
+    how long a cleared key may still be served by other processes. The
+    expiry of stored entries is shortened by up to `jitter` (a fraction),
+    so entries cached together don't all expire at once.
+    """
+
+    def __init__(
+        self,
+        backend: Backend,
+        *,
+        maxsize: int,
+        local_ttl: float,
+        jitter: float = 0.0,
+    ) -> None:
+        self.backend = backend
+        self.local_ttl = local_ttl
+        self.jitter = jitter
+        self.stats = CacheStats()
+        # Values are stored with the time they expire in the backend.
+        self._local: LRUCache[str, tuple[float | None, bytes]] = LRUCache(maxsize)
+
+    def _remember(self, key: str, value: bytes, ttl: float | None) -> None:
+        # Entries with a TTL of 0 are about to expire, negative ones never do.
+        if self.local_ttl <= 0 or ttl == 0:
+            return
+
+        if ttl is None or ttl < 0:
+            self._local.set(key, (None, value), self.local_ttl)
+        else:
+            local_ttl = min(self.local_ttl, ttl)
+            self._local.set(key, (time.time() + ttl, value), local_ttl)
+
+    def _lookup(self, key: str) -> tuple[int, bytes] | None:
+        entry = self._local.get(key)
+        if entry is None:
+            self.stats.misses += 1
+            return None
+
+        self.stats.hits += 1
+        expires_at, value = entry
+        if expires_at is None:
+            return -1, value
+
+        return max(int(expires_at - time.time()), 0), value
+
+    async def get_with_ttl(self, key: str) -> tuple[int, bytes | None]:
+        local = self._lookup(key)
+        if local is not None:
+            return local
+
+        ttl, value = await self.backend.get_with_ttl(key)
+        if value is not None:
+            self._remember(key, value, ttl)
+
+        return ttl, value
+
+    async def get(self, key: str) -> bytes | None:
+        local = self._lookup(key)
+        if local is not None:
+            return local[1]
+
+        return await self.backend.get(key)
+
+    async def set(self, key: str, value: bytes, expire: int | None = None) -> None:
+        if expire and self.jitter > 0:
+            expire = max(expire - int(expire * random.uniform(0, self.jitter)), 1)
+
+        await self.backend.set(key, value, expire)
+        self._remember(key, value, expire)
+
+    async def clear(self, namespace: str | None = None, key: str | None = None) -> int:
+        if key is not None:
+            self._local.delete(key)
+        else:
+            self._local.clear()
+
+        return await self.backend.clear(namespace, key)
+
+
+def _pack(value: bytes, fresh_until: float, delta: float) -> bytes:
+    return b"%.3f %.4f\n" % (fresh_until, delta) + value
+
+
+def _unpack(data: bytes) -> tuple[float, float, bytes] | None:
+    header, _, value = data.partition(b"\n")
+    try:
+        fresh_until, delta = map(float, header.split())
+    except ValueError:
+        # Stored by another backend, e.g. before a deploy.
+        return None
+
+    return fresh_until, delta, value
+
+
+@dataclass
+class _Computation:
+    """A cache miss handed out to one caller, who computes the value."""
+
+    task: "asyncio.Task[Any] | None"
+    started: float
+    result: "asyncio.Future[tuple[int, bytes] | None]"
+    lock_token: str | None = None
+
+
+class RevalidatingBackend(Backend):
+    """
+    Protects a Redis response cache backend against stampedes.
+
+    - Concurrent requests for a missing entry wait for the one that
+      computes it, within a process and, through a Redis lock, across
+      processes. They wait at most `lock_timeout` seconds, and not at all
+      once the computing request has failed.
+    - Expired entries are kept for another `stale_ttl` seconds, during which
+      one request recomputes them while the others are served the stale
+      entry.
+    - Entries are recomputed early with a probability that grows as their
+      expiry nears and with how long they took to compute ("XFetch"),
+      scaled by `beta`. 0 disables it.
+    """
+
+    LOCK_KEY = "{key}:lock"
+    POLL_INTERVAL = 0.05
+
+    def __init__(
+        self,
+        backend: RedisBackend,
+        *,
+        stale_ttl: int,
+        lock_timeout: float,
+        beta: float = 1.0,
+    ) -> None:
+        self.backend = backend
+        self.stale_ttl = stale_ttl
+        self.lock_timeout = lock_timeout
+        self.beta = beta
+        self._computations: dict[str, _Computation] = {}
+        self._releases: set[asyncio.Task[None]] = set()
+
+    async def get_with_ttl(self, key: str) -> tuple[int, bytes | None]:
+        _, data = await self.backend.get_with_ttl(key)
+        entry = _unpack(data) if data is not None else None
+        if entry is None:
+            return await self._wait_for(key)
+
+        fresh_until, delta, value = entry
+        now = time.time()
+        ttl = max(int(fresh_until - now), 0)
+        # XFetch: -log(u) is exponentially distributed, so the entry is
+        # recomputed early with a probability that rises towards its expiry.
+        early = delta * self.beta * -math.log(1.0 - random.random())
+        if now + early < fresh_until:
+            return ttl, value
+
+        if await self._start(key):
+            return 0, None
+
+        return ttl, value
+
+    async def get(self, key: str) -> bytes | None:
+        data = await self.backend.get(key)
+        entry = _unpack(data) if data is not None else None
+        return entry[2] if entry is not None else None
+
+    async def set(self, key: str, value: bytes, expire: int | None = None) -> None:
+        computation = self._computations.get(key)
+        now = time.time()
+        delta = now - computation.started if computation is not None else 0.0
+        fresh_until = now + expire if expire else math.inf
+        try:
+            await self.backend.set(
+                key,
+                _pack(value, fresh_until, delta),
+                expire + self.stale_ttl if expire else None,
+            )
+        finally:
+            if computation is not None:
+                await self._finish(key, computation, (expire or -1, value))
+
+    async def clear(self, namespace: str | None = None, key: str | None = None) -> int:
+        return await self.backend.clear(namespace, key)
+
+    async def _start(self, key: str) -> bool:
+        """Tells whether the caller is the one to compute an entry."""
+        computation = self._computations.get(key)
+        if computation is not None:
+            if computation.task is not asyncio.current_task():
+                return False
+            # The task that started it has moved on without storing a value.
+            await self._finish(key, computation, None)
+
+        token = uuid.uuid4().hex
+        locked = await self.backend.redis.set(
+            self.LOCK_KEY.format(key=key),
+            token,
+            px=math.ceil(self.lock_timeout * 1000),
+            nx=True,
+        )
+        if not locked:
+            return False
+
+        task = asyncio.current_task()
+        computation = _Computation(
+            task=task,
+            started=time.time(),
+            result=asyncio.get_running_loop().create_future(),
+            lock_token=token,
+        )
+        self._computations[key] = computation
+        if task is not None:
+            # Requests that fail leave the entry to the next caller right away.
+            task.add_done_callback(lambda _: self._abandon(key, computation))
+
+        return True
+
+    async def _wait_for(self, key: str) -> tuple[int, bytes | None]:
+        """Waits for a missing entry computed by someone else, or starts it."""
+        if await self._start(key):
+            return 0, None
+
+        computation = self._computations.get(key)
+        if computation is not None:
+            try:
+                result = await asyncio.wait_for(
+                    asyncio.shield(computation.result), self.lock_timeout
+                )
+            except asyncio.TimeoutError:
+                result = None
+            return result if result is not None else (0, None)
+
+        # Computed by another process, poll until it's stored or given up.
+        lock_key = self.LOCK_KEY.format(key=key)
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.POLL_INTERVAL)
+            async with self.backend.redis.pipeline(transaction=False) as pipe:
+                data, locked = await pipe.get(key).exists(lock_key).execute()
+            entry = _unpack(data) if data is not None else None
+            if entry is not None:
+                return max(int(entry[0] - time.time()), 0), entry[2]
+            if not locked:
+                break
+
+        return 0, None
+
+    async def _finish(
+        self,
+        key: str,
+        computation: _Computation,
+        result: tuple[int, bytes] | None,
+    ) -> None:
+        if self._computations.get(key) is computation:
+            del self._computations[key]
+        if not computation.result.done():
+            computation.result.set_result(result)
+
+        token, computation.lock_token = computation.lock_token, None
+        if token is None:
+            return
+
+        lock_key = self.LOCK_KEY.format(key=key)
+        try:
+            # Unless it has timed out and been taken by someone else.
+            if await self.backend.redis.get(lock_key) == token.encode():
+                await self.backend.redis.delete(lock_key)
+        except RedisError:
+            logger.warning("Failed to release a cache lock", exc_info=True)
+
+    def _abandon(self, key: str, computation: _Computation) -> None:
+        if computation.lock_token is None and computation.result.done():
+            return
+
+        release = asyncio.ensure_future(self._finish(key, computation, None))
+        self._releases.add(release)
+        release.add_done_callback(self._releases.discard)
+
+
+class RawJSONCoder(Coder):
+    """
+    Caches the JSON returned by endpoints that serialize their own output,
+    see `app.responses.RawJSONResponse`. Hits are returned without parsing.
+    """
+
+    @classmethod
+    def encode(cls, value: bytes | str) -> bytes:
+        return value.encode() if isinstance(value, str) else value
+
+    @classmethod
+    def decode(cls, value: bytes) -> bytes:
+        return value
+
+    @classmethod
+    def decode_as_type(cls, value: bytes, *, type_: Any) -> bytes:
+        return value
+
+
+# Coders selectable with the CACHE_CODER setting. Pickle is faster and keeps
+# types like datetimes as they are, but must only be used with a trusted
+# Redis, since loading a pickle can run arbitrary code.
+CODERS: dict[str, type[Coder]] = {"json": JsonCoder, "pickle": PickleCoder}
@@ -15,4 +15,12 @@ celery_app.conf.update(
     timezone="UTC",
     broker_connection_retry_on_startup=True,
     imports=["app.auth.tasks"],
+    # Email delivery is I/O-bound: run many lightweight threads instead of
+    # processes, and only acknowledge a message once it has been sent.
+    worker_pool=settings.CELERY_WORKER_POOL,
+    worker_concurrency=settings.CELERY_WORKER_CONCURRENCY,
+    worker_prefetch_multiplier=settings.CELERY_WORKER_PREFETCH_MULTIPLIER,
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
+    task_ignore_result=True,
 )
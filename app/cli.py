@@ -0,0 +1,119 @@
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+from app.auth.bulk_import import import_users
+from app.database.core import async_session, get_read_session_factory
+from app.outbox.relay import run_relay
+from app.redis_client import close_redis, init_redis
+from app.referral.export import stream_referrals
+from app.referral.graph import request_graph_reload
+from app.referral.leaderboard import rebuild_leaderboard
+
+
+async def _rebuild_leaderboard(args: argparse.Namespace) -> None:
+    init_redis()
+    try:
+        async with async_session() as session:
+            total = await rebuild_leaderboard(
+                db_session=session, batch_size=args.batch_size
+            )
+    finally:
+        await close_redis()
+
+    print(f"Leaderboard rebuilt with {total} referers.")
+
+
+async def _import_users(args: argparse.Namespace) -> None:
+    file_format = args.format or ("csv" if args.path.suffix == ".csv" else "ndjson")
+
+    async with async_session() as session:
+        report = await import_users(
+            db_session=session,
+            path=args.path,
+            file_format=file_format,
+            conflicts_out=args.conflicts_out,
+        )
+
+    print(report.model_dump_json(indent=2))
+
+    if report.inserted:
+        init_redis()
+        try:
+            await request_graph_reload()
+        finally:
+            await close_redis()
+
+    if args.rebuild_leaderboard and report.referers_linked:
+        await _rebuild_leaderboard(args)
+
+
+async def _export_referrals(args: argparse.Namespace) -> None:
+    suffix = args.output.suffix if args.output else ""
+    file_format = args.format or ("csv" if suffix == ".csv" else "ndjson")
+
+    output = args.output.open("wb") if args.output else sys.stdout.buffer
+    try:
+        async for chunk in stream_referrals(
+            session_factory=await get_read_session_factory(),
+            file_format=file_format,
+            referer_id=args.referer_id,
+            compress=args.gzip,
+        ):
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+
+
+async def _relay_outbox(args: argparse.Namespace) -> None:
+    await run_relay(session_factory=async_session)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rebuild = commands.add_parser(
+        "rebuild-leaderboard", help="Recompute the referral leaderboard from Postgres."
+    )
+    rebuild.add_argument("--batch-size", type=int, default=10_000)
+    rebuild.set_defaults(handler=_rebuild_leaderboard)
+
+    import_ = commands.add_parser(
+        "import-users", help="Import users from a CSV or NDJSON file."
+    )
+    import_.add_argument("path", type=Path)
+    import_.add_argument("--format", choices=["csv", "ndjson"])
+    import_.add_argument(
+        "--conflicts-out", type=Path, help="Write every skipped row to this CSV file."
+    )
+    import_.add_argument(
+        "--no-rebuild-leaderboard", dest="rebuild_leaderboard", action="store_false"
+    )
+    import_.add_argument("--batch-size", type=int, default=10_000)
+    import_.set_defaults(handler=_import_users)
+
+    export = commands.add_parser(
+        "export-referrals", help="Export referral relationships as CSV or NDJSON."
+    )
+    export.add_argument(
+        "-o", "--output", type=Path, help="Write to this file instead of stdout."
+    )
+    export.add_argument("--format", choices=["csv", "ndjson"])
+    export.add_argument("--referer-id", type=int)
+    export.add_argument("--gzip", action="store_true")
+    export.set_defaults(handler=_export_referrals)
+
+    relay = commands.add_parser(
+        "relay-outbox", help="Publish emails from the outbox to Celery."
+    )
+    relay.set_defaults(handler=_relay_outbox)
+
+    args = parser.parse_args()
+    asyncio.run(args.handler(args))
+
+
+if __name__ == "__main__":
+    main()
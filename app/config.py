@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic import EmailStr, PostgresDsn, RedisDsn
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -26,6 +28,21 @@ class Settings(BaseSettings):
     POSTGRES_PASSWORD: str
     POSTGRES_DB: str
     DATABASE_URL: PostgresDsn
+    # Per process, so size them so that every worker's pool_size +
+    # max_overflow together stay within Postgres' max_connections.
+    DATABASE_POOL_SIZE: int = 10
+    DATABASE_MAX_OVERFLOW: int = 10
+    DATABASE_POOL_TIMEOUT: float = 30.0
+    DATABASE_POOL_RECYCLE: int = 30 * 60
+    DATABASE_POOL_PRE_PING: bool = False
+    DATABASE_STATEMENT_CACHE_SIZE: int = 100
+    # Disables prepared statement caching for PgBouncer in transaction mode.
+    DATABASE_PGBOUNCER: bool = False
+    # An asyncpg URL (postgresql+asyncpg://...) of a streaming replica.
+    DATABASE_REPLICA_URL: str | None = None
+    DATABASE_REPLICA_MAX_LAG: float = 5.0
+    DATABASE_REPLICA_CHECK_INTERVAL: float = 5.0
+    DATABASE_REPLICA_CHECK_TIMEOUT: float = 2.0
 
     TEST_DB_NAME: str
 
@@ -33,14 +50,58 @@ class Settings(BaseSettings):
 
     CELERY_BROKER_URL: str
     CELERY_RESULT_BACKEND: str
+    CELERY_WORKER_POOL: str = "threads"
+    CELERY_WORKER_CONCURRENCY: int = 32
+    CELERY_WORKER_PREFETCH_MULTIPLIER: int = 4
 
     SECRET_KEY: str
     ALGORITHM: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int
 
+    # "signed" codes encode the user id and expiry, see app.referral.utils.
+    REFERRAL_CODE_FORMAT: Literal["random", "signed"] = "random"
+    # Defaults to SECRET_KEY.
+    REFERRAL_CODE_KEY: str | None = None
+
+    # Cached referral responses are invalidated on change, see app.referral.cache.
+    REFERRALS_CACHE_TTL: int = 6 * 60 * 60
+    REFERRAL_CODE_CACHE_TTL: int = 6 * 60 * 60
+    # Cached responses and cache versions are also kept in each process for up
+    # to CACHE_LOCAL_TTL seconds, which is how long changes made by another
+    # process can take to show. 0 disables the in-process tier.
+    CACHE_LOCAL_SIZE: int = 10_000
+    CACHE_LOCAL_TTL: float = 5.0
+    # Fraction by which cache expiries are randomly shortened.
+    CACHE_TTL_JITTER: float = 0.1
+    # Expired responses are served for CACHE_STALE_TTL more seconds while one
+    # request recomputes them, and responses being computed are waited for up
+    # to CACHE_LOCK_TIMEOUT seconds. See app.caching.RevalidatingBackend.
+    CACHE_STALE_TTL: int = 60
+    CACHE_LOCK_TIMEOUT: float = 5.0
+    # How eagerly responses are recomputed before they expire, 0 disables it.
+    CACHE_EARLY_REFRESH_BETA: float = 1.0
+    # Serialization of cached responses, see app.caching.CODERS. Endpoints
+    # can still choose their own coder.
+    CACHE_CODER: Literal["json", "pickle"] = "json"
+
+    # In-memory referral graph, needs numpy, see app.referral.graph.
+    REFERRAL_GRAPH_ENABLED: bool = False
+    REFERRAL_GRAPH_LOAD_BATCH_SIZE: int = 100_000
+    REFERRAL_GRAPH_RELOAD_INTERVAL: int = 6 * 60 * 60
+    REFERRAL_GRAPH_EVENTS_MAXLEN: int = 100_000
+
+    PRINCIPAL_CACHE_SIZE: int = 10_000
+    PRINCIPAL_CACHE_TTL: int = 30
+
     GOOGLE_CLIENT_ID: str
     GOOGLE_CLIENT_SECRET: str
     GOOGLE_REDIRECT_URI: str
+    # Overridable so benchmarks can point them at local stand-ins.
+    GOOGLE_AUTH_URL: str = "https://accounts.google.com/o/oauth2/auth"
+    GOOGLE_TOKEN_URL: str = "https://accounts.google.com/o/oauth2/token"
+    GOOGLE_JWKS_URL: str = "https://www.googleapis.com/oauth2/v3/certs"
+    # Cache lifetime of Google's signing keys when its response doesn't set one.
+    GOOGLE_JWKS_DEFAULT_TTL: int = 300
 
     SMTP_HOST: str
     SMTP_USER: EmailStr
@@ -49,10 +110,58 @@ class Settings(BaseSettings):
     SMTP_TLS: bool
     SMTP_SSL: bool
     SMTP_PORT: int = 587
+    SMTP_TIMEOUT: float = 30.0
+    SMTP_MAX_MESSAGES_PER_CONNECTION: int = 100
+
+    # Emails are written to the email_outbox table and published to Celery
+    # by `python -m app.cli relay-outbox`, see app.outbox.relay.
+    OUTBOX_BATCH_SIZE: int = 100
+    OUTBOX_POLL_INTERVAL: float = 1.0
+    OUTBOX_MAX_ATTEMPTS: int = 10
+    OUTBOX_RETENTION_DAYS: int = 7
+    # How long workers remember delivered outbox emails to drop duplicates.
+    OUTBOX_DEDUP_TTL: int = 24 * 60 * 60
 
     RESET_PASSWORD_KEY: str
 
     HUNTER_IO_API_KEY: str
+    HUNTER_API_URL: str = "https://api.hunter.io/v2"
+    HUNTER_CACHE_SIZE: int = 10_000
+    HUNTER_CACHE_POSITIVE_TTL: int = 7 * 24 * 60 * 60
+    HUNTER_CACHE_NEGATIVE_TTL: int = 60 * 60
+
+    HTTP_CLIENT_HTTP2: bool = True
+    HTTP_CLIENT_MAX_CONNECTIONS: int = 100
+    HTTP_CLIENT_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_CLIENT_KEEPALIVE_EXPIRY: float = 30.0
+    HTTP_CLIENT_CONNECT_TIMEOUT: float = 3.0
+    HTTP_CLIENT_READ_TIMEOUT: float = 10.0
+    HTTP_CLIENT_POOL_TIMEOUT: float = 5.0
+
+    PASSWORD_HASHER_POOL: Literal["thread", "process"] = "thread"
+    PASSWORD_HASHER_WORKERS: int | None = None
+    PASSWORD_HASHER_MAX_QUEUE: int = 64
+    PASSWORD_HASHER_RETRY_AFTER: int = 1
+
+    # Token buckets of the auth routes, as "<requests>/<seconds>", kept per
+    # route and client address and per route and account. See app.rate_limit.
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_AUTH_IP: str = "30/60"
+    RATE_LIMIT_AUTH_ACCOUNT: str = "10/60"
+
+    # Compresses responses of at least this many bytes for clients that
+    # accept gzip. Leave unset when a reverse proxy compresses already.
+    RESPONSE_GZIP_MIN_SIZE: int | None = None
+    RESPONSE_GZIP_LEVEL: int = 6
+
+    # Serves Prometheus metrics at /metrics and the connection pool stats at
+    # /healthcheck/pool, keep them off the public network.
+    METRICS_ENABLED: bool = False
+
+    # Serves GET /referrals/export, which lets any signed-in user download
+    # every user's email and referral code. Prefer `python -m app.cli
+    # export-referrals`, and only enable the route on an internal network.
+    REFERRAL_EXPORT_ENABLED: bool = False
 
     IS_ALLOWED_CREDENTIALS: bool = True
     ALLOWED_ORIGINS: list[str] = [
@@ -1,11 +1,28 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections.abc import Iterator
+from dataclasses import asdict, dataclass
 from typing import Annotated, Any, AsyncGenerator
 
 from fastapi import Depends
-from sqlalchemy import MetaData
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy import MetaData, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.pool import AsyncAdaptedQueuePool, ConnectionPoolEntry
 
 from app.config import settings
+from app.metrics import Gauge, registry
+
+logger = logging.getLogger(__name__)
 
 DATABASE_URL = (
     "postgresql+asyncpg://"
@@ -14,15 +31,90 @@ DATABASE_URL = (
     f"{settings.POSTGRES_DB}"
 )
 
-async_engine = create_async_engine(DATABASE_URL, echo=False)
 
-async_session = async_sessionmaker(
-    bind=async_engine,
-    class_=AsyncSession,
-    autocommit=False,
-    autoflush=False,
-    expire_on_commit=False,
-)
+@dataclass
+class PoolWaitStats:
+    checkouts: int = 0
+    timeouts: int = 0
+    total_wait_seconds: float = 0.0
+    max_wait_seconds: float = 0.0
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """
+    Queue pool that records how long checkouts take, either waiting for a
+    free connection or opening a new one.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.wait_stats = PoolWaitStats()
+
+    def _do_get(self) -> ConnectionPoolEntry:
+        stats = self.wait_stats
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            stats.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            stats.checkouts += 1
+            stats.total_wait_seconds += waited
+            stats.max_wait_seconds = max(stats.max_wait_seconds, waited)
+
+
+def get_connect_args() -> dict[str, Any]:
+    """Returns the asyncpg connection arguments for the configured mode."""
+    if settings.DATABASE_PGBOUNCER:
+        # PgBouncer in transaction mode may run each statement on a different
+        # server connection, so nothing can be cached per connection and
+        # prepared statement names must be unique.
+        return {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+        }
+
+    return {
+        "statement_cache_size": settings.DATABASE_STATEMENT_CACHE_SIZE,
+        "prepared_statement_cache_size": settings.DATABASE_STATEMENT_CACHE_SIZE,
+    }
+
+
+def _create_engine(url: str) -> AsyncEngine:
+    return create_async_engine(
+        url,
+        echo=False,
+        poolclass=InstrumentedPool,
+        pool_size=settings.DATABASE_POOL_SIZE,
+        max_overflow=settings.DATABASE_MAX_OVERFLOW,
+        pool_timeout=settings.DATABASE_POOL_TIMEOUT,
+        pool_recycle=settings.DATABASE_POOL_RECYCLE,
+        pool_pre_ping=settings.DATABASE_POOL_PRE_PING,
+        connect_args=get_connect_args(),
+    )
+
+
+def _create_sessionmaker(engine: AsyncEngine) -> async_sessionmaker[AsyncSession]:
+    return async_sessionmaker(
+        bind=engine,
+        class_=AsyncSession,
+        autocommit=False,
+        autoflush=False,
+        expire_on_commit=False,
+    )
+
+
+async_engine = _create_engine(DATABASE_URL)
+async_session = _create_sessionmaker(async_engine)
+
+replica_engine: AsyncEngine | None = None
+replica_session: async_sessionmaker[AsyncSession] | None = None
+if settings.DATABASE_REPLICA_URL:
+    replica_engine = _create_engine(settings.DATABASE_REPLICA_URL)
+    replica_session = _create_sessionmaker(replica_engine)
 
 
 class Base(DeclarativeBase):
@@ -46,9 +138,196 @@ class Base(DeclarativeBase):
         return {c.name: getattr(self, c.name) for c in self.__table__.columns}
 
 
+def pool_stats(engine: AsyncEngine | None = None) -> dict[str, Any]:
+    """
+    Returns a connection pool's current usage and checkout wait times,
+    the primary's by default.
+    """
+    pool = (engine or async_engine).pool
+    assert isinstance(pool, InstrumentedPool)
+
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "max_overflow": settings.DATABASE_MAX_OVERFLOW,
+        **asdict(pool.wait_stats),
+    }
+
+
+def _pool_gauges() -> Iterator[tuple[tuple[str, ...], float]]:
+    engines = {"primary": async_engine, "replica": replica_engine}
+    for name, engine in engines.items():
+        if engine is not None:
+            stats = pool_stats(engine)
+            for key in ("checked_in", "checked_out", "overflow"):
+                yield (name, key), stats[key]
+
+
+registry.register(
+    Gauge(
+        "db_pool_connections",
+        "Connections in the pool by engine and state.",
+        _pool_gauges,
+        ("engine", "state"),
+    )
+)
+
+
 async def get_db() -> AsyncGenerator[AsyncSession, None]:
+    """
+    Yields the request's session.
+
+    Sessions are lazy: a connection is only checked out of the pool by the
+    first statement, so requests that never query, e.g. cache hits or
+    failed validation, don't use one. It's held until the transaction ends,
+    use `release_connection` before slow work that doesn't need it.
+    """
     async with async_session() as session:
         yield session
 
 
 SessionDep = Annotated[AsyncSession, Depends(get_db)]
+
+
+async def release_connection(db_session: AsyncSession) -> None:
+    """
+    Returns a session's connection to the pool, ahead of slow work that
+    doesn't need it, like password hashing or calls to other services.
+
+    The session's read-only transaction is ended with a commit, so loaded
+    instances stay usable. The next statement checks out a connection again.
+    Raises RuntimeError when the session has pending changes, which the
+    commit would write.
+    """
+    if db_session.new or db_session.dirty or db_session.deleted:
+        raise RuntimeError("The session has pending changes.")
+
+    if db_session.in_transaction():
+        await db_session.commit()
+
+
+def get_session_factory() -> async_sessionmaker[AsyncSession]:
+    """
+    Returns the session factory, for work that outlives the request handler,
+    e.g. streaming a response body.
+    """
+    return async_session
+
+
+SessionFactoryDep = Annotated[
+    async_sessionmaker[AsyncSession], Depends(get_session_factory)
+]
+
+
+# Seconds the replica is behind the primary. It's 0 once all received WAL
+# has been replayed, since the last replay timestamp stops advancing when
+# the primary is idle.
+REPLICA_LAG_QUERY = text(
+    """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE coalesce(
+            extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0
+        )
+    END
+    """
+)
+
+_replica_usable = False
+_replica_checked_at: float | None = None
+_replica_check_lock = asyncio.Lock()
+
+
+async def _replica_lag(engine: AsyncEngine) -> float:
+    async with engine.connect() as connection:
+        result = await connection.execute(REPLICA_LAG_QUERY)
+        return float(result.scalar_one())
+
+
+async def _check_replica(engine: AsyncEngine) -> bool:
+    try:
+        lag = await asyncio.wait_for(
+            _replica_lag(engine), settings.DATABASE_REPLICA_CHECK_TIMEOUT
+        )
+    except (SQLAlchemyError, OSError, asyncio.TimeoutError):
+        logger.warning("Read replica is unavailable", exc_info=True)
+        return False
+
+    if lag > settings.DATABASE_REPLICA_MAX_LAG:
+        logger.warning("Read replica is %.1f seconds behind", lag)
+        return False
+
+    return True
+
+
+async def replica_is_usable() -> bool:
+    """
+    Tells whether reads can go to the replica.
+
+    The replica's health and lag are checked at most once per
+    `DATABASE_REPLICA_CHECK_INTERVAL`. Requests arriving during a check use
+    the previous result instead of waiting for it.
+    """
+    global _replica_usable, _replica_checked_at
+
+    if replica_engine is None:
+        return False
+
+    now = time.monotonic()
+    if (
+        _replica_checked_at is not None
+        and now - _replica_checked_at < settings.DATABASE_REPLICA_CHECK_INTERVAL
+    ) or _replica_check_lock.locked():
+        return _replica_usable
+
+    async with _replica_check_lock:
+        _replica_usable = await _check_replica(replica_engine)
+        _replica_checked_at = time.monotonic()
+
+    return _replica_usable
+
+
+def mark_replica_unusable() -> None:
+    """Routes reads to the primary until the next replica check."""
+    global _replica_usable, _replica_checked_at
+    _replica_usable = False
+    _replica_checked_at = time.monotonic()
+
+
+async def get_read_db(db_session: SessionDep) -> AsyncGenerator[AsyncSession, None]:
+    """
+    Yields a session on the read replica for read-only handlers, or the
+    request's primary session when there's no usable replica.
+
+    Data read this way may be up to `DATABASE_REPLICA_MAX_LAG` seconds old.
+    """
+    if replica_session is None or not await replica_is_usable():
+        yield db_session
+        return
+
+    async with replica_session() as session:
+        try:
+            yield session
+        except (SQLAlchemyError, OSError) as exc:
+            if isinstance(exc, OSError) or getattr(exc, "connection_invalidated", 0):
+                mark_replica_unusable()
+            raise
+
+
+ReadSessionDep = Annotated[AsyncSession, Depends(get_read_db)]
+
+
+async def get_read_session_factory() -> async_sessionmaker[AsyncSession]:
+    """Returns the replica's session factory, or the primary's as a fallback."""
+    if replica_session is None or not await replica_is_usable():
+        return async_session
+
+    return replica_session
+
+
+ReadSessionFactoryDep = Annotated[
+    async_sessionmaker[AsyncSession], Depends(get_read_session_factory)
+]
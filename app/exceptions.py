@@ -24,3 +24,53 @@ class PasswordResetTokenException(HTTPException):
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid or expired password reset token.",
         )
+
+
+class PasswordHasherBusyException(HTTPException):
+    """
+    Exception raised when the password hashing pool has no free queue slots.
+    """
+
+    def __init__(self, retry_after: int) -> None:
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="The server is busy, please try again later.",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+class RateLimitExceededException(HTTPException):
+    """
+    Exception raised when a client or account has used a route too often.
+    """
+
+    def __init__(self, retry_after: int) -> None:
+        super().__init__(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests, please try again later.",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+class EmailTakenException(HTTPException):
+    """
+    Exception raised when signing up with an email that's already registered.
+    """
+
+    def __init__(self, email: str) -> None:
+        super().__init__(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"User with email `{email}` already exists.",
+        )
+
+
+class GoogleTokenException(HTTPException):
+    """
+    Exception raised when Google's ID token for a sign-in could not be verified.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not verify the Google sign-in.",
+        )
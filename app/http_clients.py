@@ -0,0 +1,107 @@
+import importlib.util
+import time
+
+import httpx
+
+from app.config import settings
+from app.metrics import upstream_request_duration
+
+HUNTER = "hunter"
+GOOGLE = "google"
+
+UPSTREAMS = (HUNTER, GOOGLE)
+
+# HTTP/2 needs the optional `h2` package (`httpx[http2]`).
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+_clients: dict[str, httpx.AsyncClient] = {}
+_transports: dict[str, httpx.AsyncBaseTransport] = {}
+
+
+class TimedTransport(httpx.AsyncBaseTransport):
+    """Records how long an upstream takes to return the response headers."""
+
+    def __init__(self, name: str, transport: httpx.AsyncBaseTransport) -> None:
+        self.name = name
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        status = "error"
+        started = time.perf_counter()
+        try:
+            response = await self.transport.handle_async_request(request)
+            status = str(response.status_code)
+            return response
+        finally:
+            upstream_request_duration.observe(
+                time.perf_counter() - started, self.name, status
+            )
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+def _build_client(name: str) -> httpx.AsyncClient:
+    """Creates a pooled client for the given upstream."""
+    transport = _transports.get(name) or httpx.AsyncHTTPTransport(
+        http2=settings.HTTP_CLIENT_HTTP2 and HTTP2_AVAILABLE,
+        limits=httpx.Limits(
+            max_connections=settings.HTTP_CLIENT_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_CLIENT_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_CLIENT_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(
+            connect=settings.HTTP_CLIENT_CONNECT_TIMEOUT,
+            read=settings.HTTP_CLIENT_READ_TIMEOUT,
+            write=settings.HTTP_CLIENT_READ_TIMEOUT,
+            pool=settings.HTTP_CLIENT_POOL_TIMEOUT,
+        ),
+        transport=TimedTransport(name, transport),
+    )
+
+
+def get_http_client(name: str) -> httpx.AsyncClient:
+    """
+    Returns the long-lived client for an upstream, creating it on first use
+    when the application lifespan hasn't done so already.
+    """
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        client = _clients[name] = _build_client(name)
+
+    return client
+
+
+async def init_http_clients() -> None:
+    """Creates the clients for all upstreams."""
+    for name in UPSTREAMS:
+        get_http_client(name)
+
+
+async def close_http_clients() -> None:
+    """Closes all clients and their pooled connections."""
+    clients = list(_clients.values())
+    _clients.clear()
+
+    for client in clients:
+        await client.aclose()
+
+
+async def override_transport(
+    name: str, transport: httpx.AsyncBaseTransport | None
+) -> None:
+    """
+    Routes an upstream's requests through the given transport, e.g. an
+    `httpx.MockTransport` in tests. Pass `None` to restore the network one.
+    """
+    if transport is None:
+        _transports.pop(name, None)
+    else:
+        _transports[name] = transport
+
+    client = _clients.pop(name, None)
+    if client is not None:
+        await client.aclose()
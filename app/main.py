@@ -1,23 +1,61 @@
+import asyncio
 from collections.abc import AsyncIterator
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
 
 from fastapi import FastAPI
 from fastapi_cache import FastAPICache
 from fastapi_cache.backends.redis import RedisBackend
-from redis import asyncio as aioredis
 from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.gzip import GZipMiddleware
 
 from .api import api_router
+from .caching import CODERS, InstrumentedBackend, RevalidatingBackend, TieredBackend
 from .config import settings
+from .database.core import async_engine, async_session, replica_engine
+from .http_clients import close_http_clients, init_http_clients
+from .metrics import setup_metrics
+from .redis_client import close_redis, init_redis
+from .referral.graph import NUMPY_AVAILABLE, run_graph_sync
+from .responses import FastJSONResponse
+from .security import password_hasher
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncIterator[None]:
     # Startup
-    redis = aioredis.from_url(str(settings.REDIS_URL))
-    FastAPICache.init(RedisBackend(redis), prefix="fastapi-cache")
+    redis = init_redis()
+    backend = TieredBackend(
+        RevalidatingBackend(
+            RedisBackend(redis),
+            stale_ttl=settings.CACHE_STALE_TTL,
+            lock_timeout=settings.CACHE_LOCK_TIMEOUT,
+            beta=settings.CACHE_EARLY_REFRESH_BETA,
+        ),
+        maxsize=settings.CACHE_LOCAL_SIZE,
+        local_ttl=settings.CACHE_LOCAL_TTL,
+        jitter=settings.CACHE_TTL_JITTER,
+    )
+    FastAPICache.init(
+        InstrumentedBackend(backend),
+        prefix="fastapi-cache",
+        coder=CODERS[settings.CACHE_CODER],
+    )
+    password_hasher.start()
+    await init_http_clients()
+    graph_sync = None
+    if settings.REFERRAL_GRAPH_ENABLED:
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("REFERRAL_GRAPH_ENABLED needs the numpy package.")
+        graph_sync = asyncio.create_task(run_graph_sync(session_factory=async_session))
     yield
     # Shutdown
+    if graph_sync is not None:
+        graph_sync.cancel()
+        with suppress(asyncio.CancelledError):
+            await graph_sync
+    await close_http_clients()
+    await close_redis()
+    password_hasher.shutdown()
 
 
 # Initialize a FastAPI application with custom settings
@@ -27,6 +65,7 @@ app = FastAPI(
     docs_url=settings.DOCS_URL,
     openapi_url=settings.OPENAPI_URL,
     redoc_url=settings.REDOC_URL,
+    default_response_class=FastJSONResponse,
     lifespan=lifespan,
 )
 
@@ -41,5 +80,15 @@ app.add_middleware(
     allow_headers=settings.ALLOWED_HEADERS,
 )
 
+if settings.RESPONSE_GZIP_MIN_SIZE is not None:
+    app.add_middleware(
+        GZipMiddleware,
+        minimum_size=settings.RESPONSE_GZIP_MIN_SIZE,
+        compresslevel=settings.RESPONSE_GZIP_LEVEL,
+    )
+
+if settings.METRICS_ENABLED:
+    setup_metrics(app, engines={"primary": async_engine, "replica": replica_engine})
+
 # Include API router
 app.include_router(api_router, prefix=settings.API_V1_STR)
@@ -0,0 +1,286 @@
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from collections.abc import Callable, Iterable, Iterator
+from typing import Any
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.075,
+    0.1,
+    0.25,
+    0.5,
+    0.75,
+    1.0,
+    2.5,
+    5.0,
+    7.5,
+    10.0,
+)
+
+LabelValues = tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return f"{{{pairs}}}" if pairs else ""
+
+
+class Counter:
+    """A monotonically increasing value per label combination."""
+
+    type = "counter"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: LabelValues = ()
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: defaultdict[LabelValues, float] = defaultdict(float)
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        self._values[labels] += amount
+
+    def collect(self) -> Iterator[str]:
+        for labels, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+
+
+class Histogram:
+    """Observations counted into cumulative buckets per label combination."""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: LabelValues = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # One slot per bucket plus +Inf, summed up when collected.
+        self._counts: dict[LabelValues, list[int]] = {}
+        self._sums: defaultdict[LabelValues, float] = defaultdict(float)
+
+    def observe(self, value: float, *labels: str) -> None:
+        counts = self._counts.get(labels)
+        if counts is None:
+            counts = self._counts[labels] = [0] * (len(self.buckets) + 1)
+
+        counts[bisect_left(self.buckets, value)] += 1
+        self._sums[labels] += value
+
+    def collect(self) -> Iterator[str]:
+        names = (*self.labelnames, "le")
+        for labels, counts in self._counts.items():
+            total = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                total += count
+                bucket_labels = _format_labels(names, (*labels, str(bound)))
+                yield f"{self.name}_bucket{bucket_labels} {total}"
+            label_str = _format_labels(self.labelnames, labels)
+            yield f"{self.name}_sum{label_str} {self._sums[labels]}"
+            yield f"{self.name}_count{label_str} {total}"
+
+
+class Gauge:
+    """Values read from a callback at scrape time."""
+
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        callback: Callable[[], Iterable[tuple[LabelValues, float]]],
+        labelnames: LabelValues = (),
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.callback = callback
+
+    def collect(self) -> Iterator[str]:
+        for labels, value in self.callback():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+
+
+Metric = Counter | Histogram | Gauge
+
+
+class Registry:
+    """
+    Holds the metrics of this process and renders them in the Prometheus
+    text format.
+
+    Metrics are kept per process, so every uvicorn worker has to be
+    scraped on its own.
+    """
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Any:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.collect())
+
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests: Counter = registry.register(
+    Counter(
+        "http_requests_total",
+        "HTTP requests by route and status code.",
+        ("method", "route", "status"),
+    )
+)
+http_request_duration: Histogram = registry.register(
+    Histogram(
+        "http_request_duration_seconds",
+        "Time until the response has been sent, by route.",
+        ("method", "route"),
+    )
+)
+db_query_duration: Histogram = registry.register(
+    Histogram(
+        "db_query_duration_seconds",
+        "Database statement execution time, by engine and statement type.",
+        ("engine", "operation"),
+    )
+)
+db_query_errors: Counter = registry.register(
+    Counter(
+        "db_query_errors_total",
+        "Database statements that raised, by engine.",
+        ("engine",),
+    )
+)
+upstream_request_duration: Histogram = registry.register(
+    Histogram(
+        "upstream_request_duration_seconds",
+        "Outbound HTTP request time until the response headers, by upstream.",
+        ("upstream", "status"),
+    )
+)
+cache_requests: Counter = registry.register(
+    Counter(
+        "cache_requests_total",
+        "Response cache lookups by namespace and result.",
+        ("namespace", "result"),
+    )
+)
+password_hash_duration: Histogram = registry.register(
+    Histogram(
+        "password_hasher_duration_seconds",
+        "bcrypt time including the wait for a worker, by operation.",
+        ("operation",),
+        buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 2.0, 5.0),
+    )
+)
+
+
+class MetricsMiddleware:
+    """
+    Counts requests and records their latency by route template.
+
+    Written as a plain ASGI middleware, so it doesn't wrap the response body.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Routers store the matched route in the scope, unmatched paths
+            # are grouped so they can't blow up the label cardinality.
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            method = scope["method"]
+            http_requests.inc(method, path, str(status_code))
+            http_request_duration.observe(time.perf_counter() - started, method, path)
+
+
+def instrument_engine(engine: AsyncEngine, name: str) -> None:
+    """Records the duration of every statement run on the engine."""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(
+        conn: Any, cursor: Any, statement: str, *args: Any
+    ) -> None:
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(
+        conn: Any, cursor: Any, statement: str, *args: Any
+    ) -> None:
+        started = conn.info["query_started"].pop()
+        operation = statement.lstrip().split(None, 1)[0].upper()
+        db_query_duration.observe(time.perf_counter() - started, name, operation)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(context: Any) -> None:
+        started = context.connection and context.connection.info.get("query_started")
+        if started:
+            started.pop()
+        db_query_errors.inc(name)
+
+
+def setup_metrics(app: FastAPI, engines: dict[str, AsyncEngine | None]) -> None:
+    """
+    Adds the middleware and the /metrics endpoint to the application and
+    starts timing the statements of the given database engines.
+    """
+    for name, engine in engines.items():
+        if engine is not None:
+            instrument_engine(engine, name)
+
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics() -> PlainTextResponse:
+        return PlainTextResponse(registry.render(), media_type=CONTENT_TYPE)
@@ -0,0 +1,41 @@
+from datetime import datetime
+
+from sqlalchemy import DateTime, Index, Text, func, text
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database.core import Base
+
+
+class EmailOutbox(Base):
+    """
+    An email waiting to be handed to Celery by the outbox relay.
+
+    Rows are written in the transaction of the change that causes the email,
+    so it's sent if and only if that change is committed.
+    """
+
+    __tablename__ = "email_outbox"
+    __table_args__ = (
+        # The relay only ever looks at pending rows.
+        Index(
+            "ix_email_outbox_pending",
+            "id",
+            postgresql_where=text("sent_at IS NULL AND failed_at IS NULL"),
+        ),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    to_email: Mapped[str] = mapped_column(nullable=False)
+    subject: Mapped[str] = mapped_column(nullable=False)
+    body: Mapped[str] = mapped_column(Text, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
+    attempts: Mapped[int] = mapped_column(nullable=False, server_default="0")
+    next_attempt_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
+    sent_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
+    # Set once `OUTBOX_MAX_ATTEMPTS` publishes have failed.
+    failed_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
+    last_error: Mapped[str | None] = mapped_column(Text)
@@ -0,0 +1,172 @@
+import asyncio
+import logging
+from collections.abc import Callable
+from datetime import timedelta
+from typing import Any
+
+from kombu.exceptions import OperationalError
+from sqlalchemy import case, delete, func, literal, or_, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.auth.tasks import send_emails_bulk
+from app.config import settings
+
+from .models import EmailOutbox
+
+logger = logging.getLogger(__name__)
+
+# Longest wait between two publish attempts of a row.
+MAX_BACKOFF_SECONDS = 300
+
+Publisher = Callable[[list[dict[str, Any]]], None]
+
+
+def publish_emails(messages: list[dict[str, Any]]) -> None:
+    """Publishes one `send_emails_bulk` task, retrying broker connections."""
+    send_emails_bulk.apply_async(
+        args=[messages],
+        retry=True,
+        retry_policy={
+            "max_retries": 3,
+            "interval_start": 0,
+            "interval_step": 0.5,
+            "interval_max": 2,
+        },
+    )
+
+
+async def relay_batch(
+    *,
+    db_session: AsyncSession,
+    batch_size: int = settings.OUTBOX_BATCH_SIZE,
+    publish: Publisher = publish_emails,
+) -> int:
+    """
+    Publishes up to `batch_size` due emails as one Celery task and returns
+    how many were published.
+
+    The rows stay locked until they're marked as sent, and locked rows are
+    skipped, so relays running side by side never publish the same row.
+    A row can still be published twice when the commit fails after the
+    publish, the worker drops such duplicates by the row id. When the
+    publish fails, the rows are retried with exponential backoff, and
+    given up on after `OUTBOX_MAX_ATTEMPTS`.
+    """
+    query = (
+        select(EmailOutbox)
+        .where(
+            EmailOutbox.sent_at.is_(None),
+            EmailOutbox.failed_at.is_(None),
+            EmailOutbox.next_attempt_at <= func.now(),
+        )
+        .order_by(EmailOutbox.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    rows = (await db_session.scalars(query)).all()
+    if not rows:
+        await db_session.rollback()
+        return 0
+
+    ids = [row.id for row in rows]
+    messages = [
+        {
+            "id": row.id,
+            "to_email": row.to_email,
+            "subject": row.subject,
+            "body": row.body,
+        }
+        for row in rows
+    ]
+
+    error = None
+    try:
+        # Publishing is blocking, keep it off the event loop.
+        await asyncio.to_thread(publish, messages)
+    except (OperationalError, OSError) as e:
+        logger.warning("Failed to publish %d outbox emails: %s", len(ids), e)
+        error = str(e)
+
+    values: dict[str, Any]
+    if error is None:
+        values = {"sent_at": func.now()}
+    else:
+        backoff = func.least(func.power(2, EmailOutbox.attempts), MAX_BACKOFF_SECONDS)
+        values = {
+            "next_attempt_at": func.now() + literal(timedelta(seconds=1)) * backoff,
+            "failed_at": case(
+                (
+                    EmailOutbox.attempts + 1 >= settings.OUTBOX_MAX_ATTEMPTS,
+                    func.now(),
+                ),
+                else_=None,
+            ),
+            "last_error": error,
+        }
+
+    await db_session.execute(
+        update(EmailOutbox)
+        .where(EmailOutbox.id.in_(ids))
+        .values(attempts=EmailOutbox.attempts + 1, **values)
+        .execution_options(synchronize_session=False)
+    )
+    await db_session.commit()
+
+    return len(ids) if error is None else 0
+
+
+async def purge_outbox(*, db_session: AsyncSession, older_than: timedelta) -> int:
+    """
+    Deletes the rows of emails sent or given up on longer than `older_than`
+    ago, logging how many of them were never sent.
+    """
+    cutoff = func.now() - older_than
+    result = await db_session.execute(
+        delete(EmailOutbox)
+        .where(or_(EmailOutbox.sent_at < cutoff, EmailOutbox.failed_at < cutoff))
+        .returning(EmailOutbox.sent_at)
+    )
+    sent_at = result.scalars().all()
+    await db_session.commit()
+
+    failed = sum(1 for value in sent_at if value is None)
+    if failed:
+        logger.warning("Purged %d outbox emails that were never sent", failed)
+
+    return len(sent_at)
+
+
+async def run_relay(
+    *,
+    session_factory: async_sessionmaker[AsyncSession],
+    stop: asyncio.Event | None = None,
+) -> None:
+    """
+    Relays outbox emails until `stop` is set.
+
+    Full batches are followed by the next one right away, otherwise the
+    outbox is polled every `OUTBOX_POLL_INTERVAL` seconds.
+    """
+    stop = stop or asyncio.Event()
+    retention = timedelta(days=settings.OUTBOX_RETENTION_DAYS)
+    purged_at: float | None = None
+    loop = asyncio.get_running_loop()
+
+    while not stop.is_set():
+        try:
+            async with session_factory() as db_session:
+                published = await relay_batch(db_session=db_session)
+
+                if purged_at is None or loop.time() - purged_at > 60 * 60:
+                    await purge_outbox(db_session=db_session, older_than=retention)
+                    purged_at = loop.time()
+        except (OSError, SQLAlchemyError):
+            logger.exception("Outbox relay failed, retrying")
+            published = 0
+
+        if published < settings.OUTBOX_BATCH_SIZE:
+            try:
+                await asyncio.wait_for(stop.wait(), settings.OUTBOX_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
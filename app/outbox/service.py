@@ -0,0 +1,14 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import EmailOutbox
+
+
+def enqueue_email(
+    *, db_session: AsyncSession, to_email: str, subject: str, body: str
+) -> None:
+    """
+    Adds an email to the outbox, to be sent once the session is committed.
+
+    Doesn't commit, so the email is part of the caller's transaction.
+    """
+    db_session.add(EmailOutbox(to_email=to_email, subject=subject, body=body))
@@ -0,0 +1,140 @@
+import logging
+import math
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+
+from fastapi import Request
+from redis.exceptions import RedisError, WatchError
+
+from app.config import settings
+from app.exceptions import RateLimitExceededException
+from app.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_KEY = "rate-limit:{route}:{kind}:{subject}"
+
+# Optimistic transactions retried on a concurrent update of the same bucket.
+MAX_ATTEMPTS = 5
+
+
+@dataclass(frozen=True)
+class Rate:
+    """
+    A token bucket holding `requests` tokens, refilled at `requests` per
+    `seconds`.
+    """
+
+    requests: int
+    seconds: float
+
+    @classmethod
+    def parse(cls, value: str) -> "Rate":
+        """Parses a "<requests>/<seconds>" string, e.g. "10/60"."""
+        requests, seconds = value.split("/")
+        rate = cls(int(requests), float(seconds))
+        if rate.requests < 1 or rate.seconds <= 0:
+            raise ValueError(f"Invalid rate {value!r}.")
+
+        return rate
+
+    @property
+    def interval(self) -> float:
+        """Seconds it takes to refill one token."""
+        return self.seconds / self.requests
+
+
+IP_RATE = Rate.parse(settings.RATE_LIMIT_AUTH_IP)
+ACCOUNT_RATE = Rate.parse(settings.RATE_LIMIT_AUTH_ACCOUNT)
+
+
+async def _take(buckets: dict[str, Rate]) -> float:
+    """
+    Takes a token from every bucket, or from none of them when one is
+    empty. Returns 0 or the seconds until the empty bucket has a token.
+
+    The buckets are kept as GCRA "theoretical arrival times": a single
+    timestamp per bucket that moves `interval` into the future per token
+    taken, and mustn't get more than `seconds` ahead of now. They're
+    updated in a WATCH/MULTI transaction, which needs no server-side
+    scripting.
+    """
+    redis = get_redis()
+    if redis is None:
+        return 0.0
+
+    keys = list(buckets)
+    async with redis.pipeline(transaction=True) as pipe:
+        for _ in range(MAX_ATTEMPTS):
+            try:
+                await pipe.watch(*keys)
+                stored = await pipe.mget(keys)
+                now = time.time()
+
+                arrivals = {}
+                wait = 0.0
+                for (key, rate), value in zip(buckets.items(), stored):
+                    arrival = max(float(value or 0), now) + rate.interval
+                    wait = max(wait, arrival - rate.seconds - now)
+                    arrivals[key] = arrival
+
+                if wait > 0:
+                    return wait
+
+                pipe.multi()
+                for key, arrival in arrivals.items():
+                    pipe.set(key, repr(arrival), px=math.ceil((arrival - now) * 1000))
+                await pipe.execute()
+                return 0.0
+            except WatchError:
+                continue
+
+    # Only requests for the same bucket race each other, so it's busy.
+    return min(rate.interval for rate in buckets.values())
+
+
+async def check_rate_limit(route: str, **subjects: tuple[str, Rate]) -> None:
+    """
+    Raises `RateLimitExceededException` when a route has been used too
+    often by any of the given subjects, e.g. `ip=(address, IP_RATE)`.
+
+    Fails open: requests aren't limited when Redis isn't reachable.
+    """
+    if not settings.RATE_LIMIT_ENABLED:
+        return
+
+    buckets = {
+        RATE_LIMIT_KEY.format(route=route, kind=kind, subject=subject): rate
+        for kind, (subject, rate) in subjects.items()
+    }
+
+    try:
+        wait = await _take(buckets)
+    except RedisError:
+        logger.warning("Failed to check the rate limit of %s", route, exc_info=True)
+        return
+
+    if wait > 0:
+        raise RateLimitExceededException(math.ceil(wait))
+
+
+async def check_account_rate_limit(route: str, account: str | int) -> None:
+    """Limits how often a route is used for one account, wherever from."""
+    await check_rate_limit(route, account=(str(account).lower(), ACCOUNT_RATE))
+
+
+def limit_by_ip(route: str) -> Callable[[Request], Awaitable[None]]:
+    """
+    Returns a dependency that limits how often a client address uses a
+    route. It runs before the request body is validated.
+
+    Behind a reverse proxy, run uvicorn with `--proxy-headers` and
+    `--forwarded-allow-ips`, so that the client address is the original one.
+    """
+
+    async def dependency(request: Request) -> None:
+        host = request.client.host if request.client else "unknown"
+        await check_rate_limit(route, ip=(host, IP_RATE))
+
+    return dependency
@@ -0,0 +1,26 @@
+from redis import asyncio as aioredis
+
+from app.config import settings
+
+_redis: aioredis.Redis | None = None
+
+
+def init_redis(redis: aioredis.Redis | None = None) -> aioredis.Redis:
+    """Sets up the shared Redis connection, creating one from settings if needed."""
+    global _redis
+    _redis = redis if redis is not None else aioredis.from_url(str(settings.REDIS_URL))
+
+    return _redis
+
+
+def get_redis() -> aioredis.Redis | None:
+    """Returns the shared Redis connection, or None if it hasn't been set up."""
+    return _redis
+
+
+async def close_redis() -> None:
+    """Closes the shared Redis connection."""
+    global _redis
+    if _redis is not None:
+        await _redis.close()
+        _redis = None
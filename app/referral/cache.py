@@ -0,0 +1,107 @@
+import logging
+import uuid
+from collections.abc import Callable
+from typing import Any
+
+from redis.exceptions import RedisError
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app.caching import LRUCache
+from app.config import settings
+from app.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Cached responses are keyed by a version that's bumped whenever the data
+# behind them changes, so they can be kept for hours. Old versions are
+# left to expire.
+REFERRALS_NAMESPACE = "referrals"
+REFERRAL_CODE_NAMESPACE = "referral-code"
+
+# Versions are reused for CACHE_LOCAL_TTL seconds, so that hits on the
+# in-process tier of the response cache don't need a round trip either.
+_versions: LRUCache[str, int] = LRUCache(settings.CACHE_LOCAL_SIZE)
+
+
+def _version_key(namespace: str, subject: Any) -> str:
+    return f"cache-version:{namespace}:{subject}"
+
+
+async def _versioned_key(namespace: str, prefix: str, subject: Any) -> str:
+    redis = get_redis()
+    if redis is None:
+        return f"{prefix}:{subject}:v0"
+
+    version_key = _version_key(namespace, subject)
+    version = _versions.get(version_key)
+    if version is None:
+        try:
+            version = int(await redis.get(version_key) or 0)
+        except RedisError:
+            logger.warning("Failed to read a cache version", exc_info=True)
+            # A key that's never read again, so the request bypasses the cache.
+            return f"{prefix}:{subject}:{uuid.uuid4().hex}"
+
+        if settings.CACHE_LOCAL_TTL > 0:
+            _versions.set(version_key, version, settings.CACHE_LOCAL_TTL)
+
+    return f"{prefix}:{subject}:v{version}"
+
+
+async def referrals_key_builder(
+    func: Callable[..., Any],
+    namespace: str = "",
+    *,
+    request: Request | None = None,
+    response: Response | None = None,
+    args: tuple[Any, ...],
+    kwargs: dict[str, Any],
+) -> str:
+    """Builds the cache key of a referer's referral list."""
+    return await _versioned_key(REFERRALS_NAMESPACE, namespace, kwargs["referer_id"])
+
+
+async def referral_code_key_builder(
+    func: Callable[..., Any],
+    namespace: str = "",
+    *,
+    request: Request | None = None,
+    response: Response | None = None,
+    args: tuple[Any, ...],
+    kwargs: dict[str, Any],
+) -> str:
+    """Builds the cache key of a user's referral code, looked up by email."""
+    return await _versioned_key(REFERRAL_CODE_NAMESPACE, namespace, kwargs["email"])
+
+
+async def _bump(namespace: str, subject: Any) -> None:
+    redis = get_redis()
+    if redis is None:
+        return
+
+    version_key = _version_key(namespace, subject)
+    _versions.delete(version_key)
+    try:
+        version = await redis.incr(version_key)
+    except RedisError:
+        logger.warning("Failed to bump a cache version", exc_info=True)
+        return
+
+    if settings.CACHE_LOCAL_TTL > 0:
+        _versions.set(version_key, version, settings.CACHE_LOCAL_TTL)
+
+
+async def invalidate_referrals(referer_id: int) -> None:
+    """Drops the cached referral list of a referer."""
+    await _bump(REFERRALS_NAMESPACE, referer_id)
+
+
+async def invalidate_referral_code(email: str) -> None:
+    """Drops the cached referral code of a user."""
+    await _bump(REFERRAL_CODE_NAMESPACE, email)
+
+
+def clear_local_versions() -> None:
+    """Forgets the cache versions kept in process memory."""
+    _versions.clear()
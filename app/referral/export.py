@@ -0,0 +1,99 @@
+import csv
+import io
+import json
+import zlib
+from collections.abc import AsyncIterator, Sequence
+from typing import Any, Literal
+
+from sqlalchemy import Row, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import aliased
+
+from app.auth.models import User
+
+ExportFormat = Literal["ndjson", "csv"]
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+# Rows fetched from the server-side cursor per round trip.
+EXPORT_BATCH_SIZE = 5000
+
+COLUMNS = (
+    "referer_id",
+    "referer_email",
+    "user_id",
+    "email",
+    "referral_code",
+    "referral_code_exp",
+)
+
+
+def _encode_ndjson(rows: Sequence[Row[Any]]) -> bytes:
+    lines = []
+    for row in rows:
+        values = dict(zip(COLUMNS, row))
+        if values["referral_code_exp"] is not None:
+            values["referral_code_exp"] = values["referral_code_exp"].isoformat()
+        lines.append(json.dumps(values) + "\n")
+
+    return "".join(lines).encode()
+
+
+def _encode_csv(rows: Sequence[Row[Any]]) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+
+    return buffer.getvalue().encode()
+
+
+async def stream_referrals(
+    *,
+    session_factory: async_sessionmaker[AsyncSession],
+    file_format: ExportFormat,
+    referer_id: int | None = None,
+    compress: bool = False,
+) -> AsyncIterator[bytes]:
+    """
+    Streams all referer/referred user pairs, ordered by the referred user id.
+
+    Plain columns are read through a server-side cursor in batches of
+    `EXPORT_BATCH_SIZE`, so memory use stays flat regardless of the number
+    of rows. Opens its own session, since the body is sent after the
+    request's dependencies are torn down.
+    """
+    referer = aliased(User)
+    query = (
+        select(
+            referer.id,
+            referer.email,
+            User.id,
+            User.email,
+            User.referral_code,
+            User.referral_code_exp,
+        )
+        .join(referer, referer.id == User.referer_id)
+        .order_by(User.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    if referer_id is not None:
+        query = query.where(User.referer_id == referer_id)
+
+    encode = _encode_ndjson if file_format == "ndjson" else _encode_csv
+    # wbits=31 writes a gzip header and trailer.
+    compressor = zlib.compressobj(wbits=31) if compress else None
+
+    def output(chunk: bytes) -> bytes:
+        return compressor.compress(chunk) if compressor else chunk
+
+    if file_format == "csv":
+        yield output(_encode_csv([COLUMNS]))  # type: ignore[list-item]
+
+    async with session_factory() as db_session:
+        result = await db_session.stream(query)
+        async for rows in result.partitions():
+            # The compressor buffers small inputs and returns nothing.
+            if chunk := output(encode(rows)):
+                yield chunk
+
+    if compressor is not None:
+        yield compressor.flush()
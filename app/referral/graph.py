@@ -0,0 +1,392 @@
+"""
+In-memory snapshot of the referral forest, for whole-graph analytics.
+
+Needs the optional `numpy` package and `REFERRAL_GRAPH_ENABLED`. Each
+process loads `(id, referer_id)` of all users once, then follows the
+changes published to a Redis stream by `publish_graph_change`.
+"""
+
+import asyncio
+import importlib.util
+import logging
+import time
+from collections.abc import Iterator
+from typing import Any
+
+from redis.exceptions import RedisError
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.auth.models import User
+from app.config import settings
+from app.redis_client import get_redis
+
+NUMPY_AVAILABLE = importlib.util.find_spec("numpy") is not None
+
+if NUMPY_AVAILABLE:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+GRAPH_EVENTS_KEY = "referral-graph:events"
+
+# `parent` values of users without a referer, and of ids without a user.
+NO_REFERER = -1
+ABSENT = -2
+
+# Edges added since the last CSR build are compacted into it once there
+# are more than this many, or this fraction of the users.
+COMPACT_MIN_EDGES = 10_000
+COMPACT_RATIO = 0.01
+
+
+class ReferralGraph:
+    """
+    The referral forest as arrays indexed by user id.
+
+    `parent` holds each user's referer, `depth` the number of referers
+    above it and `size` the user plus its whole downline. The children of
+    user `u` are `indices[offsets[u]:offsets[u + 1]]` (CSR), plus those
+    added since the last build, which are kept aside until compacted.
+    Sizes and depths are kept up to date on every change.
+    """
+
+    def __init__(self, parent: "np.ndarray[Any, Any]") -> None:
+        self.parent = parent.astype(np.int32)
+        self._build_csr()
+        self._build_aggregates()
+
+    @classmethod
+    def from_edges(
+        cls, ids: "np.ndarray[Any, Any]", referer_ids: "np.ndarray[Any, Any]"
+    ) -> "ReferralGraph":
+        """Builds the graph from user ids and their referers' (-1 for none)."""
+        parent = np.full(int(ids.max()) + 1 if ids.size else 0, ABSENT, np.int32)
+        parent[ids] = referer_ids
+
+        return cls(parent)
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (self.parent, self.depth, self.size, self.offsets, self.indices)
+        return sum(array.nbytes for array in arrays)
+
+    @property
+    def users(self) -> int:
+        return int(np.count_nonzero(self.parent != ABSENT))
+
+    def __contains__(self, user_id: int) -> bool:
+        return 0 <= user_id < len(self.parent) and self.parent[user_id] != ABSENT
+
+    def _build_csr(self) -> None:
+        children = np.flatnonzero(self.parent >= 0).astype(np.int32)
+        parents = self.parent[children]
+        self.indices = children[np.argsort(parents, kind="stable")]
+        self.offsets = np.zeros(len(self.parent) + 1, np.int64)
+        np.cumsum(
+            np.bincount(parents, minlength=len(self.parent)), out=self.offsets[1:]
+        )
+
+        self._extra: dict[int, list[int]] = {}
+        self._extra_edges = 0
+        self._extra_parents: "np.ndarray[Any, Any] | None" = None
+
+    def _build_aggregates(self) -> None:
+        self.depth = np.zeros(len(self.parent), np.int32)
+        self.size = (self.parent != ABSENT).astype(np.int32)
+
+        roots = np.flatnonzero(self.parent == NO_REFERER).astype(np.int32)
+        levels = list(self._levels(roots))
+        for depth, level in enumerate(levels):
+            self.depth[level] = depth
+
+        # Bottom up, adding each level to the parents above it. Right after a
+        # build, the children of every parent are next to each other.
+        for level in reversed(levels[1:]):
+            parents = self.parent[level]
+            starts = np.flatnonzero(np.r_[True, parents[1:] != parents[:-1]])
+            self.size[parents[starts]] += np.add.reduceat(self.size[level], starts)
+
+    def _children(self, nodes: "np.ndarray[Any, Any]") -> "np.ndarray[Any, Any]":
+        """
+        Returns the children of all nodes. Those in the CSR arrays come
+        first, grouped by parent in the order of `nodes`.
+        """
+        starts = self.offsets[nodes]
+        lengths = self.offsets[nodes + 1] - starts
+        total = int(lengths.sum())
+        children = np.empty(0, np.int32)
+        if total:
+            # Every child's position is its segment's start plus its rank in it.
+            segment_starts = np.cumsum(lengths) - lengths
+            positions = np.arange(total) + np.repeat(starts - segment_starts, lengths)
+            children = self.indices[positions]
+
+        if self._extra:
+            if self._extra_parents is None:
+                self._extra_parents = np.fromiter(self._extra, np.int32)
+            hits = nodes[np.isin(nodes, self._extra_parents)]
+            extra = [np.array(self._extra[int(p)], np.int32) for p in hits]
+            children = np.concatenate([children, *extra])
+
+        return children
+
+    def _levels(
+        self, start: "np.ndarray[Any, Any]", max_depth: int | None = None
+    ) -> Iterator["np.ndarray[Any, Any]"]:
+        """Yields `start`, then its children, grandchildren and so on."""
+        frontier = start
+        depth = 0
+        while frontier.size and (max_depth is None or depth <= max_depth):
+            yield frontier
+            frontier = self._children(frontier)
+            depth += 1
+
+    def depth_of(self, user_id: int) -> int:
+        """Number of referral levels above a user."""
+        return int(self.depth[user_id])
+
+    def downline_size(self, user_id: int) -> int:
+        """Number of users below a user, on all levels."""
+        return int(self.size[user_id]) - 1
+
+    def level_counts(self, user_id: int, max_depth: int | None = None) -> list[int]:
+        """Number of users on each level below a user, from depth 1 on."""
+        levels = self._levels(np.array([user_id], np.int32), max_depth)
+        next(levels)
+
+        return [len(level) for level in levels]
+
+    def aggregates(self) -> dict[str, "np.ndarray[Any, Any]"]:
+        """The id, depth and downline size of every user, as arrays."""
+        ids = np.flatnonzero(self.parent != ABSENT)
+
+        return {"id": ids, "depth": self.depth[ids], "downline": self.size[ids] - 1}
+
+    def _ensure_capacity(self, length: int) -> None:
+        current = len(self.parent)
+        if length <= current:
+            return
+
+        grown = max(length, current + current // 4 + 1024)
+        extra = grown - current
+        self.parent = np.concatenate([self.parent, np.full(extra, ABSENT, np.int32)])
+        self.depth = np.concatenate([self.depth, np.zeros(extra, np.int32)])
+        self.size = np.concatenate([self.size, np.zeros(extra, np.int32)])
+        self.offsets = np.concatenate(
+            [self.offsets, np.full(extra, self.offsets[-1], np.int64)]
+        )
+
+    def add_user(self, user_id: int, referer_id: int | None = None) -> None:
+        """Adds a new user, doing nothing if it's already there."""
+        if user_id not in self:
+            self._ensure_capacity(user_id + 1)
+            self.parent[user_id] = NO_REFERER
+            self.depth[user_id] = 0
+            self.size[user_id] = 1
+
+        if referer_id is not None:
+            self.set_referer(user_id, referer_id)
+
+    def set_referer(self, user_id: int, referer_id: int) -> None:
+        """
+        Moves a user without a referer, and its downline, below a referer.
+        Does nothing if the referer is already set.
+
+        Raises `ValueError` for unknown users, users that already have
+        another referer, and referers in the user's own downline.
+        """
+        if user_id not in self or referer_id not in self:
+            raise ValueError(f"Unknown user {user_id} or referer {referer_id}.")
+        if self.parent[user_id] == referer_id:
+            return
+        if self.parent[user_id] != NO_REFERER:
+            raise ValueError(f"User {user_id} already has a referer.")
+
+        ancestors = [referer_id]
+        while (ancestor := int(self.parent[ancestors[-1]])) >= 0:
+            ancestors.append(ancestor)
+        if user_id in ancestors:
+            raise ValueError(f"User {referer_id} is in the downline of {user_id}.")
+
+        shift = self.depth[referer_id] + 1
+        if self.size[user_id] == 1:
+            # Most often a new user, skip the traversal.
+            self.depth[user_id] += shift
+        else:
+            for level in self._levels(np.array([user_id], np.int32)):
+                self.depth[level] += shift
+        self.size[ancestors] += self.size[user_id]
+
+        self.parent[user_id] = referer_id
+        if referer_id not in self._extra:
+            self._extra[referer_id] = []
+            self._extra_parents = None
+        self._extra[referer_id].append(user_id)
+        self._extra_edges += 1
+        if self._extra_edges > max(COMPACT_MIN_EDGES, COMPACT_RATIO * len(self.parent)):
+            self._build_csr()
+
+
+_graph: "ReferralGraph | None" = None
+
+
+def get_graph() -> ReferralGraph | None:
+    """Returns this process' referral graph, or None until it's loaded."""
+    return _graph
+
+
+async def load_graph(*, db_session: AsyncSession, batch_size: int) -> ReferralGraph:
+    """
+    Reads the referer of every user, in batches of `batch_size` using keyset
+    pagination on the primary key, and builds the graph off the event loop.
+    """
+    id_batches, referer_batches = [], []
+    last_id = None
+    while True:
+        query = (
+            select(User.id, func.coalesce(User.referer_id, NO_REFERER))
+            .order_by(User.id)
+            .limit(batch_size)
+        )
+        if last_id is not None:
+            query = query.where(User.id > last_id)
+
+        rows = (await db_session.execute(query)).all()
+        if not rows:
+            break
+
+        batch = np.array(rows, np.int32)
+        id_batches.append(batch[:, 0])
+        referer_batches.append(batch[:, 1])
+        last_id = int(batch[-1, 0])
+
+    # The rows aren't needed anymore, don't keep the connection meanwhile.
+    await db_session.commit()
+
+    if not id_batches:
+        return ReferralGraph(np.empty(0, np.int32))
+
+    ids, referer_ids = np.concatenate(id_batches), np.concatenate(referer_batches)
+
+    return await asyncio.to_thread(ReferralGraph.from_edges, ids, referer_ids)
+
+
+async def _publish(fields: dict[str, Any]) -> None:
+    redis = get_redis()
+    if not settings.REFERRAL_GRAPH_ENABLED or redis is None:
+        return
+
+    try:
+        await redis.xadd(
+            GRAPH_EVENTS_KEY,
+            fields,
+            maxlen=settings.REFERRAL_GRAPH_EVENTS_MAXLEN,
+            approximate=True,
+        )
+    except RedisError:
+        # Picked up by the next periodic reload.
+        logger.warning("Failed to publish a referral graph change", exc_info=True)
+
+
+async def publish_graph_change(user_id: int, referer_id: int | None) -> None:
+    """Tells every process' graph about a new user or a newly set referer."""
+    await _publish({"user": user_id, "referer": referer_id or ""})
+
+
+async def request_graph_reload() -> None:
+    """Has every process reload its graph, e.g. after a bulk import."""
+    await _publish({"reload": 1})
+
+
+def _apply(graph: ReferralGraph, fields: dict[bytes, bytes]) -> bool:
+    """Applies one change, returns False when the graph must be reloaded."""
+    if b"reload" in fields:
+        return False
+
+    try:
+        referer = fields[b"referer"]
+        graph.add_user(int(fields[b"user"]), int(referer) if referer else None)
+    except (KeyError, ValueError):
+        logger.warning("Referral graph is out of sync, reloading", exc_info=True)
+        return False
+
+    return True
+
+
+async def _follow(graph: ReferralGraph, last_id: bytes, stop: asyncio.Event) -> None:
+    """
+    Applies published changes until a reload is due.
+
+    The stream is trimmed to about `REFERRAL_GRAPH_EVENTS_MAXLEN` changes, a
+    process that falls further behind misses some until its next reload.
+    """
+    redis = get_redis()
+    reload_at = time.monotonic() + settings.REFERRAL_GRAPH_RELOAD_INTERVAL
+    while not stop.is_set() and time.monotonic() < reload_at:
+        if redis is None:
+            await asyncio.sleep(1)
+            continue
+
+        response = await redis.xread(
+            {GRAPH_EVENTS_KEY: last_id}, count=1000, block=1000
+        )
+        for _, entries in response:
+            for entry_id, fields in entries:
+                if not _apply(graph, fields):
+                    return
+                last_id = entry_id
+
+
+async def _latest_event_id() -> bytes:
+    redis = get_redis()
+    if redis is None:
+        return b"0-0"
+
+    latest = await redis.xrevrange(GRAPH_EVENTS_KEY, count=1)
+    return latest[0][0] if latest else b"0-0"
+
+
+async def run_graph_sync(
+    *,
+    session_factory: async_sessionmaker[AsyncSession],
+    stop: asyncio.Event | None = None,
+) -> None:
+    """
+    Loads this process' graph and keeps it up to date until `stop` is set.
+
+    The graph is reloaded from Postgres when asked to, when it turns out
+    to be out of sync and every `REFERRAL_GRAPH_RELOAD_INTERVAL` seconds,
+    which reconciles changes that failed to be published. While it can't
+    be kept up to date, and once this stops, there's no graph and reads
+    fall back to SQL.
+    """
+    global _graph
+
+    stop = stop or asyncio.Event()
+    try:
+        while not stop.is_set():
+            try:
+                # Changes made while loading are applied again, which is harmless.
+                last_id = await _latest_event_id()
+                async with session_factory() as db_session:
+                    started = time.perf_counter()
+                    _graph = await load_graph(
+                        db_session=db_session,
+                        batch_size=settings.REFERRAL_GRAPH_LOAD_BATCH_SIZE,
+                    )
+                logger.info(
+                    "Loaded the referral graph of %d users in %.1fs",
+                    _graph.users,
+                    time.perf_counter() - started,
+                )
+                await _follow(_graph, last_id, stop)
+            except Exception:
+                _graph = None
+                logger.exception("Referral graph sync failed, retrying")
+                try:
+                    await asyncio.wait_for(stop.wait(), 5)
+                except asyncio.TimeoutError:
+                    pass
+    finally:
+        _graph = None
@@ -0,0 +1,161 @@
+import logging
+
+from fastapi import HTTPException, status
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.auth.models import User
+from app.redis_client import get_redis
+
+from .models import Leaderboard, LeaderboardEntry
+
+logger = logging.getLogger(__name__)
+
+LEADERBOARD_KEY = "referrals:leaderboard"
+
+# While a rebuild runs, referrals are also counted in the delta key, which
+# is added to the rebuilt scores when they're swapped in.
+REBUILD_KEY = f"{LEADERBOARD_KEY}:rebuild"
+REBUILD_DELTA_KEY = f"{LEADERBOARD_KEY}:rebuild-delta"
+REBUILDING_KEY = f"{LEADERBOARD_KEY}:rebuilding"
+
+# Refreshed after every batch, so a crashed rebuild stops the double writes.
+REBUILDING_TTL = 10 * 60
+
+
+async def record_referral(referer_id: int) -> None:
+    """
+    Adds one referral to a referer's leaderboard score.
+
+    Failures are only logged, `rebuild_leaderboard` reconciles missed updates.
+    """
+    redis = get_redis()
+    if redis is None:
+        return
+
+    try:
+        async with redis.pipeline(transaction=False) as pipe:
+            _, rebuilding = await (
+                pipe.zincrby(LEADERBOARD_KEY, 1, referer_id)
+                .exists(REBUILDING_KEY)
+                .execute()
+            )
+        if rebuilding:
+            async with redis.pipeline(transaction=False) as pipe:
+                await (
+                    pipe.zincrby(REBUILD_DELTA_KEY, 1, referer_id)
+                    .expire(REBUILD_DELTA_KEY, REBUILDING_TTL)
+                    .execute()
+                )
+    except RedisError:
+        logger.warning("Failed to update the referral leaderboard", exc_info=True)
+
+
+def _unavailable() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="The leaderboard is temporarily unavailable.",
+    )
+
+
+async def get_leaderboard(*, limit: int, user_id: int | None) -> Leaderboard:
+    """Returns the top referers and, optionally, the rank of a given user."""
+    redis = get_redis()
+    if redis is None:
+        raise _unavailable()
+
+    try:
+        return await _read_leaderboard(redis, limit=limit, user_id=user_id)
+    except RedisError:
+        logger.warning("Failed to read the referral leaderboard", exc_info=True)
+        raise _unavailable()
+
+
+async def _read_leaderboard(
+    redis: aioredis.Redis, *, limit: int, user_id: int | None
+) -> Leaderboard:
+    top = await redis.zrevrange(LEADERBOARD_KEY, 0, limit - 1, withscores=True)
+    leaderboard = Leaderboard(
+        top=[
+            LeaderboardEntry(user_id=int(member), referrals=int(score), rank=rank)
+            for rank, (member, score) in enumerate(top, start=1)
+        ]
+    )
+
+    if user_id is not None:
+        async with redis.pipeline(transaction=False) as pipe:
+            rank, score = await (
+                pipe.zrevrank(LEADERBOARD_KEY, user_id)
+                .zscore(LEADERBOARD_KEY, user_id)
+                .execute()
+            )
+        if rank is not None:
+            leaderboard.user = LeaderboardEntry(
+                user_id=user_id, referrals=int(score), rank=rank + 1
+            )
+
+    return leaderboard
+
+
+async def rebuild_leaderboard(*, db_session: AsyncSession, batch_size: int) -> int:
+    """
+    Recomputes the leaderboard from Postgres and swaps it in atomically.
+
+    Referers are read in batches of `batch_size` using keyset pagination on
+    the referer_id index, all from one snapshot. Referrals recorded after
+    it was taken are added on top when swapping. Returns the number of
+    referers on the leaderboard.
+    """
+    redis = get_redis()
+    if redis is None:
+        raise RuntimeError("Redis is not initialized.")
+
+    await redis.delete(REBUILD_KEY, REBUILD_DELTA_KEY)
+    await redis.set(REBUILDING_KEY, 1, ex=REBUILDING_TTL)
+
+    # The snapshot starts after the double writes, so no referral is missed.
+    # One committed in between is counted twice until the next rebuild.
+    await db_session.connection(
+        execution_options={"isolation_level": "REPEATABLE READ"}
+    )
+
+    total = 0
+    last_referer_id = None
+    while True:
+        query = (
+            select(User.referer_id, func.count())
+            .where(User.referer_id.is_not(None))
+            .group_by(User.referer_id)
+            .order_by(User.referer_id)
+            .limit(batch_size)
+        )
+        if last_referer_id is not None:
+            query = query.where(User.referer_id > last_referer_id)
+
+        result = await db_session.execute(query)
+        rows = result.all()
+        if not rows:
+            break
+
+        async with redis.pipeline(transaction=False) as pipe:
+            scores = {referer_id: count for referer_id, count in rows}
+            await (
+                pipe.zadd(REBUILD_KEY, scores)
+                .expire(REBUILDING_KEY, REBUILDING_TTL)
+                .execute()
+            )
+        total += len(rows)
+        last_referer_id = rows[-1][0]
+
+    await db_session.commit()
+
+    async with redis.pipeline(transaction=True) as pipe:
+        await (
+            pipe.zunionstore(LEADERBOARD_KEY, [REBUILD_KEY, REBUILD_DELTA_KEY])
+            .delete(REBUILD_KEY, REBUILD_DELTA_KEY, REBUILDING_KEY)
+            .execute()
+        )
+
+    return total
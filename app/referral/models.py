@@ -1,21 +1,94 @@
-from pydantic import Field
-from app.models import PydanticBase
+from pydantic import computed_field
+from sqlalchemy import ForeignKey, Index
+from sqlalchemy.orm import Mapped, mapped_column
 
+from app.auth.models import UserRead
 from app.config import settings
+from app.database.core import Base
+from app.models import PydanticBase
 
 
 class ReferralResponse(PydanticBase):
     user_id: int
     referral_code: str
     is_expired: bool
-    referral_link: str = ""
 
-    def __init__(self, **data):
-        super().__init__(**data)
-        self.referral_link = (
+    @computed_field  # type: ignore[prop-decorator]
+    @property
+    def referral_link(self) -> str:
+        return (
             f"{settings.DOMAIN}{settings.API_V1_STR}"
             f"/auth/signup/referral/{self.referral_code}"
         )
 
+
 class ReferralCodeApply(PydanticBase):
     referral_code: str
+
+
+class ReferralPage(PydanticBase):
+    items: list[UserRead]
+    next_cursor: int | None = None
+
+
+class ReferralClosure(Base):
+    """
+    Transitive closure of the referral tree.
+
+    Holds one row for every (ancestor, descendant) pair, where `depth` is
+    the number of referral hops between them (1 for a direct referral).
+    """
+
+    __tablename__ = "referral_closure"
+    __table_args__ = (
+        Index(
+            "ix_referral_closure_ancestor_id_depth",
+            "ancestor_id",
+            "depth",
+            "descendant_id",
+        ),
+    )
+
+    ancestor_id: Mapped[int] = mapped_column(
+        ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
+    )
+    descendant_id: Mapped[int] = mapped_column(
+        ForeignKey("users.id", ondelete="CASCADE"), primary_key=True, index=True
+    )
+    depth: Mapped[int] = mapped_column(nullable=False)
+
+
+class DownlineUser(UserRead):
+    depth: int
+
+
+class DownlinePage(PydanticBase):
+    items: list[DownlineUser]
+    next_cursor: str | None = None
+
+
+class DownlineLevel(PydanticBase):
+    depth: int
+    count: int
+
+
+class DownlineStats(PydanticBase):
+    user_id: int
+    total: int
+    levels: list[DownlineLevel]
+
+
+class ReferralDepth(PydanticBase):
+    user_id: int
+    depth: int
+
+
+class LeaderboardEntry(PydanticBase):
+    user_id: int
+    referrals: int
+    rank: int
+
+
+class Leaderboard(PydanticBase):
+    top: list[LeaderboardEntry]
+    user: LeaderboardEntry | None = None
@@ -1,10 +1,28 @@
+from typing import Any
+
+from fastapi import HTTPException, status
+from fastapi_cache.decorator import cache
+from pydantic import EmailStr
+from sqlalchemy import update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
 from app.auth.models import User
 from app.auth.service import get as get_user
-
+from app.auth.service import get_by_email as get_user_by_email
+from app.auth.service import invalidate_principal
+from app.config import settings
+
+from .cache import (
+    REFERRAL_CODE_NAMESPACE,
+    invalidate_referral_code,
+    invalidate_referrals,
+    referral_code_key_builder,
+)
+from .graph import publish_graph_change
+from .leaderboard import record_referral
 from .models import ReferralResponse
+from .tree import attach_to_referer
 
 
 async def create(
@@ -18,6 +36,9 @@ async def create(
     await db_session.commit()
     await db_session.refresh(user)
 
+    await invalidate_principal(user_id)
+    await invalidate_referral_code(user.email)  # type: ignore
+
     return ReferralResponse(
         user_id=user.id,  # type: ignore
         referral_code=user.referral_code,  # type: ignore
@@ -25,15 +46,83 @@ async def create(
     )
 
 
+@cache(
+    expire=settings.REFERRAL_CODE_CACHE_TTL,
+    namespace=REFERRAL_CODE_NAMESPACE,
+    key_builder=referral_code_key_builder,
+)
+async def get_referral_code_by_email(
+    *, db_session: AsyncSession, email: EmailStr
+) -> dict[str, Any]:
+    """
+    Returns the id, referral code and its expiration date of a user.
+
+    Cached until the code changes. Whether it has expired is left to the
+    caller, so a cached code doesn't outlive its expiration date.
+    """
+    user = await get_user_by_email(db_session=db_session, email=email)
+
+    if user is None or user.referral_code is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Referral code not found for the given email.",
+        )
+
+    return {
+        "user_id": user.id,
+        "referral_code": user.referral_code,
+        "referral_code_exp": user.referral_code_exp,
+    }
+
+
 async def get_referred_users_by_referer_id(
     *, db_session: AsyncSession, referer_id: int
-) -> list[User]:
-    """Returns a list of users referred by a specified referer."""
-    query = select(User).where(User.referer_id == referer_id)
+) -> list[dict[str, Any]]:
+    """
+    Returns the users referred by a specified referer.
+
+    Users are plain dicts in the shape of `UserRead`, ready to be
+    serialized without validation.
+    """
+    query = (
+        select(User.email, User.id)
+        .where(User.referer_id == referer_id)
+        .order_by(User.id)
+    )
 
     result = await db_session.execute(query)
 
-    return result.scalars().all()  # type: ignore
+    return [{"email": email, "id": id} for email, id in result]
+
+
+async def get_referred_users_page(
+    *, db_session: AsyncSession, referer_id: int, limit: int, after_id: int | None
+) -> dict[str, Any]:
+    """
+    Returns one page of users referred by a specified referer, ordered by id,
+    as a plain dict in the shape of `ReferralPage`.
+
+    Uses keyset pagination on the (referer_id, id) index, so every page
+    costs the same no matter how deep into the list it is.
+    """
+    query = (
+        select(User.email, User.id)
+        .where(User.referer_id == referer_id)
+        .order_by(User.id)
+        .limit(limit + 1)
+    )
+    if after_id is not None:
+        query = query.where(User.id > after_id)
+
+    result = await db_session.execute(query)
+    users = [{"email": email, "id": id} for email, id in result]
+
+    next_cursor = None
+    if len(users) > limit:
+        users = users[:limit]
+        next_cursor = users[-1]["id"]
+
+    return {"items": users, "next_cursor": next_cursor}
 
 
 async def delete(*, db_session: AsyncSession, user_id: int) -> None:
@@ -44,14 +133,43 @@ async def delete(*, db_session: AsyncSession, user_id: int) -> None:
 
     await db_session.commit()
 
+    await invalidate_principal(user_id)
+    await invalidate_referral_code(user.email)  # type: ignore
+
 
 async def set_referer_id(
     *, db_session: AsyncSession, user: User, referer_id: int
 ) -> dict[str, str]:
-    """Sets the referer_id for a user based on the provided referer ID."""
-    user.referer_id = referer_id
+    """
+    Sets the referer_id for a user based on the provided referer ID.
+
+    The update only applies while the user has no referer, since the
+    caller's view of the user may be stale, e.g. read from a replica.
+    """
+    user_id = user.id
+    result = await db_session.execute(
+        update(User)
+        .where(User.id == user_id, User.referer_id.is_(None))
+        .values(referer_id=referer_id)
+    )
+    if result.rowcount == 0:  # type: ignore[attr-defined]
+        await db_session.rollback()
+        await invalidate_principal(user_id)
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="You have already entered a referral code!",
+        )
+
+    await attach_to_referer(
+        db_session=db_session, user_id=user.id, referer_id=referer_id
+    )
 
     await db_session.commit()
     await db_session.refresh(user)
 
+    await invalidate_principal(user.id)
+    await invalidate_referrals(referer_id)
+    await record_referral(referer_id)
+    await publish_graph_change(user.id, referer_id)
+
     return {"msg": "You have successfully added the referral code!"}
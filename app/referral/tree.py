@@ -0,0 +1,161 @@
+from typing import Any
+
+from fastapi import HTTPException, status
+from sqlalchemy import func, insert, literal, select, true, tuple_, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.auth.models import User
+
+from .graph import get_graph
+from .models import DownlineLevel, DownlineStats, ReferralClosure, ReferralDepth
+
+
+async def attach_to_referer(
+    *, db_session: AsyncSession, user_id: int, referer_id: int
+) -> None:
+    """
+    Links a user and its whole downline to the referer and all of its ancestors.
+
+    Must be called in the same transaction that sets `users.referer_id`,
+    the caller is responsible for committing.
+    """
+    ancestors = union_all(
+        select(literal(referer_id).label("id"), literal(0).label("depth")),
+        select(ReferralClosure.ancestor_id, ReferralClosure.depth).where(
+            ReferralClosure.descendant_id == referer_id
+        ),
+    ).subquery("ancestors")
+    descendants = union_all(
+        select(literal(user_id).label("id"), literal(0).label("depth")),
+        select(ReferralClosure.descendant_id, ReferralClosure.depth).where(
+            ReferralClosure.ancestor_id == user_id
+        ),
+    ).subquery("descendants")
+
+    await db_session.execute(
+        insert(ReferralClosure).from_select(
+            ["ancestor_id", "descendant_id", "depth"],
+            select(
+                ancestors.c.id,
+                descendants.c.id,
+                ancestors.c.depth + descendants.c.depth + 1,
+            ).select_from(ancestors.join(descendants, true())),
+        )
+    )
+
+
+async def is_in_downline(
+    *, db_session: AsyncSession, user_id: int, ancestor_id: int
+) -> bool:
+    """Checks whether a user is the ancestor itself or one of its descendants."""
+    if user_id == ancestor_id:
+        return True
+
+    query = select(ReferralClosure.depth).where(
+        ReferralClosure.ancestor_id == ancestor_id,
+        ReferralClosure.descendant_id == user_id,
+    )
+    result = await db_session.execute(query)
+
+    return result.first() is not None
+
+
+def parse_downline_cursor(cursor: str) -> tuple[int, int]:
+    """Parses a `<depth>:<user id>` downline cursor."""
+    try:
+        depth, user_id = cursor.split(":")
+        return int(depth), int(user_id)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor."
+        )
+
+
+async def get_downline_page(
+    *,
+    db_session: AsyncSession,
+    referer_id: int,
+    max_depth: int | None,
+    limit: int,
+    after: str | None,
+) -> dict[str, Any]:
+    """
+    Returns one page of a referer's downline, ordered by depth and user id,
+    as a plain dict in the shape of `DownlinePage`.
+
+    Served by the (ancestor_id, depth, descendant_id) index.
+    """
+    query = (
+        select(User.id, User.email, ReferralClosure.depth)
+        .join(ReferralClosure, ReferralClosure.descendant_id == User.id)
+        .where(ReferralClosure.ancestor_id == referer_id)
+        .order_by(ReferralClosure.depth, ReferralClosure.descendant_id)
+        .limit(limit + 1)
+    )
+    if max_depth is not None:
+        query = query.where(ReferralClosure.depth <= max_depth)
+    if after is not None:
+        query = query.where(
+            tuple_(ReferralClosure.depth, ReferralClosure.descendant_id)
+            > tuple_(*parse_downline_cursor(after))
+        )
+
+    result = await db_session.execute(query)
+    rows = result.all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = f"{rows[-1].depth}:{rows[-1].id}"
+
+    return {
+        "items": [{"email": r.email, "id": r.id, "depth": r.depth} for r in rows],
+        "next_cursor": next_cursor,
+    }
+
+
+async def get_downline_stats(
+    *, db_session: AsyncSession, referer_id: int, max_depth: int | None
+) -> DownlineStats:
+    """
+    Returns the number of users on each level of a referer's downline, from
+    the in-memory graph once it's loaded.
+    """
+    graph = get_graph()
+    if graph is not None and referer_id in graph:
+        counts = graph.level_counts(referer_id, max_depth)
+        levels = [
+            DownlineLevel(depth=depth, count=count)
+            for depth, count in enumerate(counts, start=1)
+        ]
+        return DownlineStats(user_id=referer_id, total=sum(counts), levels=levels)
+
+    query = (
+        select(ReferralClosure.depth, func.count())
+        .where(ReferralClosure.ancestor_id == referer_id)
+        .group_by(ReferralClosure.depth)
+        .order_by(ReferralClosure.depth)
+    )
+    if max_depth is not None:
+        query = query.where(ReferralClosure.depth <= max_depth)
+
+    result = await db_session.execute(query)
+    levels = [DownlineLevel(depth=depth, count=count) for depth, count in result]
+
+    return DownlineStats(
+        user_id=referer_id,
+        total=sum(level.count for level in levels),
+        levels=levels,
+    )
+
+
+async def get_depth(*, db_session: AsyncSession, user_id: int) -> ReferralDepth:
+    """Returns how many referral levels are above a user (0 for a root user)."""
+    graph = get_graph()
+    if graph is not None and user_id in graph:
+        return ReferralDepth(user_id=user_id, depth=graph.depth_of(user_id))
+
+    query = select(func.count()).where(ReferralClosure.descendant_id == user_id)
+    result = await db_session.execute(query)
+
+    return ReferralDepth(user_id=user_id, depth=result.scalar_one())
@@ -1,5 +1,18 @@
+import base64
+import hashlib
+import hmac
 import secrets
 import string
+import struct
+from datetime import datetime, timezone
+
+from app.config import settings
+
+# Signed code layout: version, user id, expiry (unix seconds), truncated MAC.
+SIGNED_CODE_VERSION = 1
+SIGNED_CODE_PAYLOAD = struct.Struct(">BII")
+SIGNED_CODE_MAC_SIZE = 10
+SIGNED_CODE_LENGTH = 26
 
 
 def generate_random_referral_code(length: int) -> str:
@@ -7,3 +20,56 @@ def generate_random_referral_code(length: int) -> str:
     characters = string.ascii_letters + string.digits
 
     return "".join(secrets.choice(characters) for _ in range(length))
+
+
+def _sign(payload: bytes) -> bytes:
+    key = (settings.REFERRAL_CODE_KEY or settings.SECRET_KEY).encode()
+
+    return hmac.new(key, payload, hashlib.sha256).digest()[:SIGNED_CODE_MAC_SIZE]
+
+
+def generate_signed_referral_code(user_id: int, expires_at: datetime) -> str:
+    """
+    Creates a code that carries the user id and expiry, signed with an HMAC.
+
+    Only whole seconds of the expiry are kept.
+    """
+    payload = SIGNED_CODE_PAYLOAD.pack(
+        SIGNED_CODE_VERSION, user_id, int(expires_at.timestamp())
+    )
+
+    return base64.urlsafe_b64encode(payload + _sign(payload)).rstrip(b"=").decode()
+
+
+def is_signed_referral_code(referral_code: str) -> bool:
+    """Tells signed codes apart from random ones, without verifying them."""
+    return len(referral_code) == SIGNED_CODE_LENGTH
+
+
+def decode_signed_referral_code(referral_code: str) -> tuple[int, datetime] | None:
+    """
+    Returns the user id and expiry of a signed code.
+
+    Returns `None` when the code is malformed, of an unknown version or
+    its signature doesn't match.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(referral_code + "==")
+    except ValueError:
+        return None
+
+    # The unused bits of the last character must be zero, so that every
+    # code has exactly one spelling.
+    if base64.urlsafe_b64encode(raw).rstrip(b"=").decode() != referral_code:
+        return None
+
+    size = SIGNED_CODE_PAYLOAD.size
+    payload, mac = raw[:size], raw[size:]
+    if len(payload) != size or not hmac.compare_digest(mac, _sign(payload)):
+        return None
+
+    version, user_id, expires_at = SIGNED_CODE_PAYLOAD.unpack(payload)
+    if version != SIGNED_CODE_VERSION:
+        return None
+
+    return user_id, datetime.fromtimestamp(expires_at, timezone.utc)
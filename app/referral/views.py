@@ -1,26 +1,109 @@
 from datetime import datetime, timezone
-from typing import Any
 
-from fastapi import APIRouter, HTTPException, Query, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
 from fastapi_cache.decorator import cache
 from pydantic import EmailStr
 
 from app.auth.models import UserRead
-from app.auth.service import CurrentUser
-from app.auth.service import get_by_email as get_user_by_email
-from app.auth.service import get_by_referral_code
-from app.database.core import SessionDep
-
-from .models import ReferralResponse, ReferralCodeApply
-from .service import create, delete, get_referred_users_by_referer_id, set_referer_id
+from app.auth.service import CurrentUser, get_by_referral_code
+from app.caching import RawJSONCoder
+from app.config import settings
+from app.database.core import ReadSessionDep, ReadSessionFactoryDep, SessionDep
+from app.responses import FastJSONResponse, RawJSONResponse, dumps
+
+from .cache import REFERRALS_NAMESPACE, referrals_key_builder
+from .export import MEDIA_TYPES, ExportFormat, stream_referrals
+from .leaderboard import get_leaderboard
+from .models import (
+    DownlinePage,
+    DownlineStats,
+    Leaderboard,
+    ReferralCodeApply,
+    ReferralDepth,
+    ReferralPage,
+    ReferralResponse,
+)
+from .service import create, delete
+from .service import get_referral_code_by_email as get_code_by_email
+from .service import (
+    get_referred_users_by_referer_id,
+    get_referred_users_page,
+    set_referer_id,
+)
+from .tree import get_depth, get_downline_page, get_downline_stats, is_in_downline
 
 router = APIRouter()
 
 
-@router.get("/{referer_id}", response_model=list[UserRead])
-@cache(expire=60)
-async def get_refferals(db_session: SessionDep, referer_id: int) -> Any:
-    """Retrieves all referrals associated with a given referer ID."""
+@router.get("/leaderboard", response_model=Leaderboard)
+async def get_referral_leaderboard(
+    limit: int = Query(10, ge=1, le=100), user_id: int | None = None
+) -> Leaderboard:
+    """Retrieves the top referers and, optionally, the rank of a given user."""
+    return await get_leaderboard(limit=limit, user_id=user_id)
+
+
+def require_export_enabled() -> None:
+    """Hides the export route unless `REFERRAL_EXPORT_ENABLED` is set."""
+    if not settings.REFERRAL_EXPORT_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+
+@router.get(
+    "/export",
+    response_class=StreamingResponse,
+    dependencies=[Depends(require_export_enabled)],
+)
+async def export_referrals(
+    session_factory: ReadSessionFactoryDep,
+    current_user: CurrentUser,
+    file_format: ExportFormat = Query("ndjson", alias="format"),
+    referer_id: int | None = None,
+    gzip: bool = False,
+) -> StreamingResponse:
+    """
+    Exports all referral relationships as NDJSON or CSV.
+
+    The rows are streamed as they're read, pass `gzip=true` to have the
+    body compressed on the fly. Disabled unless `REFERRAL_EXPORT_ENABLED`
+    is set, `python -m app.cli export-referrals` writes the same export.
+    """
+    headers = {"Content-Disposition": f'attachment; filename="referrals.{file_format}"'}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+
+    return StreamingResponse(
+        stream_referrals(
+            session_factory=session_factory,
+            file_format=file_format,
+            referer_id=referer_id,
+            compress=gzip,
+        ),
+        media_type=MEDIA_TYPES[file_format],
+        headers=headers,
+    )
+
+
+@router.get(
+    "/{referer_id}",
+    response_model=None,
+    response_class=RawJSONResponse,
+    responses={status.HTTP_200_OK: {"model": list[UserRead]}},
+)
+@cache(
+    expire=settings.REFERRALS_CACHE_TTL,
+    namespace=REFERRALS_NAMESPACE,
+    key_builder=referrals_key_builder,
+    coder=RawJSONCoder,
+)
+async def get_refferals(db_session: SessionDep, referer_id: int) -> bytes:
+    """
+    Retrieves all referrals associated with a given referer ID.
+
+    Read from the primary: the cache is kept until the next write, so a
+    lagging replica would have it keep the list from before that write.
+    """
     users = await get_referred_users_by_referer_id(
         db_session=db_session, referer_id=referer_id
     )
@@ -29,7 +112,68 @@ async def get_refferals(db_session: SessionDep, referer_id: int) -> Any:
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"The user with id {referer_id} has no referrals.",
         )
-    return users
+    # Serialized here, so that cache hits are sent as stored.
+    return dumps(users)
+
+
+@router.get("/{referer_id}/page", response_model=ReferralPage)
+async def get_referrals_page(
+    db_session: ReadSessionDep,
+    referer_id: int,
+    limit: int = Query(50, ge=1, le=500),
+    after_id: int | None = Query(None, ge=0),
+) -> FastJSONResponse:
+    """
+    Retrieves a page of referrals for a given referer ID.
+
+    Pass the returned `next_cursor` as `after_id` to fetch the next page.
+    """
+    page = await get_referred_users_page(
+        db_session=db_session, referer_id=referer_id, limit=limit, after_id=after_id
+    )
+    return FastJSONResponse(page)
+
+
+@router.get("/{referer_id}/downline", response_model=DownlinePage)
+async def get_downline(
+    db_session: ReadSessionDep,
+    referer_id: int,
+    max_depth: int | None = Query(None, ge=1),
+    limit: int = Query(50, ge=1, le=500),
+    after: str | None = None,
+) -> FastJSONResponse:
+    """
+    Retrieves a page of all users below a referer, up to `max_depth` levels.
+
+    Users are ordered by depth, then id. Pass the returned `next_cursor`
+    as `after` to fetch the next page.
+    """
+    page = await get_downline_page(
+        db_session=db_session,
+        referer_id=referer_id,
+        max_depth=max_depth,
+        limit=limit,
+        after=after,
+    )
+    return FastJSONResponse(page)
+
+
+@router.get("/{referer_id}/downline/stats", response_model=DownlineStats)
+async def get_downline_size(
+    db_session: ReadSessionDep,
+    referer_id: int,
+    max_depth: int | None = Query(None, ge=1),
+) -> DownlineStats:
+    """Retrieves the downline size of a referer, per level and in total."""
+    return await get_downline_stats(
+        db_session=db_session, referer_id=referer_id, max_depth=max_depth
+    )
+
+
+@router.get("/{user_id}/depth", response_model=ReferralDepth)
+async def get_referral_depth(db_session: ReadSessionDep, user_id: int) -> ReferralDepth:
+    """Retrieves the number of referral levels above a user."""
+    return await get_depth(db_session=db_session, user_id=user_id)
 
 
 @router.get(
@@ -37,23 +181,22 @@ async def get_refferals(db_session: SessionDep, referer_id: int) -> Any:
     response_model=ReferralResponse,
     status_code=status.HTTP_200_OK,
 )
-@cache(expire=10)
 async def get_referral_code_by_email(
     db_session: SessionDep, email: EmailStr
 ) -> ReferralResponse:
-    """Retrieves the referral code for a user by their email."""
-    referer = await get_user_by_email(db_session=db_session, email=email)
+    """
+    Retrieves the referral code for a user by their email.
 
-    if referer is None or referer.referral_code is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Referral code not found for the given email.",
-        )
+    Read from the primary, since the result is cached until the code changes.
+    """
+    code = await get_code_by_email(db_session=db_session, email=email)
 
-    is_expired = referer.referral_code_exp < datetime.now(timezone.utc)  # type: ignore
+    is_expired = code["referral_code_exp"] < datetime.now(timezone.utc)
 
     return ReferralResponse(
-        user_id=referer.id, referral_code=referer.referral_code, is_expired=is_expired
+        user_id=code["user_id"],
+        referral_code=code["referral_code"],
+        is_expired=is_expired,
     )
 
 
@@ -99,6 +242,14 @@ async def use_referral_code(
             status_code=status.HTTP_404_NOT_FOUND, detail="Referral code not found!"
         )
 
+    if await is_in_downline(
+        db_session=db_session, user_id=referer.id, ancestor_id=current_user.id
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="You can't use a referral code from your own downline!",
+        )
+
     return await set_referer_id(
         db_session=db_session, user=current_user, referer_id=referer.id
     )
@@ -0,0 +1,48 @@
+import importlib.util
+import json
+from typing import Any
+
+from fastapi.responses import JSONResponse, Response
+
+# Serialization uses the optional `orjson` package when it's installed.
+ORJSON_AVAILABLE = importlib.util.find_spec("orjson") is not None
+
+if ORJSON_AVAILABLE:
+    import orjson
+
+    def dumps(content: Any) -> bytes:
+        """Serializes plain data (dicts, lists, str, int, ...) to JSON."""
+        return orjson.dumps(content)
+
+else:
+
+    def dumps(content: Any) -> bytes:
+        """Serializes plain data (dicts, lists, str, int, ...) to JSON."""
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response serialized with orjson when available.
+
+    Returned directly from an endpoint, it also skips the `response_model`
+    validation, so its content must already have the documented shape.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class RawJSONResponse(Response):
+    """
+    Response for JSON that's already serialized.
+
+    For cached endpoints, which can't return a `Response` and keep the
+    cache headers: they return the serialized JSON, which FastAPI passes
+    through as a str.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: bytes | str) -> bytes:
+        return content.encode() if isinstance(content, str) else content
@@ -1,13 +1,23 @@
+import asyncio
+import os
+import time
+from collections.abc import Callable
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import asdict, dataclass
 from datetime import datetime, timedelta, timezone
-from typing import Any
+from typing import Any, TypeVar
 
 from jose import jwt
 from passlib.context import CryptContext
 
 from app.config import settings
+from app.exceptions import PasswordHasherBusyException
+from app.metrics import Gauge, password_hash_duration, registry
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+T = TypeVar("T")
+
 
 def create_access_token(data: dict[str, Any]) -> str:
     to_encode = data.copy()
@@ -41,3 +51,118 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
+
+
+@dataclass
+class PasswordHasherStats:
+    pending: int = 0
+    max_pending: int = 0
+    completed: int = 0
+    failed: int = 0
+    cancelled: int = 0
+    rejected: int = 0
+    total_seconds: float = 0.0
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt hashing and verification in a dedicated worker pool,
+    so that the event loop is never blocked by a password check.
+
+    Calls beyond `max_workers + max_queue` pending operations are rejected
+    with `PasswordHasherBusyException` instead of piling up behind the pool.
+    """
+
+    def __init__(self, *, pool: str, max_workers: int | None, max_queue: int) -> None:
+        self.pool = pool
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.stats = PasswordHasherStats()
+        self._executor: Executor | None = None
+
+    def start(self) -> None:
+        """Creates the worker pool if it is not running yet."""
+        if self._executor is not None:
+            return
+
+        if self.pool == "process":
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        else:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="password-hasher"
+            )
+
+    def shutdown(self) -> None:
+        """Stops the worker pool, waiting for running operations to finish."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def get_stats(self) -> dict[str, Any]:
+        """Returns a snapshot of the pool counters."""
+        stats = asdict(self.stats)
+        stats["in_flight"] = min(self.stats.pending, self.max_workers)
+        stats["queued"] = max(self.stats.pending - self.max_workers, 0)
+
+        return stats
+
+    async def hash(self, password: str) -> str:
+        """Hashes a password in the worker pool."""
+        return await self._run("hash", get_password_hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        """Verifies a password against its hash in the worker pool."""
+        return await self._run(
+            "verify", verify_password, plain_password, hashed_password
+        )
+
+    def check_capacity(self) -> None:
+        """Raises `PasswordHasherBusyException` when no queue slot is free."""
+        if self.stats.pending >= self.max_workers + self.max_queue:
+            self.stats.rejected += 1
+            raise PasswordHasherBusyException(settings.PASSWORD_HASHER_RETRY_AFTER)
+
+    async def _run(self, operation: str, func: Callable[..., T], *args: Any) -> T:
+        self.check_capacity()
+        self.start()
+
+        stats = self.stats
+
+        stats.pending += 1
+        stats.max_pending = max(stats.max_pending, stats.pending)
+        started = time.perf_counter()
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(
+                self._executor, func, *args
+            )
+        except asyncio.CancelledError:
+            stats.cancelled += 1
+            raise
+        except Exception:
+            stats.failed += 1
+            raise
+        finally:
+            stats.pending -= 1
+
+        # Only successful operations are timed, failures would skew the times.
+        elapsed = time.perf_counter() - started
+        stats.completed += 1
+        stats.total_seconds += elapsed
+        password_hash_duration.observe(elapsed, operation)
+
+        return result
+
+
+password_hasher = PasswordHasher(
+    pool=settings.PASSWORD_HASHER_POOL,
+    max_workers=settings.PASSWORD_HASHER_WORKERS,
+    max_queue=settings.PASSWORD_HASHER_MAX_QUEUE,
+)
+
+registry.register(
+    Gauge(
+        "password_hasher_pending",
+        "Password hashing operations running or queued.",
+        lambda: [((), password_hasher.stats.pending)],
+    )
+)
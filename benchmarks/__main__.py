@@ -0,0 +1,198 @@
+import argparse
+import asyncio
+import json
+import logging
+import subprocess
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+import httpx
+
+from .fakes import serve
+from .report import compare, format_report, write_report
+from .runner import Runner
+from .scenario import Dataset, load_scenario
+
+
+async def _fakes(args: argparse.Namespace) -> None:
+    logging.basicConfig(level=logging.INFO)
+    await serve(
+        host=args.host,
+        http_port=args.http_port,
+        smtp_port=args.smtp_port,
+        latency=args.latency,
+    )
+
+
+async def _seed(args: argparse.Namespace) -> None:
+    # Imported here, so that the other commands don't need the app's settings.
+    from app.database.core import async_session
+
+    from .dataset import seed
+
+    async with async_session() as session:
+        dataset = await seed(
+            db_session=session,
+            users=args.users,
+            referral_ratio=args.referral_ratio,
+            seed=args.seed,
+            prefix=args.prefix,
+        )
+
+    args.out.write_text(dataset.model_dump_json())
+    print(f"Seeded {len(dataset.users)} users, {len(dataset.referers)} referers.")
+
+
+async def _graph(args: argparse.Namespace) -> None:
+    # Imported here, so that the other commands don't need numpy.
+    from .graph import format_graph_report, run_graph_benchmark
+
+    report = run_graph_benchmark(
+        users=args.users,
+        referral_ratio=args.referral_ratio,
+        queries=args.queries,
+        seed=args.seed,
+    )
+    report.update(git_commit=_git_commit())
+    write_report(report, args.out)
+
+    print(format_graph_report(report))
+    print(f"\nReport written to {args.out}")
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _load_json(path: Path) -> Any:
+    return json.loads(path.read_text())
+
+
+async def _run(args: argparse.Namespace) -> None:
+    scenario = load_scenario(args.scenario)
+    dataset = Dataset.load(args.dataset)
+
+    started_at = datetime.now(timezone.utc).isoformat()
+    async with httpx.AsyncClient(
+        base_url=args.base_url,
+        timeout=args.timeout,
+        limits=httpx.Limits(max_connections=None, max_keepalive_connections=None),
+    ) as client:
+        runner = Runner(scenario, client=client, dataset=dataset, seed=args.seed)
+        report = await runner.run()
+
+    report.update(
+        started_at=started_at, base_url=args.base_url, git_commit=_git_commit()
+    )
+    out = args.out or Path("benchmarks/results") / f"{scenario.name}.json"
+    write_report(report, out)
+
+    baseline = _load_json(args.baseline) if args.baseline else None
+    print(format_report(report, baseline))
+    print(f"\nReport written to {out}")
+
+    if baseline is not None:
+        _exit_on_regressions(baseline, report, args)
+
+
+async def _compare(args: argparse.Namespace) -> None:
+    baseline, report = _load_json(args.baseline), _load_json(args.report)
+    print(format_report(report, baseline))
+    _exit_on_regressions(baseline, report, args)
+
+
+def _exit_on_regressions(
+    baseline: dict[str, Any], report: dict[str, Any], args: argparse.Namespace
+) -> None:
+    regressions = compare(
+        baseline,
+        report,
+        latency_tolerance=args.latency_tolerance,
+        throughput_tolerance=args.throughput_tolerance,
+    )
+    if regressions:
+        print("\nRegressions against the baseline:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+
+    print("\nNo regressions against the baseline.")
+
+
+def _add_tolerances(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency-tolerance", type=float, default=0.15)
+    parser.add_argument("--throughput-tolerance", type=float, default=0.15)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    fakes = commands.add_parser(
+        "fakes", help="Serve stand-ins for hunter.io, Google OAuth and SMTP."
+    )
+    fakes.add_argument("--host", default="127.0.0.1")
+    fakes.add_argument("--http-port", type=int, default=9100)
+    fakes.add_argument("--smtp-port", type=int, default=9125)
+    fakes.add_argument(
+        "--latency", type=float, default=0.0, help="Seconds per upstream response."
+    )
+    fakes.set_defaults(handler=_fakes)
+
+    seed = commands.add_parser(
+        "seed", help="Insert generated users and write the dataset file."
+    )
+    seed.add_argument("--users", type=int, default=10_000)
+    seed.add_argument("--referral-ratio", type=float, default=0.7)
+    seed.add_argument("--seed", type=int, default=0)
+    seed.add_argument("--prefix", default="bench")
+    seed.add_argument("--out", type=Path, default=Path("benchmarks/dataset.json"))
+    seed.set_defaults(handler=_seed)
+
+    run = commands.add_parser("run", help="Run a scenario against a running API.")
+    run.add_argument("scenario", type=Path)
+    run.add_argument("--base-url", default="http://127.0.0.1:8000/api/v1")
+    run.add_argument("--dataset", type=Path, default=Path("benchmarks/dataset.json"))
+    run.add_argument("--seed", type=int, default=0)
+    run.add_argument("--timeout", type=float, default=30.0)
+    run.add_argument("--out", type=Path, help="Where to write the JSON report.")
+    run.add_argument(
+        "--baseline", type=Path, help="Fail when the run regressed against it."
+    )
+    _add_tolerances(run)
+    run.set_defaults(handler=_run)
+
+    compare_ = commands.add_parser("compare", help="Compare a report to a baseline.")
+    compare_.add_argument("baseline", type=Path)
+    compare_.add_argument("report", type=Path)
+    _add_tolerances(compare_)
+    compare_.set_defaults(handler=_compare)
+
+    graph = commands.add_parser(
+        "graph", help="Benchmark the in-memory referral graph on generated users."
+    )
+    graph.add_argument("--users", type=int, default=1_000_000)
+    graph.add_argument("--referral-ratio", type=float, default=0.7)
+    graph.add_argument("--queries", type=int, default=1000)
+    graph.add_argument("--seed", type=int, default=0)
+    graph.add_argument(
+        "--out", type=Path, default=Path("benchmarks/results/graph.json")
+    )
+    graph.set_defaults(handler=_graph)
+
+    args = parser.parse_args()
+    asyncio.run(args.handler(args))
+
+
+if __name__ == "__main__":
+    main()
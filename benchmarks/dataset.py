@@ -0,0 +1,109 @@
+import json
+import random
+import tempfile
+from datetime import timedelta, timezone
+from pathlib import Path
+from typing import Any
+
+import factory
+import factory.random
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.auth.bulk_import import import_users
+from app.auth.models import User
+from app.security import get_password_hash
+
+from .scenario import Dataset
+
+PASSWORD = "benchmark-password"
+
+
+class UserRowFactory(factory.Factory):
+    """A row of the `import-users` NDJSON format."""
+
+    class Meta:
+        model = dict
+
+    class Params:
+        prefix = "bench"
+
+    legacy_id = factory.Sequence(str)
+    email = factory.LazyAttributeSequence(lambda o, n: f"{o.prefix}-{n}@example.com")
+    referral_code = factory.Faker(
+        "pystr_format", string_format="????????", letters="abcdefghjkmnpqrstuvwxyz"
+    )
+    referral_code_exp = factory.Faker(
+        "date_time_between",
+        start_date=timedelta(days=1),
+        end_date=timedelta(days=60),
+        tzinfo=timezone.utc,
+    )
+    referer_legacy_id = None
+
+
+def generate_rows(
+    *, users: int, referral_ratio: float, seed: int, prefix: str
+) -> list[dict[str, Any]]:
+    """
+    Creates the same users for the same seed.
+
+    A `referral_ratio` share of them is referred by a random earlier user,
+    which gives trees of logarithmic depth with a few big referers near the
+    roots, like organic growth does.
+    """
+    factory.random.reseed_random(seed)
+    UserRowFactory.reset_sequence()
+    rng = random.Random(seed)
+
+    rows = UserRowFactory.build_batch(users, prefix=prefix)
+    for index, row in enumerate(rows):
+        row["referral_code_exp"] = row["referral_code_exp"].isoformat()
+        if index and rng.random() < referral_ratio:
+            row["referer_legacy_id"] = rows[rng.randrange(index)]["legacy_id"]
+
+    return rows
+
+
+async def seed(
+    *,
+    db_session: AsyncSession,
+    users: int,
+    referral_ratio: float = 0.7,
+    seed: int = 0,
+    prefix: str = "bench",
+) -> Dataset:
+    """
+    Writes generated users through the bulk import, so the referral closure
+    is filled in as well, and returns what scenarios need to know about them.
+
+    All users share one password, hashed once.
+    """
+    rows = generate_rows(
+        users=users, referral_ratio=referral_ratio, seed=seed, prefix=prefix
+    )
+    password = get_password_hash(PASSWORD)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / "users.ndjson"
+        with path.open("w") as file:
+            for row in rows:
+                file.write(json.dumps({**row, "password": password}) + "\n")
+
+        await import_users(db_session=db_session, path=path, file_format="ndjson")
+
+    result = await db_session.execute(
+        select(User.id, User.email, User.referral_code, User.referer_id)
+        .where(User.email.like(f"{prefix}-%@example.com"))
+        .order_by(User.id)
+    )
+    seeded = result.all()
+
+    return Dataset(
+        password=PASSWORD,
+        users=[
+            {"id": id, "email": email, "referral_code": code}
+            for id, email, code, _ in seeded
+        ],
+        referers=sorted({referer_id for *_, referer_id in seeded if referer_id}),
+    )
@@ -0,0 +1,146 @@
+"""
+Local stand-ins for hunter.io, Google OAuth and an SMTP server.
+
+Point the application at them with:
+
+    HUNTER_API_URL=http://127.0.0.1:9100/v2
+    GOOGLE_TOKEN_URL=http://127.0.0.1:9100/o/oauth2/token
+    GOOGLE_JWKS_URL=http://127.0.0.1:9100/oauth2/v3/certs
+    SMTP_HOST=127.0.0.1 SMTP_PORT=9125 SMTP_TLS=False SMTP_SSL=False
+"""
+
+import asyncio
+import logging
+import time
+from collections import Counter
+from typing import Any
+
+import uvicorn
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import FastAPI, Form, Response
+from jose import jwk, jwt
+
+logger = logging.getLogger(__name__)
+
+calls: Counter[str] = Counter()
+
+
+def create_upstreams_app(latency: float = 0.0) -> FastAPI:
+    """
+    The HTTP upstreams, each answering after `latency` seconds.
+
+    hunter.io reports every address as deliverable, except the ones starting
+    with "undeliverable". Google hands out an ID token for any code, signed
+    with a key generated on startup, and the token's user is derived from
+    that code, so repeating a code signs in the same user.
+    """
+    app = FastAPI()
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+    public_jwk = {**jwk.construct(pem, "RS256").public_key().to_dict(), "kid": "fake"}
+
+    @app.get("/v2/email-verifier")
+    async def email_verifier(email: str, api_key: str = "") -> dict[str, Any]:
+        calls["hunter"] += 1
+        await asyncio.sleep(latency)
+        result = "undeliverable" if email.startswith("undeliverable") else "deliverable"
+
+        return {"data": {"email": email, "result": result}}
+
+    @app.post("/o/oauth2/token")
+    async def google_token(
+        code: str = Form(), client_id: str = Form()
+    ) -> dict[str, Any]:
+        calls["google_token"] += 1
+        await asyncio.sleep(latency)
+        now = int(time.time())
+        claims = {
+            "iss": "https://accounts.google.com",
+            "aud": client_id,
+            "sub": f"google-{code}",
+            "email": f"google-{code}@example.com",
+            "email_verified": True,
+            "iat": now,
+            "exp": now + 3600,
+        }
+        id_token = jwt.encode(claims, pem, algorithm="RS256", headers={"kid": "fake"})
+
+        return {"access_token": f"fake-{code}", "id_token": id_token}
+
+    @app.get("/oauth2/v3/certs")
+    async def google_certs(response: Response) -> dict[str, Any]:
+        calls["google_certs"] += 1
+        await asyncio.sleep(latency)
+        response.headers["Cache-Control"] = "public, max-age=3600"
+
+        return {"keys": [public_jwk]}
+
+    @app.get("/stats")
+    async def stats() -> dict[str, int]:
+        return dict(calls)
+
+    return app
+
+
+async def _handle_smtp(
+    reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+) -> None:
+    """Accepts any message without looking at it."""
+
+    async def reply(line: str) -> None:
+        writer.write(f"{line}\r\n".encode())
+        await writer.drain()
+
+    await reply("220 localhost fake SMTP")
+    try:
+        while line := await reader.readline():
+            command = line.decode(errors="replace").strip().upper()
+            if command.startswith(("EHLO", "HELO")):
+                await reply("250-localhost\r\n250-AUTH PLAIN LOGIN\r\n250 8BITMIME")
+            elif command.startswith("AUTH"):
+                await reply("235 Authentication successful")
+            elif command == "DATA":
+                await reply("354 End data with <CR><LF>.<CR><LF>")
+                while (await reader.readline()) not in (b".\r\n", b".\n", b""):
+                    pass
+                calls["smtp_messages"] += 1
+                await reply("250 OK")
+            elif command == "QUIT":
+                await reply("221 Bye")
+                break
+            else:
+                # MAIL, RCPT, RSET, NOOP
+                await reply("250 OK")
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(
+    host: str = "127.0.0.1",
+    http_port: int = 9100,
+    smtp_port: int = 9125,
+    latency: float = 0.0,
+) -> None:
+    """Runs the HTTP upstreams and the SMTP server until cancelled."""
+    smtp = await asyncio.start_server(_handle_smtp, host, smtp_port)
+    server = uvicorn.Server(
+        uvicorn.Config(
+            create_upstreams_app(latency),
+            host=host,
+            port=http_port,
+            log_level="warning",
+        )
+    )
+    logger.info(
+        "Fake upstreams on http://%s:%s, SMTP on %s", host, http_port, smtp_port
+    )
+
+    async with smtp:
+        await server.serve()
@@ -0,0 +1,115 @@
+"""
+Benchmarks the in-memory referral graph (`app.referral.graph`) on a
+generated forest, without a database.
+"""
+
+import random
+import time
+from collections.abc import Callable
+from typing import Any
+
+import numpy as np
+
+from app.referral.graph import ReferralGraph
+
+from .report import percentile
+
+
+def generate_forest(
+    users: int, referral_ratio: float, seed: int
+) -> tuple["np.ndarray[Any, Any]", "np.ndarray[Any, Any]"]:
+    """
+    Users with ids 1..users, each referred with `referral_ratio` probability
+    by a random earlier user, so early users end up with the big downlines.
+    """
+    rng = np.random.default_rng(seed)
+    ids = np.arange(1, users + 1, dtype=np.int32)
+    referers = (rng.random(users) * (ids - 1)).astype(np.int32) + 1
+    referers[(rng.random(users) >= referral_ratio) | (ids == 1)] = -1
+
+    return ids, referers
+
+
+def _timed(func: Callable[[], Any]) -> float:
+    started = time.perf_counter()
+    func()
+    return time.perf_counter() - started
+
+
+def _latencies(
+    func: Callable[[int], Any], user_ids: list[int], unit: float = 1e6
+) -> dict[str, float]:
+    """Percentiles of calling func for every user, in microseconds."""
+    latencies = sorted(_timed(lambda: func(user_id)) * unit for user_id in user_ids)
+    return {
+        "p50": round(percentile(latencies, 50), 1),
+        "p99": round(percentile(latencies, 99), 1),
+        "max": round(latencies[-1], 1),
+    }
+
+
+def run_graph_benchmark(
+    *, users: int, referral_ratio: float, queries: int, seed: int
+) -> dict[str, Any]:
+    ids, referers = generate_forest(users, referral_ratio, seed)
+
+    started = time.perf_counter()
+    graph = ReferralGraph.from_edges(ids, referers)
+    build_seconds = time.perf_counter() - started
+    del ids, referers
+
+    rng = random.Random(seed)
+    sample = [rng.randint(1, users) for _ in range(queries)]
+    top = np.argsort(graph.size)[-20:].tolist()
+
+    report: dict[str, Any] = {
+        "users": graph.users,
+        "max_depth": int(graph.depth.max()),
+        "largest_downline": graph.downline_size(top[-1]),
+        "build_seconds": round(build_seconds, 2),
+        "bytes_per_user": round(graph.nbytes / graph.users, 1),
+        "aggregates_seconds": round(_timed(graph.aggregates), 3),
+        "latency_us": {
+            "depth": _latencies(graph.depth_of, sample),
+            "downline_size": _latencies(graph.downline_size, sample),
+            "level_counts": _latencies(graph.level_counts, sample),
+            "level_counts_top20": _latencies(graph.level_counts, top),
+        },
+    }
+
+    # New users signing up with a referer, and users without one applying
+    # a referral code later.
+    new = {
+        user_id: rng.randint(1, users)
+        for user_id in range(users + 1, users + queries + 1)
+    }
+    report["latency_us"]["add_user"] = _latencies(
+        lambda user_id: graph.add_user(user_id, new[user_id]), list(new)
+    )
+    late = {user_id + queries: referer for user_id, referer in new.items()}
+    for user_id in late:
+        graph.add_user(user_id)
+    report["latency_us"]["set_referer"] = _latencies(
+        lambda user_id: graph.set_referer(user_id, late[user_id]), list(late)
+    )
+
+    return report
+
+
+def format_graph_report(report: dict[str, Any]) -> str:
+    lines = [
+        f"users              {report['users']:,}",
+        f"max depth          {report['max_depth']}",
+        f"largest downline   {report['largest_downline']:,}",
+        f"build              {report['build_seconds']} s",
+        f"memory             {report['bytes_per_user']} bytes/user",
+        f"all aggregates     {report['aggregates_seconds']} s",
+        "",
+        f"{'query':<22}{'p50 us':>12}{'p99 us':>12}{'max us':>12}",
+    ]
+    for name, stats in report["latency_us"].items():
+        lines.append(
+            f"{name:<22}{stats['p50']:>12}{stats['p99']:>12}{stats['max']:>12}"
+        )
+
+    return "\n".join(lines)
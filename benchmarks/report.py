@@ -0,0 +1,169 @@
+import json
+import math
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+@dataclass
+class Sample:
+    name: str
+    status: int | None
+    latency: float
+    ok: bool
+
+
+@dataclass
+class Recorder:
+    """Collects the samples of the recorded stages."""
+
+    samples: list[Sample] = field(default_factory=list)
+    duration: float = 0.0
+
+    def add(self, sample: Sample) -> None:
+        self.samples.append(sample)
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """Nearest-rank percentile of already sorted values."""
+    if not sorted_values:
+        return 0.0
+
+    rank = max(math.ceil(p / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def summarize(samples: list[Sample], duration: float) -> dict[str, Any]:
+    """Throughput, error rate and latency percentiles (in ms) of samples."""
+    latencies = sorted(sample.latency * 1000 for sample in samples)
+    errors = sum(not sample.ok for sample in samples)
+    statuses: dict[str, int] = {}
+    for sample in samples:
+        key = str(sample.status or "error")
+        statuses[key] = statuses.get(key, 0) + 1
+
+    summary: dict[str, Any] = {
+        "requests": len(samples),
+        "errors": errors,
+        "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+        "rps": round(len(samples) / duration, 2) if duration else 0.0,
+        "mean_ms": round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+        "max_ms": round(latencies[-1], 2) if latencies else 0.0,
+        "statuses": statuses,
+    }
+    for p in PERCENTILES:
+        summary[f"p{p}_ms"] = round(percentile(latencies, p), 2)
+
+    return summary
+
+
+def build_report(
+    scenario: str, recorder: Recorder, metadata: dict[str, Any]
+) -> dict[str, Any]:
+    """Summarizes a run as a whole and per request name."""
+    by_name: dict[str, list[Sample]] = {}
+    for sample in recorder.samples:
+        by_name.setdefault(sample.name, []).append(sample)
+
+    return {
+        "scenario": scenario,
+        **metadata,
+        "duration": round(recorder.duration, 2),
+        "total": summarize(recorder.samples, recorder.duration),
+        "requests": {
+            name: summarize(samples, recorder.duration)
+            for name, samples in sorted(by_name.items())
+        },
+    }
+
+
+def write_report(report: dict[str, Any], path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(report, indent=2) + "\n")
+
+
+@dataclass
+class Regression:
+    name: str
+    metric: str
+    baseline: float
+    current: float
+
+    def __str__(self) -> str:
+        return (
+            f"{self.name}: {self.metric} {self.baseline} -> {self.current}"
+            f" ({_change(self.baseline, self.current)})"
+        )
+
+
+def _change(baseline: float, current: float) -> str:
+    if not baseline:
+        return "n/a"
+
+    return f"{(current - baseline) / baseline:+.1%}"
+
+
+def compare(
+    baseline: dict[str, Any],
+    current: dict[str, Any],
+    *,
+    latency_tolerance: float = 0.15,
+    throughput_tolerance: float = 0.15,
+    error_rate_tolerance: float = 0.01,
+) -> list[Regression]:
+    """
+    Lists the request names whose p95/p99 latency grew, throughput dropped
+    or error rate rose by more than the tolerances, relative to a baseline
+    report of the same scenario. Names missing from either side are skipped.
+    """
+    regressions = []
+    sections = {"total": (baseline["total"], current["total"])}
+    for name, stats in current["requests"].items():
+        if name in baseline["requests"]:
+            sections[name] = (baseline["requests"][name], stats)
+
+    for name, (before, after) in sections.items():
+        for metric in ("p95_ms", "p99_ms"):
+            if after[metric] > before[metric] * (1 + latency_tolerance):
+                regressions.append(
+                    Regression(name, metric, before[metric], after[metric])
+                )
+        if after["rps"] < before["rps"] * (1 - throughput_tolerance):
+            regressions.append(Regression(name, "rps", before["rps"], after["rps"]))
+        if after["error_rate"] > before["error_rate"] + error_rate_tolerance:
+            regressions.append(
+                Regression(
+                    name, "error_rate", before["error_rate"], after["error_rate"]
+                )
+            )
+
+    return regressions
+
+
+def format_report(report: dict[str, Any], baseline: dict[str, Any] | None) -> str:
+    """Renders a report as a table, with the p95 change against a baseline."""
+    header = f"{'request':<28}{'count':>8}{'rps':>10}{'err%':>7}"
+    header += "".join(f"{f'p{p}':>9}" for p in PERCENTILES)
+    if baseline is not None:
+        header += f"{'p95 vs base':>13}"
+
+    lines = [header]
+    rows = [*report["requests"].items(), ("total", report["total"])]
+    for name, stats in rows:
+        line = (
+            f"{name[:27]:<28}{stats['requests']:>8}{stats['rps']:>10}"
+            f"{stats['error_rate'] * 100:>6.1f}%"
+        )
+        line += "".join(f"{stats[f'p{p}_ms']:>9}" for p in PERCENTILES)
+        if baseline is not None:
+            if name == "total":
+                before = baseline["total"]
+            else:
+                before = baseline["requests"].get(name)
+            change = _change(before["p95_ms"], stats["p95_ms"]) if before else "new"
+            line += f"{change:>13}"
+        lines.append(line)
+
+    return "\n".join(lines)
@@ -0,0 +1,124 @@
+import asyncio
+import random
+import time
+import uuid
+from typing import Any
+
+import httpx
+
+from .report import Recorder, Sample, build_report
+from .scenario import Context, Dataset, RequestSpec, Scenario, render
+
+
+class Runner:
+    """
+    Sends the requests of a scenario from a varying number of workers.
+
+    Every worker sends one request at a time, picked by weight, so the
+    concurrency of a stage is the number of requests in flight.
+    """
+
+    def __init__(
+        self,
+        scenario: Scenario,
+        *,
+        client: httpx.AsyncClient,
+        dataset: Dataset,
+        seed: int = 0,
+    ) -> None:
+        self.scenario = scenario
+        self.client = client
+        self.rng = random.Random(seed)
+        self.context = Context(dataset, uuid.uuid4().hex[:8], self.rng)
+        self.recorder = Recorder()
+        self.recording = False
+        self._tokens: dict[str, str] = {}
+        self._weights = [spec.weight for spec in scenario.requests]
+
+    async def _token(self, user: Any) -> str:
+        token = self._tokens.get(user.email)
+        if token is None:
+            response = await self.client.post(
+                "/auth/signin",
+                data={
+                    "username": user.email,
+                    "password": self.context.dataset.password,
+                },
+            )
+            response.raise_for_status()
+            token = self._tokens[user.email] = response.json()["access_token"]
+
+        return token
+
+    async def _send(self, spec: RequestSpec) -> None:
+        values = self.context.values()
+        headers = {}
+        status = None
+        started = time.perf_counter()
+        try:
+            if spec.auth:
+                token = await self._token(values["user"])
+                headers["Authorization"] = f"Bearer {token}"
+                # Signing in isn't part of the request's latency.
+                started = time.perf_counter()
+
+            response = await self.client.request(
+                spec.method,
+                render(spec.path, values),
+                params=render(spec.params, values),
+                json=render(spec.json_body, values),
+                data=render(spec.form, values),
+                headers=headers,
+            )
+            status = response.status_code
+        except httpx.HTTPError:
+            pass
+        latency = time.perf_counter() - started
+
+        if self.recording:
+            self.recorder.add(Sample(spec.name, status, latency, status in spec.expect))
+
+    async def _worker(self, stop: asyncio.Event) -> None:
+        while not stop.is_set():
+            spec = self.rng.choices(self.scenario.requests, self._weights)[0]
+            await self._send(spec)
+
+    async def run(self) -> dict[str, Any]:
+        """Runs all stages and returns the report of the recorded ones."""
+        workers: list[tuple[asyncio.Task[None], asyncio.Event]] = []
+        stopped: list[asyncio.Task[None]] = []
+
+        try:
+            for stage in self.scenario.stages:
+                self.recording = stage.record
+                started = time.perf_counter()
+
+                while len(workers) > stage.concurrency:
+                    task, stop = workers.pop()
+                    stop.set()
+                    stopped.append(task)
+
+                missing = stage.concurrency - len(workers)
+                for _ in range(missing):
+                    stop = asyncio.Event()
+                    workers.append((asyncio.create_task(self._worker(stop)), stop))
+                    if stage.ramp:
+                        await asyncio.sleep(stage.ramp / missing)
+
+                remaining = stage.duration - (time.perf_counter() - started)
+                await asyncio.sleep(max(remaining, 0))
+
+                if stage.record:
+                    self.recorder.duration += time.perf_counter() - started
+        finally:
+            # Requests still in flight are dropped from the report.
+            self.recording = False
+            for _, stop in workers:
+                stop.set()
+            await asyncio.gather(*stopped, *(task for task, _ in workers))
+
+        return build_report(
+            self.scenario.name,
+            self.recorder,
+            {"stages": [stage.model_dump() for stage in self.scenario.stages]},
+        )
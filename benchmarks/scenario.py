@@ -0,0 +1,107 @@
+import json
+import random
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Literal
+
+from pydantic import BaseModel, Field
+
+
+class Stage(BaseModel):
+    """Runs `concurrency` workers for `duration` seconds."""
+
+    concurrency: int = Field(ge=1)
+    duration: float = Field(gt=0)
+    # Workers added over the first `ramp` seconds, instead of all at once.
+    ramp: float = Field(0, ge=0)
+    # Warm-up stages fill caches and pools but aren't part of the report.
+    record: bool = True
+
+
+class RequestSpec(BaseModel):
+    """
+    One kind of request a worker sends.
+
+    String values in `path`, `params`, `json` and `form` are `str.format`
+    templates, see `Context` for the available fields.
+    """
+
+    name: str
+    method: Literal["GET", "POST", "PUT", "DELETE"] = "GET"
+    path: str
+    params: dict[str, Any] | None = None
+    json_body: Any = Field(None, alias="json")
+    form: dict[str, Any] | None = None
+    # Sends the bearer token of the picked `user`.
+    auth: bool = False
+    weight: int = Field(1, ge=1)
+    expect: list[int] = [200, 201]
+
+
+class Scenario(BaseModel):
+    name: str
+    description: str = ""
+    stages: list[Stage] = Field(min_length=1)
+    requests: list[RequestSpec] = Field(min_length=1)
+
+
+def load_scenario(path: Path) -> Scenario:
+    """Reads a scenario from a JSON file."""
+    return Scenario.model_validate(json.loads(path.read_text()))
+
+
+class Dataset(BaseModel):
+    """The users written by `benchmarks.dataset.seed`."""
+
+    password: str
+    users: list[dict[str, Any]]
+    # Ids of the users that have referrals.
+    referers: list[int]
+
+    @classmethod
+    def load(cls, path: Path) -> "Dataset":
+        return cls.model_validate(json.loads(path.read_text()))
+
+
+class Context:
+    """
+    Values the templates of a request are rendered with.
+
+    - `{unique}`: different for every request of every run
+    - `{user.id}`, `{user.email}`, `{user.referral_code}`: a random seeded user
+    - `{referer.id}`, ...: a random seeded user that has referrals
+    - `{password}`: the password of all seeded users
+    """
+
+    def __init__(self, dataset: Dataset, run_id: str, rng: random.Random) -> None:
+        self.dataset = dataset
+        self.run_id = run_id
+        self.rng = rng
+        self._counter = 0
+        self._users_by_id = {user["id"]: user for user in dataset.users}
+
+    def values(self) -> dict[str, Any]:
+        self._counter += 1
+        user = self.rng.choice(self.dataset.users)
+        referer = user
+        if self.dataset.referers:
+            referer = self._users_by_id[self.rng.choice(self.dataset.referers)]
+
+        return {
+            "unique": f"{self.run_id}-{self._counter}",
+            "user": SimpleNamespace(**user),
+            "referer": SimpleNamespace(**referer),
+            "password": self.dataset.password,
+        }
+
+
+def render(template: Any, values: dict[str, Any]) -> Any:
+    """Fills in the templates in a JSON-like value."""
+    if isinstance(template, str):
+        return template.format_map(values)
+    if isinstance(template, dict):
+        return {key: render(value, values) for key, value in template.items()}
+    if isinstance(template, list):
+        return [render(value, values) for value in template]
+
+    return template
@@ -8,6 +8,8 @@ from sqlalchemy.ext.asyncio import async_engine_from_config
 from alembic import context
 from app.database.core import DATABASE_URL, Base
 from app.auth import models
+from app.referral import models as referral_models
+from app.outbox import models as outbox_models
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -0,0 +1,41 @@
+"""Index users.referer_id
+
+Revision ID: 1915a9b118db
+Revises: c2ba5bf12020
+Create Date: 2026-10-18 08:40:12.512094
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1915a9b118db'
+down_revision: Union[str, None] = 'c2ba5bf12020'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction block.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_users_referer_id',
+            'users',
+            ['referer_id', 'id'],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_users_referer_id',
+            table_name='users',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
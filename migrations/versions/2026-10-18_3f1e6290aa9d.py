@@ -0,0 +1,77 @@
+"""Referral closure table
+
+Revision ID: 3f1e6290aa9d
+Revises: 1915a9b118db
+Create Date: 2026-10-18 09:05:47.130251
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1e6290aa9d'
+down_revision: Union[str, None] = '1915a9b118db'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('referral_closure',
+    sa.Column('ancestor_id', sa.Integer(), nullable=False),
+    sa.Column('descendant_id', sa.Integer(), nullable=False),
+    sa.Column('depth', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['ancestor_id'], ['users.id'], name=op.f('fk_referral_closure_ancestor_id_users'), ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['descendant_id'], ['users.id'], name=op.f('fk_referral_closure_descendant_id_users'), ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('ancestor_id', 'descendant_id', name=op.f('pk_referral_closure'))
+    )
+    op.create_index('ix_referral_closure_ancestor_id_depth', 'referral_closure', ['ancestor_id', 'depth', 'descendant_id'], unique=False)
+    op.create_index(op.f('ix_referral_closure_descendant_id'), 'referral_closure', ['descendant_id'], unique=False)
+
+    # Users referring each other were allowed before, and the backfill would
+    # never end on such a cycle. Users in a cycle or below one can't be
+    # reached from a user without a referer.
+    result = op.get_bind().execute(
+        sa.text(
+            """
+            WITH RECURSIVE reachable (id) AS (
+                SELECT id FROM users WHERE referer_id IS NULL
+                UNION ALL
+                SELECT users.id FROM users JOIN reachable ON users.referer_id = reachable.id
+            )
+            SELECT id FROM users
+            WHERE NOT EXISTS (SELECT 1 FROM reachable WHERE reachable.id = users.id)
+            ORDER BY id
+            LIMIT 20
+            """
+        )
+    )
+    user_ids = result.scalars().all()
+    if user_ids:
+        raise RuntimeError(
+            "Referer cycles involving users "
+            f"{', '.join(map(str, user_ids))}, unset their referer_id first."
+        )
+
+    # Backfill the closure from the existing referer links.
+    op.execute(
+        """
+        WITH RECURSIVE tree (ancestor_id, descendant_id, depth) AS (
+            SELECT referer_id, id, 1 FROM users WHERE referer_id IS NOT NULL
+            UNION ALL
+            SELECT users.referer_id, tree.descendant_id, tree.depth + 1
+            FROM tree JOIN users ON users.id = tree.ancestor_id
+            WHERE users.referer_id IS NOT NULL
+        )
+        INSERT INTO referral_closure (ancestor_id, descendant_id, depth)
+        SELECT ancestor_id, descendant_id, depth FROM tree
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_referral_closure_descendant_id'), table_name='referral_closure')
+    op.drop_index('ix_referral_closure_ancestor_id_depth', table_name='referral_closure')
+    op.drop_table('referral_closure')
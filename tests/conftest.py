@@ -3,6 +3,7 @@ from collections.abc import AsyncGenerator
 from typing import Any
 
 import fakeredis
+import httpx
 import pytest_asyncio
 from fastapi_cache import FastAPICache
 from fastapi_cache.backends.redis import RedisBackend
@@ -14,11 +15,20 @@ from sqlalchemy.ext.asyncio import (
     create_async_engine,
 )
 
+from app.auth.google_tokens import clear_signing_keys
 from app.auth.models import User
-from app.auth.service import get_current_user
+from app.auth.service import get_current_user, principal_cache
 from app.config import settings
-from app.database.core import Base, get_db
+from app.database.core import (
+    Base,
+    get_db,
+    get_read_session_factory,
+    get_session_factory,
+)
+from app.http_clients import GOOGLE, HUNTER, override_transport
 from app.main import app
+from app.redis_client import close_redis, init_redis
+from app.referral.cache import clear_local_versions
 
 DATABASE_URL = (
     "postgresql+asyncpg://"
@@ -41,6 +51,50 @@ async def reset_db() -> None:
         await conn.run_sync(Base.metadata.drop_all)
         await conn.run_sync(Base.metadata.create_all)
 
+    principal_cache.clear()
+    clear_local_versions()
+    clear_signing_keys()
+
+
+def hunter_handler(request: httpx.Request) -> httpx.Response:
+    """Stands in for the hunter.io email verifier."""
+    result = "deliverable"
+    if request.url.params["email"].startswith("undeliverable"):
+        result = "undeliverable"
+
+    return httpx.Response(200, json={"data": {"result": result}})
+
+
+# Keep outbound calls off the network
+@pytest_asyncio.fixture(autouse=True)
+async def mock_upstreams() -> AsyncGenerator[None, Any]:
+    """Route hunter.io requests to a local mock transport."""
+    await override_transport(HUNTER, httpx.MockTransport(hunter_handler))
+    yield
+    await override_transport(HUNTER, None)
+
+
+@pytest_asyncio.fixture()
+async def google_transport() -> AsyncGenerator[dict[str, Any], Any]:
+    """
+    Route Google OAuth requests to a local mock transport.
+
+    Tests fill the yielded dict with the JSON the mocked endpoints return,
+    or with whole responses.
+    """
+    responses: dict[str, Any] = {}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        response = responses[request.url.path]
+        if isinstance(response, httpx.Response):
+            return response
+
+        return httpx.Response(200, json=response)
+
+    await override_transport(GOOGLE, httpx.MockTransport(handler))
+    yield responses
+    await override_transport(GOOGLE, None)
+
 
 # Override the database connection to use the test database
 async def get_database_override() -> AsyncGenerator[AsyncSession, Any]:
@@ -60,6 +114,8 @@ async def test_db() -> AsyncGenerator[AsyncSession, Any]:
 async def client() -> AsyncGenerator[AsyncClient, Any]:
     """Fixture to yield a test client for the app."""
     app.dependency_overrides[get_db] = get_database_override
+    app.dependency_overrides[get_session_factory] = lambda: async_test_session
+    app.dependency_overrides[get_read_session_factory] = lambda: async_test_session
     async with AsyncClient(
         transport=ASGITransport(app=app),
         base_url="http://testserver/api/v1",
@@ -78,11 +134,20 @@ def event_loop():
 
 
 @pytest_asyncio.fixture(scope="function")
-def setup_cache():
-    fake_redis = fakeredis.FakeStrictRedis()
-    FastAPICache.init(RedisBackend(fake_redis), prefix="fastapi-cache")
+async def redis() -> AsyncGenerator[fakeredis.FakeAsyncRedis, Any]:
+    """Fixture to set up the shared Redis connection with a fake server."""
+    fake_redis = init_redis(fakeredis.FakeAsyncRedis())
+    yield fake_redis
+    await close_redis()
+
+
+@pytest_asyncio.fixture(scope="function")
+async def setup_cache(redis: fakeredis.FakeAsyncRedis) -> AsyncGenerator[None, Any]:
+    """Fixture to set up the response cache on the shared fake Redis."""
+    FastAPICache.reset()
+    FastAPICache.init(RedisBackend(redis), prefix="fastapi-cache")
     yield
-    FastAPICache.clear()
+    FastAPICache.reset()
 
 
 @pytest_asyncio.fixture(scope="function")
@@ -3,8 +3,19 @@ from fastapi import status
 from httpx import AsyncClient
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.auth.models import User
-from app.security import verify_password
+from app.auth.models import User, UserCreateByLink
+from app.auth.service import (
+    create,
+    invalidate_principal,
+    principal_cache,
+    principal_cache_stats,
+)
+from app.security import (
+    create_access_token,
+    get_password_hash,
+    password_hasher,
+    verify_password,
+)
 
 
 @pytest.mark.asyncio
@@ -26,3 +37,154 @@ async def test_signup_new_user(client: AsyncClient, test_db: AsyncSession):
 
     assert user_from_db.email == post_body["email"]
     assert verify_password(post_body["password"], user_from_db.password)
+
+
+@pytest.mark.asyncio
+async def test_signup_rejections(
+    client: AsyncClient, test_db: AsyncSession, monkeypatch
+):
+    test_db.add(User(email="taken@usertest.com"))
+    await test_db.commit()
+
+    hashed = []
+
+    async def tracking_hash(password: str) -> str:
+        hashed.append(password)
+        return "hash"
+
+    monkeypatch.setattr(password_hasher, "hash", tracking_hash)
+
+    cases = [
+        ("taken@usertest.com", None, "User with email `taken@usertest.com`"),
+        ("undeliverable@usertest.com", None, "The email address provided"),
+        ("new@usertest.com", "nosuchcd", "Incorrect referral code."),
+    ]
+    for email, code, detail in cases:
+        response = await client.post(
+            "/auth/signup",
+            json={"email": email, "password": "test123", "referer_referral_code": code},
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.json()["detail"].startswith(detail)
+
+    # Rejected signups don't take a slot of the password hasher.
+    assert hashed == []
+
+
+@pytest.mark.asyncio
+async def test_create_handles_duplicate_email_race(test_db: AsyncSession):
+    test_db.add(User(email="taken@usertest.com"))
+    await test_db.commit()
+
+    user_in = UserCreateByLink(email="taken@usertest.com", password="test123")
+    user = await create(
+        db_session=test_db, user_in=user_in, hashed_password="hash", referer_id=None
+    )
+
+    assert user is None
+
+
+@pytest.mark.asyncio
+async def test_cached_principal_can_change_password(
+    client: AsyncClient, test_db: AsyncSession
+):
+    user = User(email="cached@example.com", password=get_password_hash("old123"))
+    test_db.add(user)
+    await test_db.commit()
+
+    headers = {"Authorization": f"Bearer {create_access_token({'user_id': user.id})}"}
+
+    response = await client.post("/referrals/code", headers=headers)
+    assert response.status_code == status.HTTP_201_CREATED
+    assert principal_cache.get(user.id) is None
+
+    response = await client.delete("/referrals/code", headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert principal_cache.get(user.id) is None
+
+    def change_password(old_password: str, new_password: str):
+        return client.put(
+            "/auth/password",
+            headers=headers,
+            json={
+                "old_password": old_password,
+                "new_password": new_password,
+                "confirm_new_password": new_password,
+            },
+        )
+
+    response = await change_password("wrong", "new123")
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    assert principal_cache.get(user.id) is not None
+
+    hits = principal_cache_stats.hits
+    response = await change_password("old123", "new123")
+    assert response.status_code == status.HTTP_200_OK
+    assert principal_cache_stats.hits == hits + 1
+    assert principal_cache.get(user.id) is None
+
+    await test_db.refresh(user)
+    assert verify_password("new123", user.password)
+
+
+@pytest.mark.asyncio
+async def test_principals_changed_by_another_worker_are_reloaded(
+    client: AsyncClient, test_db: AsyncSession, redis
+):
+    user = User(email="cached@example.com", password=get_password_hash("old123"))
+    test_db.add(user)
+    await test_db.commit()
+
+    headers = {"Authorization": f"Bearer {create_access_token({'user_id': user.id})}"}
+
+    def change_password(old_password: str):
+        return client.put(
+            "/auth/password",
+            headers=headers,
+            json={
+                "old_password": old_password,
+                "new_password": "other123",
+                "confirm_new_password": "other123",
+            },
+        )
+
+    response = await change_password("wrong")
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    cached = principal_cache.get(user.id)
+    assert cached is not None
+
+    # Another worker changes the password, which only clears its own cache.
+    user.password = get_password_hash("new123")
+    await test_db.commit()
+    await invalidate_principal(user.id)
+    principal_cache.set(user.id, cached, 30)
+
+    response = await change_password("old123")
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    response = await change_password("new123")
+    assert response.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.asyncio
+async def test_signin_releases_the_connection_while_hashing(
+    client: AsyncClient, test_db: AsyncSession, monkeypatch
+):
+    test_db.add(User(email="user@usertest.com", password=get_password_hash("ok")))
+    await test_db.commit()
+
+    checked_out = []
+    verify = password_hasher.verify
+
+    async def tracking_verify(password: str, hashed_password: str) -> bool:
+        checked_out.append(test_db.bind.pool.checkedout())
+        return await verify(password, hashed_password)
+
+    monkeypatch.setattr(password_hasher, "verify", tracking_verify)
+    response = await client.post(
+        "/auth/signin",
+        data={"username": "user@usertest.com", "password": "ok"},
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert checked_out == [0]
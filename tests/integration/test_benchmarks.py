@@ -0,0 +1,62 @@
+import pytest
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from benchmarks.dataset import generate_rows, seed
+from benchmarks.runner import Runner
+from benchmarks.scenario import Scenario
+
+
+@pytest.mark.asyncio
+async def test_seed_is_reproducible(test_db: AsyncSession):
+    def generate() -> list[tuple]:
+        rows = generate_rows(users=50, referral_ratio=0.5, seed=1, prefix="bench")
+        return [
+            (row["email"], row["referral_code"], row["referer_legacy_id"])
+            for row in rows
+        ]
+
+    rows = generate()
+    assert rows == generate()
+
+    dataset = await seed(db_session=test_db, users=50, referral_ratio=0.5, seed=1)
+
+    assert len(dataset.users) == 50
+    assert dataset.referers
+    assert [user["email"] for user in dataset.users] == [row[0] for row in rows]
+
+
+@pytest.mark.asyncio
+async def test_runner_reports_recorded_stages(
+    client: AsyncClient, test_db: AsyncSession
+):
+    dataset = await seed(db_session=test_db, users=20)
+    scenario = Scenario.model_validate(
+        {
+            "name": "smoke",
+            "stages": [
+                {"concurrency": 1, "duration": 0.2, "record": False},
+                {"concurrency": 3, "duration": 0.5, "ramp": 0.1},
+            ],
+            "requests": [
+                {"name": "referrals page", "path": "/referrals/{referer.id}/page"},
+                {"name": "depth", "path": "/referrals/{user.id}/depth"},
+                {
+                    "name": "create code",
+                    "method": "POST",
+                    "path": "/referrals/code",
+                    "auth": True,
+                },
+            ],
+        }
+    )
+    # The signin form can't be sent with the fixture's JSON content type.
+    del client.headers["Content-Type"]
+
+    report = await Runner(scenario, client=client, dataset=dataset).run()
+
+    assert report["scenario"] == "smoke"
+    assert report["total"]["requests"] > 0
+    assert report["total"]["errors"] == 0
+    assert set(report["requests"]) <= {"referrals page", "depth", "create code"}
+    assert 0.5 <= report["duration"] < 1
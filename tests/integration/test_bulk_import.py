@@ -0,0 +1,96 @@
+import json
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.auth.bulk_import import ImportFormatError, import_users
+from app.auth.models import User
+from app.referral.models import ReferralClosure
+from app.security import get_password_hash
+
+HASH = get_password_hash("test123")
+
+
+@pytest.mark.asyncio
+async def test_import_users_ndjson(test_db: AsyncSession, tmp_path):
+    test_db.add(User(email="existing@example.com", referral_code="taken123"))
+    await test_db.commit()
+
+    rows = [
+        # 0 is a valid legacy id.
+        {"legacy_id": 0, "email": "root@example.com", "password": HASH},
+        {
+            "legacy_id": 11,
+            "email": "child@example.com",
+            "password": HASH,
+            "referral_code": "child123",
+            "referral_code_exp": "2030-01-01T00:00:00+00:00",
+            "referer_legacy_id": 0,
+        },
+        {"legacy_id": 12, "email": "grandchild@example.com", "referer_legacy_id": 11},
+        {"legacy_id": 13, "email": "existing@example.com", "password": HASH},
+        {"legacy_id": 14, "email": "child@example.com", "password": HASH},
+        {"legacy_id": 15, "email": "badhash@example.com", "password": "plain"},
+        {"legacy_id": 16, "email": "code@example.com", "referral_code": "taken123"},
+        {"legacy_id": 17, "email": "orphan@example.com", "referer_legacy_id": 99},
+    ]
+    path = tmp_path / "users.ndjson"
+    path.write_text("\n".join(json.dumps(row) for row in rows))
+    conflicts_out = tmp_path / "conflicts.csv"
+
+    report = await import_users(
+        db_session=test_db,
+        path=path,
+        file_format="ndjson",
+        conflicts_out=conflicts_out,
+    )
+
+    assert report.rows == 8
+    assert report.inserted == 5
+    assert report.skipped == 3
+    assert report.referers_linked == 2
+    assert report.referral_codes_dropped == 1
+    assert {(c.line, c.reason) for c in report.conflicts} == {
+        (4, "email already exists"),
+        (5, "duplicate email in file"),
+        (6, "invalid password hash"),
+        (7, "referral code dropped: invalid or already in use"),
+        (8, "unknown referer"),
+    }
+    assert len(conflicts_out.read_text().splitlines()) == 6
+
+    result = await test_db.execute(select(User.email, User.id, User.referer_id))
+    users = {email: (user_id, referer_id) for email, user_id, referer_id in result}
+    root_id = users["root@example.com"][0]
+    child_id = users["child@example.com"][0]
+    grandchild_id = users["grandchild@example.com"][0]
+    assert users["child@example.com"][1] == root_id
+    assert users["grandchild@example.com"][1] == child_id
+    assert users["code@example.com"][1] is None
+
+    result = await test_db.execute(
+        select(ReferralClosure.ancestor_id, ReferralClosure.descendant_id)
+    )
+    assert set(result.all()) == {
+        (root_id, child_id),
+        (root_id, grandchild_id),
+        (child_id, grandchild_id),
+    }
+
+
+@pytest.mark.asyncio
+async def test_import_users_rejects_referer_cycles(test_db: AsyncSession, tmp_path):
+    path = tmp_path / "users.csv"
+    path.write_text(
+        "legacy_id,email,referer_legacy_id\n"
+        "1,first@example.com,2\n"
+        "2,second@example.com,1\n"
+    )
+
+    with pytest.raises(ImportFormatError):
+        await import_users(db_session=test_db, path=path, file_format="csv")
+
+    await test_db.rollback()
+    result = await test_db.execute(select(User))
+    assert result.scalars().all() == []
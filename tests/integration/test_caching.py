@@ -0,0 +1,99 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.redis import RedisBackend
+from fastapi_cache.decorator import cache
+
+from app.caching import RevalidatingBackend, _pack
+
+
+def revalidating(redis, **kwargs) -> RevalidatingBackend:
+    options = {"stale_ttl": 60, "lock_timeout": 2.0, "beta": 0.0, **kwargs}
+    return RevalidatingBackend(RedisBackend(redis), **options)
+
+
+@pytest.fixture()
+def use_backend():
+    def use(backend):
+        FastAPICache.reset()
+        FastAPICache.init(backend, prefix="test")
+
+    yield use
+    FastAPICache.reset()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_are_computed_once(redis, use_backend):
+    # Two backends on one Redis stand in for two processes.
+    backends = [revalidating(redis), revalidating(redis)]
+    calls = []
+
+    @cache(expire=60, namespace="once")
+    async def compute(value: int) -> dict[str, int]:
+        calls.append(value)
+        await asyncio.sleep(0.2)
+        return {"value": value}
+
+    async def request(backend: RevalidatingBackend) -> dict[str, int]:
+        use_backend(backend)
+        return await compute(1)
+
+    results = await asyncio.gather(*(request(backends[i % 2]) for i in range(10)))
+
+    assert calls == [1]
+    assert results == [{"value": 1}] * 10
+    assert await redis.keys("*:lock") == []
+
+
+@pytest.mark.asyncio
+async def test_failed_computations_are_not_waited_for(redis, use_backend):
+    use_backend(revalidating(redis, lock_timeout=5.0))
+    calls = []
+
+    @cache(expire=60, namespace="failing")
+    async def compute() -> dict[str, int]:
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        raise HTTPException(status_code=404)
+
+    started = time.monotonic()
+    results = await asyncio.gather(
+        *(compute() for _ in range(3)), return_exceptions=True
+    )
+    # Same task as the failed computation.
+    with pytest.raises(HTTPException):
+        await compute()
+
+    assert all(isinstance(result, HTTPException) for result in results)
+    assert len(calls) == 4
+    assert time.monotonic() - started < 1
+
+
+@pytest.mark.asyncio
+async def test_stale_entries_are_served_while_one_request_refreshes(redis):
+    backend = revalidating(redis)
+    await redis.set("key", _pack(b"old", time.time() - 1, 0.1), ex=60)
+
+    first, second = await asyncio.gather(
+        backend.get_with_ttl("key"), backend.get_with_ttl("key")
+    )
+    assert sorted([first, second], key=repr) == [(0, None), (0, b"old")]
+
+    await backend.set("key", b"new", 30)
+    ttl, value = await backend.get_with_ttl("key")
+    assert value == b"new"
+    assert 29 <= ttl <= 30
+    assert 60 < await redis.ttl("key") <= 90
+
+
+@pytest.mark.asyncio
+async def test_entries_are_refreshed_early_near_expiry(redis, monkeypatch):
+    await redis.set("key", _pack(b"value", time.time() + 5, 10.0), ex=60)
+    monkeypatch.setattr("app.caching.random.random", lambda: 0.9)
+
+    assert await revalidating(redis, beta=0.0).get_with_ttl("key") == (4, b"value")
+    # -log(0.1) * 10s reaches past the expiry in 5s.
+    assert await revalidating(redis, beta=1.0).get_with_ttl("key") == (0, None)
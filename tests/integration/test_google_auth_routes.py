@@ -1,6 +1,70 @@
+import time
+from typing import Any
+
+import httpx
 import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
 from fastapi import status
 from httpx import AsyncClient
+from jose import jwk, jwt
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.auth.google_tokens import GOOGLE_JWKS_CACHE_KEY, clear_signing_keys
+from app.auth.service import get_by_email
+from app.config import settings
+
+CERTS_PATH = "/oauth2/v3/certs"
+TOKEN_PATH = "/o/oauth2/token"
+
+
+def generate_key(kid: str) -> tuple[str, dict[str, Any]]:
+    """A private key standing in for Google's, and its public JWK."""
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+    public = jwk.construct(pem, "RS256").public_key().to_dict()
+
+    return pem, {**public, "kid": kid, "use": "sig"}
+
+
+KEY, JWK = generate_key("key-1")
+ROTATED_KEY, ROTATED_JWK = generate_key("key-2")
+
+
+def certs(
+    *keys: dict[str, Any],
+    max_age: int = 3600,
+    age: int = 0,
+    cache_control: str = "public, max-age={max_age}, must-revalidate",
+) -> httpx.Response:
+    return httpx.Response(
+        200,
+        json={"keys": list(keys)},
+        headers={
+            "Cache-Control": cache_control.format(max_age=max_age),
+            "Age": str(age),
+        },
+    )
+
+
+def id_token(key: str = KEY, kid: str = "key-1", **claims: Any) -> str:
+    now = int(time.time())
+    payload = {
+        "iss": "https://accounts.google.com",
+        "aud": settings.GOOGLE_CLIENT_ID,
+        "sub": "google-id-1",
+        "email": "googleuser@gmail.com",
+        "email_verified": True,
+        "iat": now,
+        "exp": now + 3600,
+        **claims,
+    }
+
+    return jwt.encode(payload, key, algorithm="RS256", headers={"kid": kid})
 
 
 @pytest.mark.asyncio
@@ -11,3 +75,125 @@ async def test_login_google(client: AsyncClient):
         status.HTTP_307_TEMPORARY_REDIRECT,
     )
     assert "https://accounts.google.com/o/oauth2/auth" in response.headers["location"]
+
+
+@pytest.mark.asyncio
+async def test_google_callback_creates_user(
+    client: AsyncClient, test_db: AsyncSession, google_transport: dict[str, Any]
+):
+    google_transport[CERTS_PATH] = certs(JWK)
+    google_transport[TOKEN_PATH] = {
+        "access_token": "google-access-token",
+        "id_token": id_token(),
+    }
+
+    response = await client.get("/google/auth/callback", params={"code": "code"})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["token_type"] == "bearer"
+
+    user = await get_by_email(db_session=test_db, email="googleuser@gmail.com")
+    assert user is not None
+    assert user.google_id == "google-id-1"
+
+
+@pytest.mark.asyncio
+async def test_signing_keys_are_cached_per_cache_headers(
+    client: AsyncClient, redis, google_transport: dict[str, Any]
+):
+    google_transport[CERTS_PATH] = certs(JWK, max_age=3600, age=600)
+    google_transport[TOKEN_PATH] = {"id_token": id_token()}
+
+    response = await client.get("/google/auth/callback", params={"code": "code"})
+    assert response.status_code == status.HTTP_200_OK
+    assert 2990 <= await redis.ttl(GOOGLE_JWKS_CACHE_KEY) <= 3000
+
+    # Later sign-ins don't fetch the keys, neither in this process nor in
+    # another one, which finds them in Redis.
+    del google_transport[CERTS_PATH]
+    for code in ("again", "other-process"):
+        if code == "other-process":
+            clear_signing_keys()
+        google_transport[TOKEN_PATH] = {
+            "id_token": id_token(sub=f"google-{code}", email=f"{code}@gmail.com")
+        }
+        response = await client.get("/google/auth/callback", params={"code": code})
+        assert response.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.asyncio
+async def test_signing_keys_marked_no_store_arent_cached(
+    client: AsyncClient, redis, google_transport: dict[str, Any]
+):
+    google_transport[CERTS_PATH] = certs(JWK, cache_control="no-store, max-age=3600")
+    google_transport[TOKEN_PATH] = {"id_token": id_token()}
+
+    response = await client.get("/google/auth/callback", params={"code": "code"})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert await redis.get(GOOGLE_JWKS_CACHE_KEY) is None
+
+
+@pytest.mark.parametrize("cached", [b"not json", b"[]", b'{"keys": [{"kid": 1}]}'])
+@pytest.mark.asyncio
+async def test_unreadable_cached_signing_keys_are_fetched_again(
+    client: AsyncClient, redis, google_transport: dict[str, Any], cached: bytes
+):
+    await redis.set(GOOGLE_JWKS_CACHE_KEY, cached, ex=3600)
+    google_transport[CERTS_PATH] = certs(JWK)
+    google_transport[TOKEN_PATH] = {"id_token": id_token()}
+
+    response = await client.get("/google/auth/callback", params={"code": "code"})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert await redis.get(GOOGLE_JWKS_CACHE_KEY) != cached
+
+
+@pytest.mark.parametrize(
+    "response_data",
+    [
+        {},
+        {"id_token": "not-a-token"},
+        {"id_token": id_token(aud="another-client")},
+        {"id_token": id_token(iss="https://accounts.example.com")},
+        {"id_token": id_token(exp=int(time.time()) - 3600)},
+        {"id_token": id_token(email_verified=False)},
+        {"id_token": id_token(key=ROTATED_KEY)},
+        {"id_token": id_token(at_hash="wrong"), "access_token": "access-token"},
+    ],
+)
+@pytest.mark.asyncio
+async def test_google_callback_rejects_invalid_id_tokens(
+    client: AsyncClient,
+    test_db: AsyncSession,
+    google_transport: dict[str, Any],
+    response_data: dict[str, Any],
+):
+    google_transport[CERTS_PATH] = certs(JWK)
+    google_transport[TOKEN_PATH] = response_data
+
+    response = await client.get("/google/auth/callback", params={"code": "code"})
+
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    assert await get_by_email(db_session=test_db, email="googleuser@gmail.com") is None
+
+
+@pytest.mark.asyncio
+async def test_rotated_signing_keys_are_reloaded(
+    client: AsyncClient, google_transport: dict[str, Any], monkeypatch
+):
+    google_transport[CERTS_PATH] = certs(JWK)
+    google_transport[TOKEN_PATH] = {"id_token": id_token()}
+    response = await client.get("/google/auth/callback", params={"code": "code"})
+    assert response.status_code == status.HTTP_200_OK
+
+    google_transport[CERTS_PATH] = certs(JWK, ROTATED_JWK)
+    google_transport[TOKEN_PATH] = {"id_token": id_token(ROTATED_KEY, "key-2")}
+
+    # Keys loaded moments ago aren't reloaded for an unknown key id.
+    response = await client.get("/google/auth/callback", params={"code": "code"})
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    monkeypatch.setattr("app.auth.google_tokens.MIN_RELOAD_INTERVAL", 0)
+    response = await client.get("/google/auth/callback", params={"code": "code"})
+    assert response.status_code == status.HTTP_200_OK
@@ -0,0 +1,78 @@
+import fakeredis
+import pytest
+from fastapi import FastAPI
+from fastapi_cache.backends.redis import RedisBackend
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app.caching import InstrumentedBackend
+from app.http_clients import HUNTER, get_http_client
+from app.metrics import registry, setup_metrics
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_reports_routes_and_cache():
+    app = FastAPI()
+    setup_metrics(app, engines={})
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id: int) -> dict[str, int]:
+        return {"id": item_id}
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://testserver"
+    ) as client:
+        for item_id in (1, 2):
+            await client.get(f"/items/{item_id}")
+        await client.get("/nothing/here")
+
+        backend = InstrumentedBackend(RedisBackend(fakeredis.FakeAsyncRedis()))
+        await backend.set("fastapi-cache:metrics-test:key", b"1")
+        await backend.get_with_ttl("fastapi-cache:metrics-test:key")
+        await backend.get_with_ttl("fastapi-cache:metrics-test:other")
+
+        response = await client.get("/metrics")
+
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    lines = response.text.splitlines()
+    assert (
+        'http_requests_total{method="GET",route="/items/{item_id}",status="200"} 2.0'
+        in lines
+    )
+    assert (
+        'http_requests_total{method="GET",route="unmatched",status="404"} 1.0' in lines
+    )
+    assert (
+        'http_request_duration_seconds_count{method="GET",route="/items/{item_id}"} 2'
+        in lines
+    )
+    assert 'cache_requests_total{namespace="metrics-test",result="hit"} 1.0' in lines
+    assert 'cache_requests_total{namespace="metrics-test",result="miss"} 1.0' in lines
+
+
+@pytest.mark.asyncio
+async def test_metrics_time_queries_and_upstream_calls(test_db: AsyncSession):
+    # A throwaway engine, so the listeners don't stay on the shared one.
+    engine = create_async_engine(test_db.bind.url)
+    setup_metrics(FastAPI(), engines={"metrics-test": engine})
+
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+    await engine.dispose()
+    await get_http_client(HUNTER).get("https://api.hunter.io/v2/email-verifier?email=a")
+
+    lines = registry.render().splitlines()
+    assert any(
+        line.startswith(
+            'db_query_duration_seconds_count{engine="metrics-test",operation="SELECT"}'
+        )
+        for line in lines
+    )
+    assert any(
+        line.startswith(
+            'upstream_request_duration_seconds_count{upstream="hunter",status="200"}'
+        )
+        for line in lines
+    )
+    assert 'db_pool_connections{engine="primary",state="checked_out"} 0' in lines
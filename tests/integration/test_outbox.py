@@ -0,0 +1,135 @@
+import asyncio
+import threading
+from datetime import timedelta
+
+import pytest
+from fastapi import status
+from httpx import AsyncClient
+from kombu.exceptions import OperationalError
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.auth.models import User
+from app.config import settings
+from app.outbox.models import EmailOutbox
+from app.outbox.relay import purge_outbox, relay_batch
+from app.outbox.service import enqueue_email
+
+
+async def outbox(db_session: AsyncSession) -> list[EmailOutbox]:
+    db_session.expire_all()
+    result = await db_session.scalars(select(EmailOutbox).order_by(EmailOutbox.id))
+    return list(result)
+
+
+@pytest.mark.asyncio
+async def test_password_reset_email_is_written_to_the_outbox(
+    client: AsyncClient, test_db: AsyncSession
+):
+    test_db.add(User(email="reset@usertest.com"))
+    await test_db.commit()
+
+    response = await client.post(
+        "/auth/password/reset", json={"email": "reset@usertest.com"}
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    [email] = await outbox(test_db)
+    assert email.to_email == "reset@usertest.com"
+    assert "/reset-password/" in email.body
+    assert email.sent_at is None
+
+
+@pytest.mark.asyncio
+async def test_relay_publishes_pending_emails_once(test_db: AsyncSession):
+    for i in range(3):
+        enqueue_email(
+            db_session=test_db, to_email=f"{i}@usertest.com", subject="S", body="B"
+        )
+    await test_db.commit()
+
+    published = []
+    relayed = await relay_batch(
+        db_session=test_db, batch_size=2, publish=published.append
+    )
+    assert relayed == 2
+    assert [[m["to_email"] for m in batch] for batch in published] == [
+        ["0@usertest.com", "1@usertest.com"]
+    ]
+    assert published[0][0]["id"] is not None
+
+    assert await relay_batch(db_session=test_db, publish=published.append) == 1
+    assert await relay_batch(db_session=test_db, publish=published.append) == 0
+    assert all(email.sent_at is not None for email in await outbox(test_db))
+
+
+@pytest.mark.asyncio
+async def test_relay_backs_off_and_gives_up(test_db: AsyncSession, monkeypatch):
+    monkeypatch.setattr(settings, "OUTBOX_MAX_ATTEMPTS", 2)
+    enqueue_email(db_session=test_db, to_email="a@usertest.com", subject="S", body="B")
+    await test_db.commit()
+
+    def broker_down(messages: list) -> None:
+        raise OperationalError("connection refused")
+
+    assert await relay_batch(db_session=test_db, publish=broker_down) == 0
+    [email] = await outbox(test_db)
+    assert email.attempts == 1
+    assert email.next_attempt_at > email.created_at
+    assert email.failed_at is None
+    assert email.last_error == "connection refused"
+
+    # Not due yet.
+    assert await relay_batch(db_session=test_db, publish=broker_down) == 0
+    assert (await outbox(test_db))[0].attempts == 1
+
+    email.next_attempt_at = email.created_at
+    await test_db.commit()
+    await relay_batch(db_session=test_db, publish=broker_down)
+    [email] = await outbox(test_db)
+    assert email.attempts == 2
+    assert email.failed_at is not None
+
+
+@pytest.mark.asyncio
+async def test_concurrent_relays_skip_locked_rows(test_db: AsyncSession):
+    enqueue_email(db_session=test_db, to_email="a@usertest.com", subject="S", body="B")
+    await test_db.commit()
+
+    session_factory = async_sessionmaker(test_db.bind, expire_on_commit=False)
+    publishing, release = threading.Event(), threading.Event()
+
+    def slow_publish(messages: list) -> None:
+        publishing.set()
+        release.wait(5)
+
+    async with session_factory() as first, session_factory() as second:
+        relay = asyncio.create_task(relay_batch(db_session=first, publish=slow_publish))
+        await asyncio.to_thread(publishing.wait, 5)
+
+        assert await relay_batch(db_session=second, publish=slow_publish) == 0
+
+        release.set()
+        assert await relay == 1
+
+
+@pytest.mark.asyncio
+async def test_purge_deletes_sent_and_failed_emails(test_db: AsyncSession):
+    for to_email in ("sent", "failed", "pending", "recent"):
+        enqueue_email(
+            db_session=test_db,
+            to_email=f"{to_email}@usertest.com",
+            subject="S",
+            body="B",
+        )
+    await test_db.commit()
+
+    sent, failed, pending, recent = await outbox(test_db)
+    long_ago = func.now() - timedelta(days=30)
+    sent.sent_at = long_ago
+    failed.failed_at = long_ago
+    recent.sent_at = func.now()
+    await test_db.commit()
+
+    assert await purge_outbox(db_session=test_db, older_than=timedelta(days=7)) == 2
+    assert [email.id for email in await outbox(test_db)] == [pending.id, recent.id]
@@ -0,0 +1,109 @@
+import asyncio
+
+import fakeredis
+import pytest
+from fastapi import status
+from freezegun import freeze_time
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import rate_limit
+from app.auth.models import User
+from app.rate_limit import Rate, check_rate_limit
+from app.redis_client import close_redis, init_redis
+from app.security import get_password_hash, password_hasher
+
+
+async def signin(client: AsyncClient, password: str = "wrong"):
+    return await client.post(
+        "/auth/signin",
+        data={"username": "limited@example.com", "password": password},
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+
+
+@pytest.mark.asyncio
+async def test_signin_is_limited_per_account(
+    client: AsyncClient, test_db: AsyncSession, redis, monkeypatch
+):
+    test_db.add(User(email="limited@example.com", password=get_password_hash("ok")))
+    await test_db.commit()
+    monkeypatch.setattr(rate_limit, "ACCOUNT_RATE", Rate(2, 60))
+
+    assert (await signin(client)).status_code == status.HTTP_401_UNAUTHORIZED
+    assert (await signin(client, "ok")).status_code == status.HTTP_200_OK
+
+    response = await signin(client, "ok")
+    assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    assert response.headers["Retry-After"] == "30"
+
+
+@pytest.mark.asyncio
+async def test_signup_is_limited_per_ip(client: AsyncClient, redis, monkeypatch):
+    monkeypatch.setattr(rate_limit, "IP_RATE", Rate(1, 10))
+
+    statuses = []
+    for email in ("first@example.com", "second@example.com"):
+        response = await client.post(
+            "/auth/signup",
+            json={"email": email, "password": "test123", "referer_referral_code": None},
+        )
+        statuses.append(response.status_code)
+
+    assert statuses == [status.HTTP_201_CREATED, status.HTTP_429_TOO_MANY_REQUESTS]
+
+
+@pytest.mark.asyncio
+async def test_signup_is_shed_when_the_hasher_is_saturated(
+    client: AsyncClient, monkeypatch
+):
+    monkeypatch.setattr(password_hasher, "max_queue", -password_hasher.max_workers)
+
+    response = await client.post(
+        "/auth/signup",
+        json={"email": "a@example.com", "password": "x", "referer_referral_code": None},
+    )
+
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert "Retry-After" in response.headers
+
+
+@pytest.mark.asyncio
+async def test_buckets_refill(redis):
+    subject = ("10.0.0.1", Rate(2, 10))
+
+    with freeze_time("2026-01-01 00:00:00") as frozen:
+        await check_rate_limit("test", ip=subject)
+        await check_rate_limit("test", ip=subject)
+        with pytest.raises(rate_limit.RateLimitExceededException) as exc_info:
+            await check_rate_limit("test", ip=subject)
+        assert exc_info.value.headers == {"Retry-After": "5"}
+
+        frozen.tick(5)
+        await check_rate_limit("test", ip=subject)
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_fails_open():
+    server = fakeredis.FakeServer()
+    server.connected = False
+    init_redis(fakeredis.FakeAsyncRedis(server=server))
+    try:
+        for _ in range(3):
+            await check_rate_limit("test", ip=("10.0.0.1", Rate(1, 60)))
+    finally:
+        await close_redis()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_a_bucket(redis):
+    async def allowed() -> bool:
+        try:
+            await check_rate_limit("test", ip=("10.0.0.1", Rate(5, 60)))
+        except rate_limit.RateLimitExceededException:
+            return False
+        return True
+
+    results = await asyncio.gather(*(allowed() for _ in range(20)))
+
+    assert sum(results) == 5
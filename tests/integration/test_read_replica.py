@@ -0,0 +1,163 @@
+import pytest
+import pytest_asyncio
+from fastapi import HTTPException, status
+from httpx import AsyncClient
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.auth.models import User
+from app.config import settings
+from app.database import core
+from app.main import app
+from app.referral.service import set_referer_id
+from app.security import create_access_token, get_password_hash
+
+
+@pytest.fixture()
+def use_replica(monkeypatch):
+    """Points the read replica at the given engine and forgets past checks."""
+
+    def use(engine):
+        replica_session = async_sessionmaker(engine)
+        monkeypatch.setattr(core, "replica_engine", engine)
+        monkeypatch.setattr(core, "replica_session", replica_session)
+        monkeypatch.setattr(core, "_replica_checked_at", None)
+        return replica_session
+
+    return use
+
+
+@pytest_asyncio.fixture()
+async def stale_replica(test_db: AsyncSession):
+    """
+    Makes read-only handlers see the database as it is when the returned
+    function is called, like a replica that stopped replaying there.
+    """
+    async with async_sessionmaker(test_db.bind)() as stale_session:
+
+        async def get_stale_db():
+            yield stale_session
+
+        async def freeze() -> None:
+            await stale_session.connection(
+                execution_options={"isolation_level": "REPEATABLE READ"}
+            )
+            await stale_session.execute(select(1))
+            app.dependency_overrides[core.get_read_db] = get_stale_db
+
+        yield freeze
+
+
+@pytest.mark.asyncio
+async def test_reads_go_to_a_healthy_replica(use_replica, test_db: AsyncSession):
+    # The test database isn't in recovery, so it reports no lag.
+    replica_session = use_replica(test_db.bind)
+
+    assert await core.replica_is_usable()
+    assert await core.get_read_session_factory() is replica_session
+
+    sessions = core.get_read_db(test_db)
+    assert await anext(sessions) is not test_db
+    await sessions.aclose()
+
+
+@pytest.mark.asyncio
+async def test_reads_fall_back_to_the_primary(
+    use_replica, test_db: AsyncSession, monkeypatch
+):
+    monkeypatch.setattr(settings, "DATABASE_REPLICA_MAX_LAG", -1.0)
+    use_replica(test_db.bind)
+    assert not await core.replica_is_usable()
+
+    monkeypatch.setattr(settings, "DATABASE_REPLICA_MAX_LAG", 5.0)
+    use_replica(create_async_engine("postgresql+asyncpg://nobody@127.0.0.1:1/none"))
+    assert not await core.replica_is_usable()
+    assert await core.get_read_session_factory() is core.async_session
+
+    sessions = core.get_read_db(test_db)
+    assert await anext(sessions) is test_db
+    await sessions.aclose()
+
+    # The result is kept until the next check is due.
+    monkeypatch.setattr(core, "replica_engine", test_db.bind)
+    assert not await core.replica_is_usable()
+
+
+@pytest.mark.asyncio
+async def test_referer_is_set_once_with_a_stale_user(test_db: AsyncSession):
+    referer = User(email="referer@usertest.com")
+    user = User(email="user@usertest.com")
+    test_db.add_all([referer, user])
+    await test_db.commit()
+
+    await set_referer_id(db_session=test_db, user=user, referer_id=referer.id)
+
+    # As if the user had been read from a replica before the update landed.
+    set_committed_value(user, "referer_id", None)
+    with pytest.raises(HTTPException) as exc_info:
+        await set_referer_id(db_session=test_db, user=user, referer_id=referer.id)
+
+    assert exc_info.value.status_code == status.HTTP_409_CONFLICT
+
+
+@pytest.mark.asyncio
+async def test_principals_are_not_loaded_from_a_stale_replica(
+    client: AsyncClient, test_db: AsyncSession, stale_replica
+):
+    user = User(email="stale@usertest.com", password=get_password_hash("old123"))
+    test_db.add(user)
+    await test_db.commit()
+
+    await stale_replica()
+    headers = {"Authorization": f"Bearer {create_access_token({'user_id': user.id})}"}
+
+    def change_password(new_password: str):
+        return client.put(
+            "/auth/password",
+            headers=headers,
+            json={
+                "old_password": "old123",
+                "new_password": new_password,
+                "confirm_new_password": new_password,
+            },
+        )
+
+    response = await change_password("new123")
+    assert response.status_code == status.HTTP_200_OK
+
+    # The old password hash doesn't come back into the principal cache.
+    response = await change_password("other123")
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.asyncio
+async def test_versioned_caches_are_not_filled_from_a_stale_replica(
+    client: AsyncClient, test_db: AsyncSession, setup_cache, stale_replica
+):
+    referer = User(email="referer@usertest.com")
+    test_db.add(referer)
+    await test_db.commit()
+    test_db.add(User(email="first@usertest.com", referer_id=referer.id))
+    await test_db.commit()
+
+    await stale_replica()
+    token = create_access_token({"user_id": referer.id})
+    headers = {"Authorization": f"Bearer {token}"}
+
+    response = await client.post("/referrals/code", headers=headers)
+    assert response.status_code == status.HTTP_201_CREATED
+    code = response.json()["referral_code"]
+    response = await client.get("/referrals/email/referer@usertest.com/code")
+    assert response.json()["referral_code"] == code
+
+    response = await client.post(
+        f"/auth/signup/referral/{code}",
+        json={"email": "second@usertest.com", "password": "test123"},
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    response = await client.get(f"/referrals/{referer.id}")
+    assert [user["email"] for user in response.json()] == [
+        "first@usertest.com",
+        "second@usertest.com",
+    ]
@@ -0,0 +1,118 @@
+import asyncio
+from collections.abc import Callable
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import status
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.auth.models import User
+from app.config import settings
+from app.referral import graph
+from app.referral.graph import (
+    get_graph,
+    publish_graph_change,
+    request_graph_reload,
+    run_graph_sync,
+)
+from app.security import create_access_token
+
+pytest.importorskip("numpy")
+
+
+async def eventually(condition: Callable[[], bool]) -> None:
+    for _ in range(300):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+
+    pytest.fail("The referral graph wasn't updated.")
+
+
+@pytest.mark.asyncio
+async def test_graph_follows_signups_and_applied_codes(
+    client: AsyncClient, test_db: AsyncSession, redis, monkeypatch
+):
+    monkeypatch.setattr(settings, "REFERRAL_GRAPH_ENABLED", True)
+    monkeypatch.setattr(graph, "_graph", None)
+    exp = datetime(2030, 1, 1, tzinfo=timezone.utc)
+    root = User(
+        email="root@usertest.com", referral_code="rootcode", referral_code_exp=exp
+    )
+    other = User(email="other@usertest.com")
+    test_db.add_all([root, other])
+    await test_db.commit()
+
+    stop = asyncio.Event()
+    session_factory = async_sessionmaker(test_db.bind, expire_on_commit=False)
+    sync = asyncio.create_task(
+        run_graph_sync(session_factory=session_factory, stop=stop)
+    )
+    try:
+        await eventually(lambda: get_graph() is not None)
+        loaded = get_graph()
+        assert loaded is not None and loaded.users == 2
+
+        response = await client.post(
+            "/auth/signup/referral/rootcode",
+            json={"email": "child@usertest.com", "password": "test123"},
+        )
+        child_id = response.json()["id"]
+        await eventually(lambda: loaded.downline_size(root.id) == 1)
+        assert loaded.depth_of(child_id) == 1
+
+        response = await client.post(
+            "/referrals/code/apply",
+            json={"referral_code": "rootcode"},
+            headers={"Authorization": f"Bearer {create_access_token({'user_id': 2})}"},
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        await eventually(lambda: loaded.downline_size(root.id) == 2)
+
+        response = await client.get(f"/referrals/{root.id}/downline/stats")
+        assert response.json() == {
+            "user_id": root.id,
+            "total": 2,
+            "levels": [{"depth": 1, "count": 2}],
+        }
+
+        await request_graph_reload()
+        await eventually(lambda: get_graph() is not loaded)
+        assert get_graph().level_counts(root.id) == [2]  # type: ignore[union-attr]
+    finally:
+        stop.set()
+        await sync
+
+
+@pytest.mark.asyncio
+async def test_graph_is_dropped_when_it_cant_be_kept_up_to_date(
+    test_db: AsyncSession, redis, monkeypatch
+):
+    monkeypatch.setattr(settings, "REFERRAL_GRAPH_ENABLED", True)
+    monkeypatch.setattr(graph, "_graph", None)
+    test_db.add(User(email="root@usertest.com"))
+    await test_db.commit()
+
+    stop = asyncio.Event()
+    session_factory = async_sessionmaker(test_db.bind, expire_on_commit=False)
+    sync = asyncio.create_task(
+        run_graph_sync(session_factory=session_factory, stop=stop)
+    )
+    try:
+        await eventually(lambda: get_graph() is not None)
+
+        def fail(*args):
+            raise RuntimeError("unexpected")
+
+        monkeypatch.setattr(graph, "_apply", fail)
+        await publish_graph_change(2, 1)
+
+        # Reads fall back to SQL instead of a graph that no longer changes.
+        await eventually(lambda: get_graph() is None)
+        assert not sync.done()
+    finally:
+        stop.set()
+        await sync
+
+    assert get_graph() is None
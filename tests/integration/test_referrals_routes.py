@@ -1,12 +1,28 @@
+import csv
+import gzip
+import json
 from datetime import datetime, timezone
 
 import pytest
 from fastapi import status
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.redis import RedisBackend
 from httpx import AsyncClient
-from sqlalchemy.ext.asyncio import AsyncSession
+from redis.exceptions import RedisError
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
 from app.auth.models import User
+from app.caching import TieredBackend
 from app.config import settings
+from app.referral.cache import invalidate_referrals
+from app.referral.leaderboard import (
+    LEADERBOARD_KEY,
+    rebuild_leaderboard,
+    record_referral,
+)
+from app.referral.utils import generate_signed_referral_code, is_signed_referral_code
+from app.security import create_access_token
 
 
 @pytest.mark.asyncio
@@ -30,6 +46,100 @@ async def test_get_referrals_with_existing_referrals(
     assert users[1]["email"] == "testuser3@usertest.com"
 
 
+@pytest.mark.asyncio
+async def test_cached_referrals_are_sent_as_stored(
+    client: AsyncClient, test_db: AsyncSession, redis, setup_cache
+):
+    test_db.add_all(
+        [
+            User(email="referer@usertest.com"),
+            User(email="first@usertest.com", password="hash", referer_id=1),
+        ]
+    )
+    await test_db.commit()
+
+    miss = await client.get("/referrals/1")
+    hit = await client.get("/referrals/1")
+
+    assert hit.headers["X-FastAPI-Cache"] == "HIT"
+    assert hit.headers["Content-Type"] == "application/json"
+    assert hit.content == miss.content
+    assert hit.json() == [{"email": "first@usertest.com", "id": 2}]
+    # Only the serialized response is cached, not the whole user.
+    keys = await redis.keys("fastapi-cache:*")
+    assert [await redis.get(key) for key in keys] == [miss.content]
+
+
+@pytest.mark.asyncio
+async def test_cache_hits_dont_use_a_connection(
+    client: AsyncClient, test_db: AsyncSession, setup_cache
+):
+    test_db.add_all(
+        [
+            User(email="referer@usertest.com"),
+            User(email="first@usertest.com", referer_id=1),
+        ]
+    )
+    await test_db.commit()
+    await client.get("/referrals/1")
+
+    checkouts = []
+    engine = test_db.bind.sync_engine
+
+    def count(*args):
+        checkouts.append(args)
+
+    event.listen(engine, "checkout", count)
+    try:
+        hit = await client.get("/referrals/1")
+        invalid = await client.get("/referrals/1/page?limit=0")
+    finally:
+        event.remove(engine, "checkout", count)
+
+    assert hit.headers["X-FastAPI-Cache"] == "HIT"
+    assert invalid.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    assert checkouts == []
+
+
+@pytest.mark.asyncio
+async def test_hot_referrals_are_served_from_process_memory(
+    client: AsyncClient, test_db: AsyncSession, redis
+):
+    backend = TieredBackend(RedisBackend(redis), maxsize=100, local_ttl=60, jitter=0.5)
+    FastAPICache.reset()
+    FastAPICache.init(backend, prefix="fastapi-cache")
+    test_db.add_all(
+        [
+            User(email="referer@usertest.com"),
+            User(email="first@usertest.com", referer_id=1),
+        ]
+    )
+    await test_db.commit()
+
+    try:
+        miss = await client.get("/referrals/1")
+        [key] = await redis.keys("fastapi-cache:*")
+        ttl = await redis.ttl(key)
+        assert settings.REFERRALS_CACHE_TTL / 2 <= ttl <= settings.REFERRALS_CACHE_TTL
+
+        # Neither the response nor its version are read from Redis again.
+        await redis.flushall()
+        hit = await client.get("/referrals/1")
+        assert hit.headers["X-FastAPI-Cache"] == "HIT"
+        assert hit.content == miss.content
+        assert backend.stats.hits == 1
+
+        test_db.add(User(email="second@usertest.com", referer_id=1))
+        await test_db.commit()
+        await invalidate_referrals(1)
+
+        response = await client.get("/referrals/1")
+        assert response.headers["X-FastAPI-Cache"] == "MISS"
+        assert len(response.json()) == 2
+    finally:
+        FastAPICache.reset()
+
+
 @pytest.mark.asyncio
 async def test_get_referrals_no_referrals(
     client: AsyncClient, test_db: AsyncSession, setup_cache
@@ -118,3 +228,364 @@ async def test_delete_referral_code(client, current_user):
 
     assert response.status_code == 200
     assert current_user.referral_code is None
+
+
+@pytest.mark.asyncio
+async def test_cached_referrals_are_invalidated_on_change(
+    client: AsyncClient, test_db: AsyncSession, setup_cache
+):
+    exp = datetime(2030, 1, 1, tzinfo=timezone.utc)
+    referer = User(
+        email="referer@usertest.com", referral_code="refcode1", referral_code_exp=exp
+    )
+    test_db.add_all([referer, User(email="first@usertest.com", referer_id=1)])
+    await test_db.commit()
+
+    for cache_status in ("MISS", "HIT"):
+        response = await client.get(f"/referrals/{referer.id}")
+        assert response.headers["X-FastAPI-Cache"] == cache_status
+        assert len(response.json()) == 1
+
+    response = await client.post(
+        "/auth/signup/referral/refcode1",
+        json={"email": "second@usertest.com", "password": "test123"},
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+
+    response = await client.get(f"/referrals/{referer.id}")
+    assert response.headers["X-FastAPI-Cache"] == "MISS"
+    assert len(response.json()) == 2
+
+    response = await client.get(f"/referrals/email/{referer.email}/code")
+    assert response.json()["referral_code"] == "refcode1"
+
+    headers = {"Authorization": f"Bearer {create_access_token({'user_id': 1})}"}
+    response = await client.post("/referrals/code", headers=headers)
+    new_code = response.json()["referral_code"]
+
+    response = await client.get(f"/referrals/email/{referer.email}/code")
+    assert response.json()["referral_code"] == new_code
+    assert response.json()["is_expired"] is False
+
+
+@pytest.mark.asyncio
+async def test_get_referrals_page(client: AsyncClient, test_db: AsyncSession):
+    referer = User(email="referer@usertest.com")
+    test_db.add(referer)
+    await test_db.commit()
+
+    test_db.add_all(
+        [
+            User(email=f"testuser{i}@usertest.com", referer_id=referer.id)
+            for i in range(5)
+        ]
+    )
+    await test_db.commit()
+
+    response = await client.get(f"/referrals/{referer.id}/page", params={"limit": 2})
+    page = response.json()
+
+    assert response.status_code == status.HTTP_200_OK
+    assert [user["email"] for user in page["items"]] == [
+        "testuser0@usertest.com",
+        "testuser1@usertest.com",
+    ]
+
+    emails = [user["email"] for user in page["items"]]
+    while page["next_cursor"] is not None:
+        response = await client.get(
+            f"/referrals/{referer.id}/page",
+            params={"limit": 2, "after_id": page["next_cursor"]},
+        )
+        page = response.json()
+        emails.extend(user["email"] for user in page["items"])
+
+    assert emails == [f"testuser{i}@usertest.com" for i in range(5)]
+
+
+@pytest.mark.asyncio
+async def test_export_referrals(
+    client: AsyncClient, test_db: AsyncSession, monkeypatch
+):
+    referer = User(email="referer@usertest.com")
+    test_db.add(referer)
+    await test_db.commit()
+
+    exp = datetime(2030, 1, 1, tzinfo=timezone.utc)
+    test_db.add_all(
+        [
+            User(email="root@usertest.com"),
+            User(email="first@usertest.com", referer_id=referer.id),
+            User(
+                email="second@usertest.com",
+                referer_id=referer.id,
+                referral_code="second12",
+                referral_code_exp=exp,
+            ),
+        ]
+    )
+    await test_db.commit()
+
+    headers = {"Authorization": f"Bearer {create_access_token({'user_id': 1})}"}
+
+    response = await client.get("/referrals/export", headers=headers)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    monkeypatch.setattr(settings, "REFERRAL_EXPORT_ENABLED", True)
+    response = await client.get("/referrals/export")
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    response = await client.get("/referrals/export", headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["email"] for row in rows] == [
+        "first@usertest.com",
+        "second@usertest.com",
+    ]
+    assert rows[1] == {
+        "referer_id": referer.id,
+        "referer_email": "referer@usertest.com",
+        "user_id": 4,
+        "email": "second@usertest.com",
+        "referral_code": "second12",
+        "referral_code_exp": exp.isoformat(),
+    }
+
+    # httpx decodes Content-Encoding itself, so read the raw body.
+    async with client.stream(
+        "GET",
+        "/referrals/export",
+        params={"format": "csv", "gzip": True},
+        headers=headers,
+    ) as response:
+        assert response.headers["content-encoding"] == "gzip"
+        body = gzip.decompress(b"".join([c async for c in response.aiter_raw()]))
+
+    rows = list(csv.DictReader(body.decode().splitlines()))
+    assert [row["email"] for row in rows] == [
+        "first@usertest.com",
+        "second@usertest.com",
+    ]
+    assert rows[0]["referral_code"] == ""
+
+
+@pytest.mark.asyncio
+async def test_downline_is_maintained_on_signup_and_code_apply(
+    client: AsyncClient, test_db: AsyncSession
+):
+    exp = datetime(2030, 1, 1, tzinfo=timezone.utc)
+    root = User(
+        email="root@usertest.com", referral_code="rootcode", referral_code_exp=exp
+    )
+    test_db.add(root)
+    await test_db.commit()
+
+    async def signup(email: str, code: str) -> int:
+        response = await client.post(
+            f"/auth/signup/referral/{code}",
+            json={"email": email, "password": "test123"},
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        return response.json()["id"]
+
+    async def set_code(user_id: int, code: str) -> None:
+        user = await test_db.get(User, user_id)
+        user.referral_code, user.referral_code_exp = code, exp  # type: ignore
+        await test_db.commit()
+
+    child_id = await signup("child@usertest.com", "rootcode")
+    await set_code(child_id, "childcod")
+    grandchild_id = await signup("grandchild@usertest.com", "childcod")
+
+    # A separate tree that joins below the grandchild via /code/apply.
+    other = User(
+        email="other@usertest.com", referral_code="othercod", referral_code_exp=exp
+    )
+    test_db.add(other)
+    await test_db.commit()
+    other_child_id = await signup("otherchild@usertest.com", "othercod")
+
+    await set_code(grandchild_id, "grandcod")
+
+    token = create_access_token({"user_id": other.id})
+    response = await client.post(
+        "/referrals/code/apply",
+        json={"referral_code": "grandcod"},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+
+    response = await client.get(f"/referrals/{root.id}/downline/stats")
+    assert response.json() == {
+        "user_id": root.id,
+        "total": 4,
+        "levels": [
+            {"depth": 1, "count": 1},
+            {"depth": 2, "count": 1},
+            {"depth": 3, "count": 1},
+            {"depth": 4, "count": 1},
+        ],
+    }
+
+    response = await client.get(
+        f"/referrals/{root.id}/downline", params={"max_depth": 3, "limit": 2}
+    )
+    page = response.json()
+    assert [(u["id"], u["depth"]) for u in page["items"]] == [
+        (child_id, 1),
+        (grandchild_id, 2),
+    ]
+
+    response = await client.get(
+        f"/referrals/{root.id}/downline",
+        params={"max_depth": 3, "after": page["next_cursor"]},
+    )
+    assert [(u["id"], u["depth"]) for u in response.json()["items"]] == [(other.id, 3)]
+
+    response = await client.get(f"/referrals/{other_child_id}/depth")
+    assert response.json() == {"user_id": other_child_id, "depth": 4}
+
+    # The root can't join its own downline.
+    token = create_access_token({"user_id": root.id})
+    response = await client.post(
+        "/referrals/code/apply",
+        json={"referral_code": "othercod"},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.asyncio
+async def test_leaderboard(client: AsyncClient, test_db: AsyncSession, redis):
+    exp = datetime(2030, 1, 1, tzinfo=timezone.utc)
+    first = User(
+        email="first@usertest.com", referral_code="first123", referral_code_exp=exp
+    )
+    second = User(
+        email="second@usertest.com", referral_code="second12", referral_code_exp=exp
+    )
+    test_db.add_all([first, second])
+    await test_db.commit()
+
+    for i, code in enumerate(["first123", "first123", "second12"]):
+        response = await client.post(
+            f"/auth/signup/referral/{code}",
+            json={"email": f"user{i}@usertest.com", "password": "test123"},
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+
+    response = await client.get(
+        "/referrals/leaderboard", params={"limit": 1, "user_id": second.id}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {
+        "top": [{"user_id": first.id, "referrals": 2, "rank": 1}],
+        "user": {"user_id": second.id, "referrals": 1, "rank": 2},
+    }
+
+    await redis.delete(LEADERBOARD_KEY)
+    assert await rebuild_leaderboard(db_session=test_db, batch_size=1) == 2
+
+    response = await client.get("/referrals/leaderboard")
+    assert [entry["referrals"] for entry in response.json()["top"]] == [2, 1]
+
+
+@pytest.mark.asyncio
+async def test_leaderboard_is_unavailable_on_redis_errors(
+    client: AsyncClient, redis, monkeypatch
+):
+    async def fail(*args, **kwargs):
+        raise RedisError("down")
+
+    monkeypatch.setattr(redis, "zrevrange", fail)
+
+    response = await client.get("/referrals/leaderboard")
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+
+
+@pytest.mark.asyncio
+async def test_referrals_during_a_rebuild_are_kept(
+    test_db: AsyncSession, redis, monkeypatch
+):
+    first, second = User(email="first@usertest.com"), User(email="second@usertest.com")
+    test_db.add_all([first, second])
+    await test_db.commit()
+    test_db.add_all(
+        [
+            User(email="user0@usertest.com", referer_id=first.id),
+            User(email="user1@usertest.com", referer_id=second.id),
+        ]
+    )
+    await test_db.commit()
+
+    execute = test_db.execute
+    referred = []
+
+    async def execute_and_refer(*args, **kwargs):
+        result = await execute(*args, **kwargs)
+        # A signup for a referer the rebuild has already read.
+        if not referred:
+            async with async_sessionmaker(test_db.bind)() as other_session:
+                other_session.add(User(email="late@usertest.com", referer_id=first.id))
+                await other_session.commit()
+            await record_referral(first.id)
+            referred.append(first.id)
+
+        return result
+
+    monkeypatch.setattr(test_db, "execute", execute_and_refer)
+    assert await rebuild_leaderboard(db_session=test_db, batch_size=1) == 2
+
+    assert await redis.zscore(LEADERBOARD_KEY, first.id) == 2
+    assert await redis.zscore(LEADERBOARD_KEY, second.id) == 1
+    assert await redis.keys(f"{LEADERBOARD_KEY}:*") == []
+
+
+@pytest.mark.asyncio
+async def test_signed_referral_codes(
+    client: AsyncClient, test_db: AsyncSession, monkeypatch
+):
+    monkeypatch.setattr(settings, "REFERRAL_CODE_FORMAT", "signed")
+    referer = User(email="referer@usertest.com")
+    test_db.add(referer)
+    await test_db.commit()
+
+    headers = {"Authorization": f"Bearer {create_access_token({'user_id': 1})}"}
+    response = await client.post("/referrals/code", headers=headers)
+    code = response.json()["referral_code"]
+    assert response.status_code == status.HTTP_201_CREATED
+    assert is_signed_referral_code(code)
+
+    forged = generate_signed_referral_code(
+        referer.id, datetime(2030, 1, 1, tzinfo=timezone.utc)
+    )
+    forged = forged[:-6] + ("AAAAAA" if forged[-6:] != "AAAAAA" else "BBBBBB")
+    expired = generate_signed_referral_code(
+        referer.id, datetime(2020, 1, 1, tzinfo=timezone.utc)
+    )
+    for bad_code in (forged, expired):
+        response = await client.post(
+            f"/auth/signup/referral/{bad_code}",
+            json={"email": "bad@usertest.com", "password": "test123"},
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    response = await client.post(
+        f"/auth/signup/referral/{code}",
+        json={"email": "child@usertest.com", "password": "test123"},
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+
+    response = await client.get(f"/referrals/{referer.id}/page")
+    assert [user["email"] for user in response.json()["items"]] == [
+        "child@usertest.com"
+    ]
+
+    # Deleting the code revokes it even though its signature is still valid.
+    await client.delete("/referrals/code", headers=headers)
+    response = await client.post(
+        f"/auth/signup/referral/{code}",
+        json={"email": "late@usertest.com", "password": "test123"},
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
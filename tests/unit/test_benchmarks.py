@@ -0,0 +1,75 @@
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks.report import Sample, compare, percentile, summarize
+from benchmarks.scenario import render
+
+
+@pytest.mark.unit
+def test_summarize_percentiles_and_errors():
+    samples = [Sample("a", 200, ms / 1000, True) for ms in range(1, 101)]
+    samples.append(Sample("a", None, 0.5, False))
+
+    summary = summarize(samples, duration=2.0)
+
+    assert percentile([1.0, 2.0, 3.0], 50) == 2.0
+    assert summary["requests"] == 101
+    assert summary["errors"] == 1
+    assert summary["rps"] == 50.5
+    assert summary["p50_ms"] == 51.0
+    assert summary["p99_ms"] == 100.0
+    assert summary["max_ms"] == 500.0
+    assert summary["statuses"] == {"200": 100, "error": 1}
+
+
+@pytest.mark.unit
+def test_compare_flags_regressions_beyond_tolerance():
+    def report(p95: float, rps: float, error_rate: float = 0.0) -> dict:
+        stats = {"p95_ms": p95, "p99_ms": p95, "rps": rps, "error_rate": error_rate}
+        return {"total": stats, "requests": {"signin": stats}}
+
+    baseline = report(p95=100, rps=50)
+
+    assert compare(baseline, report(p95=110, rps=45)) == []
+
+    regressions = compare(baseline, report(p95=130, rps=50, error_rate=0.05))
+    assert {(r.name, r.metric) for r in regressions} == {
+        (name, metric)
+        for name in ("total", "signin")
+        for metric in ("p95_ms", "p99_ms", "error_rate")
+    }
+    assert [r.metric for r in compare(baseline, report(p95=100, rps=30))] == [
+        "rps",
+        "rps",
+    ]
+
+
+@pytest.mark.unit
+def test_render_templates():
+    values = {"unique": "run-1", "user": SimpleNamespace(id=7, email="a@b.c")}
+    template = {"path": "/referrals/{user.id}", "json": ["{unique}", None, 1]}
+
+    assert render(template, values) == {
+        "path": "/referrals/7",
+        "json": ["run-1", None, 1],
+    }
+
+
+@pytest.mark.unit
+def test_graph_benchmark_reports_memory_and_latencies():
+    pytest.importorskip("numpy")
+    from benchmarks.graph import run_graph_benchmark
+
+    report = run_graph_benchmark(users=5000, referral_ratio=0.7, queries=20, seed=0)
+
+    assert report["users"] == 5000
+    assert report["bytes_per_user"] > 0
+    assert set(report["latency_us"]) == {
+        "depth",
+        "downline_size",
+        "level_counts",
+        "level_counts_top20",
+        "add_user",
+        "set_referer",
+    }
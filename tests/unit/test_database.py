@@ -0,0 +1,42 @@
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.auth.models import User
+from app.config import settings
+from app.database.core import get_connect_args, pool_stats, release_connection
+
+
+@pytest.mark.unit
+def test_connect_args_disable_statement_caching_for_pgbouncer(monkeypatch):
+    monkeypatch.setattr(settings, "DATABASE_STATEMENT_CACHE_SIZE", 500)
+    assert get_connect_args() == {
+        "statement_cache_size": 500,
+        "prepared_statement_cache_size": 500,
+    }
+
+    monkeypatch.setattr(settings, "DATABASE_PGBOUNCER", True)
+    connect_args = get_connect_args()
+
+    assert connect_args["statement_cache_size"] == 0
+    assert connect_args["prepared_statement_cache_size"] == 0
+    name_func = connect_args["prepared_statement_name_func"]
+    assert name_func() != name_func()
+
+
+@pytest.mark.unit
+def test_pool_stats():
+    stats = pool_stats()
+
+    assert stats["size"] == settings.DATABASE_POOL_SIZE
+    assert stats["checked_out"] == 0
+    assert stats["timeouts"] == 0
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_release_connection_refuses_pending_changes():
+    db_session = AsyncSession()
+    db_session.add(User(email="pending@usertest.com"))
+
+    with pytest.raises(RuntimeError):
+        await release_connection(db_session)
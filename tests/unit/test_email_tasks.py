@@ -0,0 +1,116 @@
+import socket
+import socketserver
+import threading
+
+import fakeredis
+import pytest
+
+from app.auth import tasks
+from app.auth.tasks import get_smtp_connection, send_email, send_emails_bulk
+from app.config import settings
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough of SMTP for smtplib to deliver messages."""
+
+    def reply(self, line: str) -> None:
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self) -> None:
+        self.server.connections += 1  # type: ignore[attr-defined]
+        self.reply("220 localhost ready")
+
+        while line := self.rfile.readline():
+            command = line.decode().strip().upper()
+            if command.startswith(("EHLO", "HELO")):
+                self.reply("250 localhost")
+            elif command == "DATA":
+                self.reply("354 end data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                self.server.messages += 1  # type: ignore[attr-defined]
+                self.reply("250 OK")
+            elif command == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+@pytest.fixture
+def smtp_server(monkeypatch):
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), SMTPHandler)
+    server.daemon_threads = True
+    server.connections = 0  # type: ignore[attr-defined]
+    server.messages = 0  # type: ignore[attr-defined]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    monkeypatch.setattr(settings, "SMTP_HOST", "127.0.0.1")
+    monkeypatch.setattr(settings, "SMTP_PORT", server.server_address[1])
+    monkeypatch.setattr(settings, "SMTP_TLS", False)
+    monkeypatch.setattr(settings, "SMTP_SSL", False)
+    monkeypatch.setattr(settings, "SMTP_PASSWORD", "")
+
+    yield server
+
+    get_smtp_connection().close()
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.unit
+def test_send_email_reuses_connection(smtp_server):
+    send_email("first@example.com", "Subject", "Body")
+    send_email("second@example.com", "Subject", "Body")
+
+    assert smtp_server.messages == 2
+    assert smtp_server.connections == 1
+
+
+@pytest.mark.unit
+def test_send_emails_bulk_reconnects_after_disconnect(smtp_server):
+    messages = [
+        {"to_email": f"user{i}@example.com", "subject": "Subject", "body": "Body"}
+        for i in range(3)
+    ]
+
+    assert send_emails_bulk(messages) == {"sent": 3, "failed": 0}
+
+    # Simulate the server dropping an idle session.
+    get_smtp_connection()._smtp.sock.shutdown(socket.SHUT_RDWR)  # type: ignore
+
+    assert send_emails_bulk(messages) == {"sent": 3, "failed": 0}
+    assert smtp_server.messages == 6
+    assert smtp_server.connections == 2
+
+
+@pytest.mark.unit
+def test_send_emails_bulk_skips_delivered_outbox_emails(smtp_server, monkeypatch):
+    monkeypatch.setattr(tasks, "_dedup_redis", fakeredis.FakeRedis())
+    messages = [
+        {"id": i, "to_email": f"user{i}@example.com", "subject": "S", "body": "B"}
+        for i in range(2)
+    ]
+
+    assert send_emails_bulk(messages) == {"sent": 2, "failed": 0}
+    # Published again, e.g. after the relay failed to mark them as sent.
+    assert send_emails_bulk(messages) == {"sent": 0, "failed": 0}
+    assert smtp_server.messages == 2
+
+
+@pytest.mark.unit
+def test_outbox_emails_are_not_lost_when_a_worker_dies(smtp_server, monkeypatch):
+    monkeypatch.setattr(tasks, "_dedup_redis", fakeredis.FakeRedis())
+    messages = [{"id": 1, "to_email": "user@example.com", "subject": "S", "body": "B"}]
+
+    def die(self, message) -> None:
+        raise SystemExit()
+
+    with monkeypatch.context() as patch:
+        patch.setattr(tasks.SMTPConnection, "send", die)
+        with pytest.raises(SystemExit):
+            send_emails_bulk(messages)
+
+    # Redelivered by the broker to another worker.
+    assert send_emails_bulk(messages) == {"sent": 1, "failed": 0}
+    assert smtp_server.messages == 1
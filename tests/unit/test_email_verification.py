@@ -0,0 +1,63 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.auth import utils
+from app.auth.utils import (
+    email_verification_cache,
+    get_email_verification_stats,
+    verify_email_with_hunter,
+)
+from app.http_clients import HUNTER, override_transport
+
+
+@pytest.fixture
+def hunter_calls():
+    calls: list[str] = []
+    email_verification_cache.clear()
+    yield calls
+    email_verification_cache.clear()
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_concurrent_verifications_share_one_request(redis, hunter_calls):
+    async def handler(request: httpx.Request) -> httpx.Response:
+        hunter_calls.append(request.url.params["email"])
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json={"data": {"result": "deliverable"}})
+
+    await override_transport(HUNTER, httpx.MockTransport(handler))
+
+    results = await asyncio.gather(
+        *(verify_email_with_hunter("Same@Example.com") for _ in range(5))
+    )
+
+    assert results == [True] * 5
+    assert hunter_calls == ["same@example.com"]
+    assert await redis.get("hunter:email:same@example.com") == b"1"
+
+    assert await verify_email_with_hunter("same@example.com") is True
+    assert hunter_calls == ["same@example.com"]
+    assert get_email_verification_stats()["shared_requests"] >= 4
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_negative_result_is_cached_in_redis(redis, hunter_calls):
+    def handler(request: httpx.Request) -> httpx.Response:
+        hunter_calls.append(request.url.params["email"])
+        return httpx.Response(200, json={"data": {"result": "undeliverable"}})
+
+    await override_transport(HUNTER, httpx.MockTransport(handler))
+
+    assert await verify_email_with_hunter("bad@example.com") is False
+
+    email_verification_cache.clear()
+    redis_hits = utils.redis_cache_stats.hits
+
+    assert await verify_email_with_hunter("bad@example.com") is False
+    assert hunter_calls == ["bad@example.com"]
+    assert utils.redis_cache_stats.hits == redis_hits + 1
+    assert 0 < await redis.ttl("hunter:email:bad@example.com") <= 3600
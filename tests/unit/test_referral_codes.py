@@ -0,0 +1,37 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from app.referral.utils import (
+    SIGNED_CODE_LENGTH,
+    decode_signed_referral_code,
+    generate_random_referral_code,
+    generate_signed_referral_code,
+    is_signed_referral_code,
+)
+
+
+@pytest.mark.unit
+def test_signed_referral_code_round_trip():
+    expires_at = datetime(2030, 1, 1, 12, 30, 15, tzinfo=timezone.utc)
+
+    code = generate_signed_referral_code(123456, expires_at)
+
+    assert len(code) == SIGNED_CODE_LENGTH
+    assert is_signed_referral_code(code)
+    assert not is_signed_referral_code(generate_random_referral_code(8))
+    assert decode_signed_referral_code(code) == (123456, expires_at)
+
+
+@pytest.mark.unit
+def test_signed_referral_code_rejects_tampering():
+    code = generate_signed_referral_code(1, datetime(2030, 1, 1, tzinfo=timezone.utc))
+    other = generate_signed_referral_code(2, datetime(2030, 1, 1, tzinfo=timezone.utc))
+
+    # Someone else's payload with this code's signature.
+    assert decode_signed_referral_code(other[:12] + code[12:]) is None
+    # The last character only has two significant bits.
+    for char in "ABCDEFGHIJKLMNOP":
+        if char != code[-1]:
+            assert decode_signed_referral_code(code[:-1] + char) is None
+    assert decode_signed_referral_code("!" * SIGNED_CODE_LENGTH) is None
@@ -0,0 +1,106 @@
+import random
+
+import pytest
+
+from app.referral import graph as graph_module
+
+np = pytest.importorskip("numpy")
+
+ReferralGraph = graph_module.ReferralGraph
+
+
+def random_forest(users: int, seed: int = 0) -> dict[int, int | None]:
+    """Users with ids 1..users (some missing), each referred by an earlier one."""
+    rng = random.Random(seed)
+    ids = [i for i in range(1, users + 1) if rng.random() > 0.1]
+    forest: dict[int, int | None] = {}
+    for user_id in ids:
+        earlier = list(forest)
+        forest[user_id] = (
+            rng.choice(earlier) if earlier and rng.random() < 0.8 else None
+        )
+
+    return forest
+
+
+def expected_stats(forest: dict[int, int | None], user_id: int):
+    """Depth and per-level downline counts, the slow way."""
+    depth, referer = 0, forest[user_id]
+    while referer is not None:
+        depth, referer = depth + 1, forest[referer]
+
+    levels = []
+    frontier = [user_id]
+    while frontier := [u for u, r in forest.items() if r in frontier]:
+        levels.append(len(frontier))
+
+    return depth, levels
+
+
+def build(forest: dict[int, int | None]) -> ReferralGraph:
+    ids = np.array(list(forest), np.int32)
+    referers = np.array([r if r is not None else -1 for r in forest.values()])
+    return ReferralGraph.from_edges(ids, referers)
+
+
+def assert_matches(graph: ReferralGraph, forest: dict[int, int | None]) -> None:
+    assert graph.users == len(forest)
+    for user_id in forest:
+        depth, levels = expected_stats(forest, user_id)
+        assert graph.depth_of(user_id) == depth
+        assert graph.level_counts(user_id) == levels
+        assert graph.downline_size(user_id) == sum(levels)
+
+
+@pytest.mark.unit
+def test_graph_answers_match_the_forest():
+    forest = random_forest(300)
+    graph = build(forest)
+
+    assert_matches(graph, forest)
+    assert 0 not in graph and 10_000 not in graph
+
+    user_id = next(u for u in forest if graph.downline_size(u) > 3)
+    assert (
+        graph.level_counts(user_id, max_depth=1)
+        == expected_stats(forest, user_id)[1][:1]
+    )
+
+    aggregates = graph.aggregates()
+    assert aggregates["id"].tolist() == sorted(forest)
+    assert aggregates["downline"].sum() == sum(graph.depth[list(forest)])
+
+
+@pytest.mark.unit
+def test_graph_is_updated_incrementally(monkeypatch):
+    monkeypatch.setattr(graph_module, "COMPACT_MIN_EDGES", 20)
+    forest = random_forest(300, seed=1)
+    later = list(forest)[150:]
+
+    # Start with the first half, then replay the signups and the referral
+    # codes applied later by users that signed up without one.
+    graph = build({u: forest[u] for u in list(forest)[:150]})
+    for user_id in later:
+        graph.add_user(user_id, None if user_id % 2 else forest[user_id])
+    for user_id in later:
+        if user_id % 2 and forest[user_id] is not None:
+            graph.set_referer(user_id, forest[user_id])
+
+    assert graph._extra_edges <= 20
+    assert_matches(graph, forest)
+
+    # Replayed changes are ignored.
+    graph.add_user(later[-1], forest[later[-1]])
+    assert_matches(graph, forest)
+
+
+@pytest.mark.unit
+def test_graph_rejects_invalid_referers():
+    graph = build({1: None, 2: 1, 3: 2, 4: None})
+
+    with pytest.raises(ValueError):
+        graph.set_referer(1, 3)
+    with pytest.raises(ValueError):
+        graph.set_referer(2, 4)
+    with pytest.raises(ValueError):
+        graph.set_referer(4, 99)
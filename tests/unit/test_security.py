@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+from app.exceptions import PasswordHasherBusyException
+from app.security import PasswordHasher
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_password_hasher_hash_and_verify():
+    hasher = PasswordHasher(pool="thread", max_workers=2, max_queue=2)
+
+    hashed_password = await hasher.hash("test123")
+
+    assert await hasher.verify("test123", hashed_password)
+    assert not await hasher.verify("wrong", hashed_password)
+    assert hasher.get_stats()["completed"] == 3
+
+    hasher.shutdown()
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_password_hasher_rejects_when_queue_is_full():
+    hasher = PasswordHasher(pool="thread", max_workers=1, max_queue=1)
+
+    results = await asyncio.gather(
+        *(hasher.hash("test123") for _ in range(3)), return_exceptions=True
+    )
+
+    rejected = [r for r in results if isinstance(r, PasswordHasherBusyException)]
+    assert len(rejected) == 1
+    assert rejected[0].headers == {"Retry-After": "1"}
+    assert hasher.get_stats()["rejected"] == 1
+    assert hasher.get_stats()["completed"] == 2
+
+    hasher.shutdown()
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_password_hasher_counts_failures_apart():
+    hasher = PasswordHasher(pool="thread", max_workers=1, max_queue=1)
+
+    with pytest.raises(ValueError):
+        await hasher.verify("test123", "not-a-bcrypt-hash")
+
+    stats = hasher.get_stats()
+    assert stats["failed"] == 1
+    assert stats["completed"] == 0
+    assert stats["total_seconds"] == 0
+    assert stats["pending"] == 0
+
+    hasher.shutdown()